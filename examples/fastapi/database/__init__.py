@@ -1,39 +1,94 @@
-from typing import Iterator
+import os
+from functools import lru_cache
+from typing import Iterator, Optional, Union
 
 from fastapi import Header
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, create_engine
 from sqlalchemy.engine import Engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Session, registry, sessionmaker
 
 from examples.fastapi.database.models import Base as ProductionBase
 from examples.fastapi.settings import Environment
 from resql import change_log, query_log
 from resql.auditing import log_changes, log_queries
+from resql.daemon import AuditWriterClient, AuditWriterDaemon
+from resql.worker import BackgroundWorker
+from resql.writers import LogWriter
 
 AUDIT_ENGINE: Engine
 PRODUCTION_ENGINE: Engine
 RECOVERY_ENGINE: Engine
 SESSION_MAKER: sessionmaker  # type: ignore[type-arg]
 
+AUDIT_MODE = "sync"
+AUDIT_TARGET: Union[Engine, LogWriter]
+AUDIT_WORKER: Optional[BackgroundWorker] = None
+DAEMONS: list[tuple[AuditWriterDaemon, AuditWriterClient]] = []
+
+
+# classes can only be mapped once, even if `init_from_env` is called again, e.g. by the load test
+@lru_cache
+def get_audit_registry() -> registry:
+    return change_log.map_default()
+
+
+@lru_cache
+def get_recovery_registry() -> registry:
+    return query_log.map_default()
+
 
 def init_from_env(env: Environment) -> None:
     global AUDIT_ENGINE, PRODUCTION_ENGINE, RECOVERY_ENGINE, SESSION_MAKER  # pylint: disable=global-statement
+    global AUDIT_MODE, AUDIT_TARGET, AUDIT_WORKER  # pylint: disable=global-statement
 
-    AUDIT_ENGINE = create_engine(env.audit_url, echo=True, future=True, logging_name="AUDITING")
-    audit_registry = change_log.map_default()
+    AUDIT_ENGINE = create_engine(env.audit_url, echo=env.echo, future=True, logging_name="AUDITING")
+    audit_registry = get_audit_registry()
     audit_registry.metadata.create_all(AUDIT_ENGINE)
 
-    RECOVERY_ENGINE = create_engine(env.recovery_url, echo=True, future=True, logging_name="RECOVERY")
-    recovery_registry = query_log.map_default()
+    RECOVERY_ENGINE = create_engine(env.recovery_url, echo=env.echo, future=True, logging_name="RECOVERY")
+    recovery_registry = get_recovery_registry()
     recovery_registry.metadata.create_all(RECOVERY_ENGINE)
 
-    PRODUCTION_ENGINE = create_engine(env.production_url, echo=True, future=True, logging_name="PRODUCTN")
+    PRODUCTION_ENGINE = create_engine(env.production_url, echo=env.echo, future=True, logging_name="PRODUCTN")
     ProductionBase.metadata.create_all(PRODUCTION_ENGINE)
     SESSION_MAKER = sessionmaker(PRODUCTION_ENGINE, future=True)
-    log_queries(of=PRODUCTION_ENGINE, to=RECOVERY_ENGINE)
+
+    AUDIT_MODE = env.audit_mode
+    AUDIT_TARGET = AUDIT_ENGINE
+    recovery_target: Union[Engine, LogWriter] = RECOVERY_ENGINE
+    AUDIT_WORKER = BackgroundWorker() if AUDIT_MODE == "worker" else None
+    if AUDIT_MODE == "daemon":
+        AUDIT_TARGET = _start_daemon(AUDIT_ENGINE, audit_registry.metadata)
+        recovery_target = _start_daemon(RECOVERY_ENGINE, recovery_registry.metadata)
+    if AUDIT_MODE != "off":
+        log_queries(of=PRODUCTION_ENGINE, to=recovery_target)
+
+
+def _start_daemon(engine: Engine, metadata: MetaData) -> AuditWriterClient:
+    # in a real deployment, the daemon would run in a process of its own, behind a Unix socket or a shared authkey
+    authkey = os.urandom(32)
+    daemon = AuditWriterDaemon(engine, metadata, address=("localhost", 0), authkey=authkey)
+    daemon.start()
+    client = AuditWriterClient(daemon.address, authkey=authkey)
+    DAEMONS.append((daemon, client))
+    return client
+
+
+def close() -> None:
+    """Waits for pending logs to be written and stops the threads started by `init_from_env`."""
+    if AUDIT_WORKER is not None:
+        AUDIT_WORKER.close()
+    for daemon, client in DAEMONS:
+        client.flush()
+        client.close()
+        daemon.close()
+    DAEMONS.clear()
+    for engine in (AUDIT_ENGINE, PRODUCTION_ENGINE, RECOVERY_ENGINE):
+        engine.dispose()
 
 
 def begin_session(user_agent: str = Header(...)) -> Iterator[Session]:
     with SESSION_MAKER.begin() as session:
-        log_changes(of=session, to=AUDIT_ENGINE, extra=dict(user_agent=user_agent))
+        if AUDIT_MODE != "off":
+            log_changes(of=session, to=AUDIT_TARGET, extra=dict(user_agent=user_agent), worker=AUDIT_WORKER)
         yield session
@@ -0,0 +1,188 @@
+"""
+Drives concurrent insert/update/get traffic on `/countries` of the example app, in-process,
+once per audit mode, and reports throughput and latency percentiles of each.
+
+    python -m examples.fastapi.loadtest --requests 2000 --concurrency 8 --mix insert=1,update=3,get=6
+
+Databases are fresh SQLite files in a temporary directory, unless URLs are given (e.g. of PostgreSQL).
+"""
+import argparse
+import itertools
+import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from fastapi.testclient import TestClient
+
+from examples.fastapi import database
+from examples.fastapi.main import app
+from examples.fastapi.settings import AUDIT_MODES, Environment
+
+OPERATIONS = ("insert", "update", "get")
+
+
+@dataclass
+class Result:
+    mode: str
+    elapsed: float = 0.0
+    # how long it took, after the last response, for every log to be written
+    drain: float = 0.0
+    # status codes of failed requests, appended to from many threads
+    failures: list[int] = field(default_factory=list)
+    latencies: dict[str, list[float]] = field(default_factory=lambda: {operation: [] for operation in OPERATIONS})
+
+    @property
+    def errors(self) -> int:
+        return len(self.failures)
+
+    @property
+    def requests(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, fraction: float, operation: Optional[str] = None) -> float:
+        latencies = sorted(
+            self.latencies[operation] if operation else itertools.chain.from_iterable(self.latencies.values())
+        )
+        if not latencies:
+            return 0.0
+        return latencies[min(int(fraction * len(latencies)), len(latencies) - 1)]
+
+
+class Traffic:
+    """Issues requests of a random operation, picked according to `mix`, against countries of its own."""
+
+    def __init__(self, mode: str, mix: dict[str, int], seed_rows: int) -> None:
+        self.prefix = f"{mode}-{secrets.token_hex(4)}"
+        self.operations = random.choices(list(mix), weights=list(mix.values()), k=100_000)
+        self.seeded = [f"{self.prefix}-seed-{row}" for row in range(seed_rows)]
+        self._counter = itertools.count()
+        self._local = threading.local()
+
+    @property
+    def client(self) -> TestClient:
+        # each thread gets its own client, and the app's startup isn't run again since it's not a context manager
+        if not hasattr(self._local, "client"):
+            self._local.client = TestClient(app)
+        return self._local.client  # type: ignore[no-any-return]
+
+    def seed(self) -> None:
+        for name in self.seeded:
+            self.client.post("/countries", json={"name": name, "population": 0}).raise_for_status()
+
+    def request(self, request_no: int, result: Result) -> None:
+        operation = self.operations[request_no % len(self.operations)]
+        name = random.choice(self.seeded)
+        started_at = time.perf_counter()
+        if operation == "insert":
+            response = self.client.post("/countries", json={"name": f"{self.prefix}-{next(self._counter)}"})
+        elif operation == "update":
+            response = self.client.patch(f"/countries/{name}", json={"population": request_no})
+        else:
+            response = self.client.get(f"/countries/{name}")
+        result.latencies[operation].append(time.perf_counter() - started_at)
+        if response.status_code != 200:
+            result.failures.append(response.status_code)
+
+
+def run(mode: str, env: Environment, args: argparse.Namespace) -> Result:
+    database.init_from_env(env)
+    result = Result(mode)
+    traffic = Traffic(mode, args.mix, args.seed_rows)
+    traffic.seed()
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for future in [executor.submit(traffic.request, request_no, result) for request_no in range(args.requests)]:
+            future.result()
+    result.elapsed = time.perf_counter() - started_at
+    database.close()
+    result.drain = time.perf_counter() - started_at - result.elapsed
+    return result
+
+
+def _milliseconds(result: Result, fraction: float, operation: Optional[str] = None) -> str:
+    return f"{1000 * result.percentile(fraction, operation):.1f}"
+
+
+def report(results: list[Result]) -> None:
+    print(
+        f"{'mode':<8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'drain s':>9}"
+        "  per operation p50/p99 ms"
+    )
+    for result in results:
+        per_operation = "  ".join(
+            f"{operation} {_milliseconds(result, 0.5, operation)}/{_milliseconds(result, 0.99, operation)}"
+            for operation in OPERATIONS
+            if result.latencies[operation]
+        )
+        print(
+            f"{result.mode:<8}{result.requests:>10}{result.errors:>8}{result.throughput:>10.1f}"
+            f"{_milliseconds(result, 0.5):>9}{_milliseconds(result, 0.99):>9}{result.drain:>9.2f}"
+            f"  {per_operation}"
+        )
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        operation, _, weight = item.partition("=")
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation {operation!r}")
+        mix[operation] = int(weight or 1)
+    return mix
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--mix", type=parse_mix, default="insert=1,update=3,get=6", help="relative operation weights")
+    parser.add_argument("--seed-rows", type=int, default=100, help="countries inserted before measuring")
+    parser.add_argument("--modes", default=",".join(AUDIT_MODES), help="audit modes to compare")
+    parser.add_argument("--audit-url", help="defaults to a temporary SQLite database")
+    parser.add_argument("--production-url", help="defaults to a temporary SQLite database")
+    parser.add_argument("--recovery-url", help="defaults to a temporary SQLite database")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        help="exit with an error if any mode's throughput is below that of 'off' divided by this factor",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = parse_args(argv)
+    results = []
+    for mode in args.modes.split(","):
+        with tempfile.TemporaryDirectory() as directory:
+            env = Environment(
+                audit_mode=mode,
+                audit_url=args.audit_url or f"sqlite+pysqlite:///{directory}/audit.sqlite3",
+                echo=False,
+                production_url=args.production_url or f"sqlite+pysqlite:///{directory}/production.sqlite3",
+                recovery_url=args.recovery_url or f"sqlite+pysqlite:///{directory}/recovery.sqlite3",
+            )
+            results.append(run(mode, env, args))
+    report(results)
+    if any(result.errors for result in results):
+        return 1
+    baseline = next((result for result in results if result.mode == "off"), None)
+    if args.max_slowdown is not None and baseline is not None:
+        slow = [result.mode for result in results if result.throughput * args.max_slowdown < baseline.throughput]
+        if slow:
+            print(f"Slower than 'off' by more than {args.max_slowdown}x: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,7 @@
 from fastapi import FastAPI
 from sqlalchemy.exc import NoResultFound
 
-from examples.fastapi import error_handlers
-from examples.fastapi.database import init_from_env
+from examples.fastapi import database, error_handlers
 from examples.fastapi.endpoints import countries
 from examples.fastapi.settings import get_environment
 
@@ -15,4 +14,9 @@ app.add_exception_handler(NoResultFound, error_handlers.sqlalchemy_not_found_exc
 
 @app.on_event("startup")
 def startup() -> None:
-    init_from_env(get_environment())
+    database.init_from_env(get_environment())
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    database.close()
@@ -1,16 +1,29 @@
 from functools import lru_cache
 
-from pydantic import BaseSettings
+from pydantic import BaseSettings, validator
+
+# "worker" defers change logs to a background thread, "daemon" sends every log to an in-process `AuditWriterDaemon`
+AUDIT_MODES = ("off", "sync", "worker", "daemon")
 
 
 class Environment(BaseSettings):
+    # one of `AUDIT_MODES`. Not a `Literal`, which pydantic 1.8.2 can't handle on Python 3.9.8 and later
+    audit_mode: str = "sync"
     audit_url: str = "sqlite+pysqlite:///audit-fastapi.sqlite3"
+    echo: bool = True
     production_url: str = "sqlite+pysqlite:///production-fastapi.sqlite3"
     recovery_url: str = "sqlite+pysqlite:///recovery-fastapi.sqlite3"
 
     class Config:
         env_file = ".env"
 
+    @validator("audit_mode")
+    @classmethod
+    def check_audit_mode(cls, value: str) -> str:
+        if value not in AUDIT_MODES:
+            raise ValueError(f"must be one of {', '.join(AUDIT_MODES)}")
+        return value
+
 
 @lru_cache
 def get_environment() -> Environment:
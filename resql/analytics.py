@@ -0,0 +1,239 @@
+"""
+Loads ranges of the change and query logs into NumPy arrays and aggregates them without Python loops over rows.
+Requires the `analytics` extra (NumPy).
+"""
+import datetime as dt
+from dataclasses import dataclass
+from typing import Any, Collection, Iterable, Optional, Sequence, Union
+
+try:
+    import numpy as np
+    import numpy.typing as npt
+except ImportError as ex:  # pragma: no cover
+    raise ImportError("resql.analytics requires NumPy, installed with the `analytics` extra") from ex
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from resql.change_log import ChangeLog, OpType
+from resql.query_log import QueryLog
+
+# how many rows are fetched and converted at a time
+CHUNK_SIZE = 100_000
+TIME_UNIT = "datetime64[us]"
+
+Bind = Union[Session, Connection]
+
+
+@dataclass
+class ChangeLogArrays:
+    """Columns of change logs ordered by id, with `table` and `type` as indexes into `tables` and `types`."""
+
+    id: npt.NDArray[np.int64]
+    executed_at: npt.NDArray[np.datetime64]
+    record_id: npt.NDArray[np.int64]
+    table: npt.NDArray[np.int32]
+    type: npt.NDArray[np.int8]
+    tables: list[str]
+    types: list[OpType]
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+
+@dataclass
+class QueryLogArrays:
+    """Columns of query logs ordered by id, with `type` as indexes into `types` and missing numbers as `NaN`."""
+
+    id: npt.NDArray[np.int64]
+    executed_at: npt.NDArray[np.datetime64]
+    duration: npt.NDArray[np.float64]
+    row_count: npt.NDArray[np.float64]
+    type: npt.NDArray[np.int32]
+    types: list[str]
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+
+def _to_datetime64(values: Sequence[dt.datetime]) -> npt.NDArray[np.datetime64]:
+    """UTC datetimes (naive, as NumPy has no time zones) of the timezone-aware `values`."""
+    seconds = np.fromiter((value.timestamp() for value in values), np.float64, count=len(values))
+    micros: npt.NDArray[np.int64] = (seconds * 1_000_000).round().astype(np.int64)
+    return micros.astype(TIME_UNIT)
+
+
+def _to_codes(values: Sequence[Any], categories: dict[Any, int], dtype: Any) -> npt.NDArray[Any]:
+    """The index of each of `values` in `categories`, where new values are added."""
+    return np.fromiter((categories.setdefault(value, len(categories)) for value in values), dtype, count=len(values))
+
+
+def _to_floats(values: Sequence[Optional[float]]) -> npt.NDArray[np.float64]:
+    return np.fromiter((np.nan if value is None else value for value in values), np.float64, count=len(values))
+
+
+def _filter_time(query: Select, column: Any, since: Optional[dt.datetime], until: Optional[dt.datetime]) -> Select:
+    if since is not None:
+        query = query.where(column >= since)
+    if until is not None:
+        query = query.where(column < until)
+    return query
+
+
+def _concatenate(chunks: list[tuple[npt.NDArray[Any], ...]], *dtypes: Any) -> list[npt.NDArray[Any]]:
+    """The columns of every chunk joined together, or empty ones of `dtypes` if there are no chunks."""
+    if not chunks:
+        return [np.empty(0, dtype) for dtype in dtypes]
+    return [np.concatenate(column) for column in zip(*chunks)]
+
+
+def _load_columns(bind: Bind, query: Select, chunk_size: int) -> Iterable[tuple[Sequence[Any], ...]]:
+    """The columns of each chunk of rows of `query`, streamed from the database."""
+    result = bind.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+    for rows in result.partitions(chunk_size):
+        yield tuple(zip(*rows))
+
+
+def load_change_logs(  # pylint: disable=too-many-arguments,too-many-locals
+    bind: Bind,
+    *,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    table_names: Optional[Collection[str]] = None,
+    op_types: Optional[Collection[OpType]] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> ChangeLogArrays:
+    """
+    The change logs executed from `since` (inclusive) until `until` (exclusive), of `table_names` and `op_types`,
+    fetched `chunk_size` rows at a time. Diffs and `extra` aren't loaded.
+    """
+    log_id = getattr(ChangeLog, "id")
+    query = select(log_id, ChangeLog.executed_at, ChangeLog.record_id, ChangeLog.table_name, ChangeLog.type)
+    query = _filter_time(query, ChangeLog.executed_at, since, until).order_by(log_id)
+    if table_names is not None:
+        query = query.where(ChangeLog.table_name.in_(table_names))  # type: ignore[attr-defined]
+    if op_types is not None:
+        query = query.where(ChangeLog.type.in_(op_types))  # type: ignore[attr-defined]
+    tables: dict[str, int] = {}
+    types: dict[OpType, int] = {}
+    chunks: list[tuple[npt.NDArray[Any], ...]] = [
+        (
+            np.array(ids, np.int64),
+            _to_datetime64(executed_at),
+            np.array(record_ids, np.int64),
+            _to_codes(table_column, tables, np.int32),
+            _to_codes(type_column, types, np.int8),
+        )
+        for ids, executed_at, record_ids, table_column, type_column in _load_columns(bind, query, chunk_size)
+    ]
+    id_, executed_at, record_id, table, type_ = _concatenate(chunks, np.int64, TIME_UNIT, np.int64, np.int32, np.int8)
+    return ChangeLogArrays(id_, executed_at, record_id, table, type_, tables=list(tables), types=list(types))
+
+
+def load_query_logs(
+    bind: Bind,
+    *,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    types: Optional[Collection[str]] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> QueryLogArrays:
+    """
+    The query logs executed from `since` (inclusive) until `until` (exclusive), of statement `types`,
+    fetched `chunk_size` rows at a time. Statements and parameters aren't loaded.
+    """
+    log_id = getattr(QueryLog, "id")
+    query = select(log_id, QueryLog.executed_at, QueryLog.duration, QueryLog.row_count, QueryLog.type)
+    query = _filter_time(query, QueryLog.executed_at, since, until).order_by(log_id)
+    if types is not None:
+        query = query.where(QueryLog.type.in_(types))  # type: ignore[attr-defined]
+    categories: dict[str, int] = {}
+    chunks: list[tuple[npt.NDArray[Any], ...]] = [
+        (
+            np.array(ids, np.int64),
+            _to_datetime64(executed_at),
+            _to_floats(durations),
+            _to_floats(row_counts),
+            _to_codes(type_column, categories, np.int32),
+        )
+        for ids, executed_at, durations, row_counts, type_column in _load_columns(bind, query, chunk_size)
+    ]
+    id_, executed_at, duration, row_count, type_ = _concatenate(
+        chunks, np.int64, TIME_UNIT, np.float64, np.float64, np.int32
+    )
+    return QueryLogArrays(id_, executed_at, duration, row_count, type_, types=list(categories))
+
+
+def bucket_counts(
+    executed_at: npt.NDArray[np.datetime64], interval: dt.timedelta
+) -> tuple[npt.NDArray[np.datetime64], npt.NDArray[np.int64]]:
+    """
+    The start of every bucket of `interval` (counting from the Unix epoch) between the first and last of `executed_at`,
+    including empty ones, and how many of `executed_at` fall in each.
+    """
+    if executed_at.size == 0:
+        return np.empty(0, TIME_UNIT), np.empty(0, np.int64)
+    width = np.timedelta64(interval, "us").astype(np.int64)
+    buckets = executed_at.astype(TIME_UNIT).astype(np.int64) // width
+    first = buckets.min()
+    counts = np.bincount(buckets - first).astype(np.int64)
+    starts = ((first + np.arange(len(counts))) * width).astype(TIME_UNIT)
+    return starts, counts
+
+
+def find_bursts(
+    executed_at: npt.NDArray[np.datetime64], interval: dt.timedelta, threshold: float = 3.0
+) -> tuple[npt.NDArray[np.datetime64], npt.NDArray[np.int64]]:
+    """The buckets (see `bucket_counts`) with more than `threshold` standard deviations above the mean count."""
+    starts, counts = bucket_counts(executed_at, interval)
+    if counts.size == 0:
+        return starts, counts
+    bursting = counts > counts.mean() + threshold * counts.std()
+    return starts[bursting], counts[bursting]
+
+
+def _record_order(logs: ChangeLogArrays) -> npt.NDArray[np.intp]:
+    """Indexes that sort `logs` by table, record and then time."""
+    keys: list[npt.NDArray[Any]] = [logs.executed_at, logs.record_id, logs.table]
+    order: npt.NDArray[np.intp] = np.lexsort(keys)
+    return order
+
+
+def changes_per_record(
+    logs: ChangeLogArrays,
+) -> tuple[npt.NDArray[np.int32], npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """The `(table, record_id, changes)` columns of each changed record, most changed first."""
+    if len(logs) == 0:
+        return np.empty(0, np.int32), np.empty(0, np.int64), np.empty(0, np.int64)
+    order = _record_order(logs)
+    tables, record_ids = logs.table[order], logs.record_id[order]
+    starts = np.flatnonzero(np.r_[True, (tables[1:] != tables[:-1]) | (record_ids[1:] != record_ids[:-1])])
+    changes = np.diff(np.r_[starts, len(order)]).astype(np.int64)
+    most_changed = np.argsort(-changes, kind="stable")
+    return tables[starts][most_changed], record_ids[starts][most_changed], changes[most_changed]
+
+
+def inter_change_intervals(logs: ChangeLogArrays) -> npt.NDArray[np.timedelta64]:
+    """The time between each change and the previous one to the same record."""
+    if len(logs) < 2:
+        return np.empty(0, "timedelta64[us]")
+    order = _record_order(logs)
+    tables, record_ids, executed_at = logs.table[order], logs.record_id[order], logs.executed_at[order]
+    same_record: npt.NDArray[np.bool_] = (tables[1:] == tables[:-1]) & (record_ids[1:] == record_ids[:-1])
+    intervals: npt.NDArray[np.timedelta64] = np.diff(executed_at)
+    return intervals[same_record]
+
+
+def duration_percentiles(
+    queries: QueryLogArrays, percentiles: Sequence[float] = (50, 90, 99)
+) -> dict[str, npt.NDArray[np.float64]]:
+    """The `percentiles` of the durations of each statement type, of the queries that were timed."""
+    timed = ~np.isnan(queries.duration)
+    result = {}
+    for code, statement_type in enumerate(queries.types):
+        durations = queries.duration[timed & (queries.type == code)]
+        if len(durations):
+            result[statement_type] = np.percentile(durations, percentiles)
+    return result
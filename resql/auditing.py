@@ -1,31 +1,251 @@
-from dataclasses import dataclass
-from typing import Any, Iterator, Optional, TypedDict, Union
+import copy
+import datetime as dt
+import enum
+import functools
+import itertools
+import logging
+import time
+import types
+import uuid
+import weakref
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Collection, Iterable, Iterator, Optional, Sequence, Tuple, TypedDict, Union, cast
 
-from sqlalchemy import event, inspect
-from sqlalchemy.engine import Connection, CursorResult, Engine
-from sqlalchemy.orm import ColumnProperty, InstanceState, Session, UOWTransaction, attributes, sessionmaker
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.engine import Connection, CursorResult, Engine, ExecutionContext
+from sqlalchemy.orm import ColumnProperty, InstanceState, Mapper, Session, UOWTransaction, attributes, sessionmaker
+from sqlalchemy.orm.base import NO_VALUE
 from sqlalchemy.orm.exc import UnmappedColumnError
 from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import ReleaseSavepointClause, RollbackToSavepointClause, SavepointClause
 
+from resql import bulk, change_log_column, change_rollup
+from resql.bulk import BulkOperation
+from resql.change_blob import BlobStore
 from resql.change_log import ChangeLog, OpType
+from resql.deltas import encode_diff
+from resql.encoding import Converter, convert_parameters, get_column_converters, get_parameter_types
+from resql.ids import HybridLogicalClock
+from resql.log_context import LogContextCache, resolve_extra
 from resql.query_log import QueryLog
-from tests.utils import now_in_utc
+from resql.query_stats import StatementAggregator
+from resql.util import chunked, now_in_utc
+from resql.worker import BackgroundWorker
+from resql.writers import LogWriter
+
+logger = logging.getLogger(__name__)
+
+SAVEPOINT_CLAUSES = (SavepointClause, RollbackToSavepointClause, ReleaseSavepointClause)
+# called with the (pooled) DB-API connection of each commit, and whether it succeeded
+CommitListener = Callable[[Any, bool], None]
+# a weak reference to a `CommitListener`, which returns `None` once it's gone
+ListenerReference = Callable[[], Optional[CommitListener]]
+_COMMIT_LISTENERS = "_resql_commit_listeners"
+# set on change logs to the hashes of their values, see `resql.change_log_column.hash_diff`
+_COLUMN_HASHES = "_resql_column_hashes"
+
+
+def _split_target(
+    target: Union[Engine, LogWriter],
+    context_cache: Optional[LogContextCache],
+) -> tuple[Optional[sessionmaker], Optional[LogWriter]]:  # type: ignore[type-arg]
+    if isinstance(target, Engine):
+        return sessionmaker(target, future=True), None
+    if context_cache is not None:
+        raise ValueError("Deduplicating extra with a context_cache requires logging to an Engine")
+    return None, target
+
+
+def _get_engine(session_maker: Optional[sessionmaker]) -> Optional[Engine]:  # type: ignore[type-arg]
+    return None if session_maker is None else cast(Engine, session_maker.kw["bind"])
+
+
+def _write(
+    session_maker: Optional[sessionmaker],  # type: ignore[type-arg]
+    writer: Optional[LogWriter],
+    logs: Sequence[Any],
+) -> None:
+    if writer is not None:
+        writer.write(logs)
+        return
+    if session_maker is not None:
+        with session_maker.begin() as session:  # pylint: disable=no-member
+            session.add_all(logs)
+
+
+def _notify(listeners: list[ListenerReference], dbapi_connection: Any, succeeded: bool) -> None:
+    for reference in list(listeners):
+        listener = reference()
+        if listener is None:
+            # its logger is gone, e.g. along with the connection it listened to
+            listeners.remove(reference)
+        else:
+            listener(dbapi_connection, succeeded)
+
+
+def _wrap_commit(
+    do_commit: Callable[..., None], listeners: list[ListenerReference], two_phase: bool
+) -> Callable[..., None]:
+    @functools.wraps(do_commit)
+    def commit(connection: Any, *args: Any, **kwargs: Any) -> None:
+        # two-phase commits are given the `Connection` rather than its pooled DB-API connection
+        dbapi_connection = connection.connection if two_phase else connection
+        try:
+            do_commit(connection, *args, **kwargs)
+        except BaseException:
+            _notify(listeners, dbapi_connection, False)
+            raise
+        _notify(listeners, dbapi_connection, True)
+
+    return commit
+
+
+def listen_commits(dialect: Any, listener: CommitListener) -> None:
+    """
+    Calls `listener`, a method only referenced weakly, once each commit of the connections of `dialect` has succeeded,
+    or failed. The `commit` event of Core fires before the COMMIT is sent, so it can't tell, and there's no event after
+    it: instead, the dialect's `do_commit` and `do_commit_twophase`, which are meant to be overridden, are wrapped.
+    """
+    if _COMMIT_LISTENERS not in vars(dialect):
+        listeners: list[ListenerReference] = []
+        setattr(dialect, _COMMIT_LISTENERS, listeners)
+        dialect.do_commit = _wrap_commit(dialect.do_commit, listeners, two_phase=False)
+        dialect.do_commit_twophase = _wrap_commit(dialect.do_commit_twophase, listeners, two_phase=True)
+    getattr(dialect, _COMMIT_LISTENERS).append(weakref.WeakMethod(cast(types.MethodType, listener)))
+
+
+@dataclass
+class PendingQueries:
+    """Logs of the statements of a connection's ongoing transaction, and the name and start of its savepoints."""
+
+    logs: list[QueryLog] = field(default_factory=list)
+    savepoints: list[tuple[str, int]] = field(default_factory=list)
 
 
 @dataclass
-class QueryLogger:
-    session_maker: sessionmaker  # type: ignore[type-arg]
+class QueryLogger:  # pylint: disable=too-many-instance-attributes
+    session_maker: Optional[sessionmaker]  # type: ignore[type-arg]
+    writer: Optional[LogWriter]
     extra: Optional[dict[str, Any]] = None
+    context_cache: Optional[LogContextCache] = None
+    timed: bool = False
+    slow_threshold: Optional[float] = None
+    aggregator: Optional[StatementAggregator] = None
+    ids: Optional[HybridLogicalClock] = None
+    commit_scoped: bool = True
 
-    def __init__(self, target_engine: Engine, extra: Optional[dict[str, Any]] = None) -> None:
-        self.session_maker = sessionmaker(target_engine, future=True)
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        target: Union[Engine, LogWriter],
+        extra: Optional[dict[str, Any]] = None,
+        context_cache: Optional[LogContextCache] = None,
+        timed: bool = False,
+        slow_threshold: Optional[float] = None,
+        aggregator: Optional[StatementAggregator] = None,
+        ids: Optional[HybridLogicalClock] = None,
+        commit_scoped: bool = True,
+    ) -> None:
+        self.session_maker, self.writer = _split_target(target, context_cache)
         self.extra = extra
+        self.context_cache = context_cache
+        # a threshold is meaningless without timing the statements
+        self.timed = timed or slow_threshold is not None
+        self.slow_threshold = slow_threshold
+        self.aggregator = aggregator
+        self.ids = ids
+        self.commit_scoped = commit_scoped
+        # by connection, forgotten along with it
+        self._pending: weakref.WeakKeyDictionary[Connection, PendingQueries] = weakref.WeakKeyDictionary()
+        # the logs of the transactions being committed, by the id of their DB-API connection
+        self._committing: dict[int, list[QueryLog]] = {}
 
     def __del__(self) -> None:
         print("QueryLogger.__del__")
 
     def listen(self, connection: Union[Engine, Connection]) -> None:
+        if self.timed or self.aggregator is not None:
+            event.listen(connection, "before_cursor_execute", self.before_cursor_execute)
+            event.listen(connection, "after_cursor_execute", self.after_cursor_execute)
         event.listen(connection, "after_execute", self.after_execute)
+        if self.commit_scoped:
+            for identifier, listener in (
+                ("commit", self.commit),
+                ("commit_twophase", self.commit),
+                ("rollback", self.rollback),
+                ("rollback_twophase", self.rollback),
+            ):
+                event.listen(connection, identifier, listener)
+            listen_commits(connection.dialect, self.committed)
+
+    def commit(self, conn: Connection, *_: Any) -> None:
+        """Sets the logs of the transaction aside until its COMMIT, which is about to be sent, succeeds."""
+        pending = self._pending.pop(conn, None)
+        if pending is not None and pending.logs:
+            self._committing[id(conn.connection)] = pending.logs
+
+    def committed(self, dbapi_connection: Any, succeeded: bool) -> None:
+        """
+        Writes the logs of a committed transaction, all at once. Failing to is reported rather than raised,
+        since the transaction is committed already.
+        """
+        logs = self._committing.pop(id(dbapi_connection), None)
+        if not succeeded or not logs:
+            return
+        try:
+            _write(self.session_maker, self.writer, logs)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to write the query logs of a committed transaction")
+
+    def rollback(self, conn: Connection, *_: Any) -> None:
+        self._pending.pop(conn, None)
+
+    def _track_savepoint(self, conn: Connection, clauseelement: Any) -> None:
+        """
+        Remembers where a savepoint started, or, when it's rolled back, discards the logs of the statements since then.
+        Savepoints nested in it are forgotten when it's rolled back or released.
+        """
+        pending = self._pending.setdefault(conn, PendingQueries())
+        if isinstance(clauseelement, SavepointClause):
+            pending.savepoints.append((clauseelement.ident, len(pending.logs)))
+            return
+        names = [name for name, _ in pending.savepoints]
+        if clauseelement.ident not in names:
+            return
+        position = len(names) - 1 - names[::-1].index(clauseelement.ident)
+        if isinstance(clauseelement, RollbackToSavepointClause):
+            del pending.logs[pending.savepoints[position][1] :]
+        del pending.savepoints[position:]
+
+    @staticmethod
+    def before_cursor_execute(  # pylint: disable=too-many-arguments,unused-argument
+        conn: Connection,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: ExecutionContext,
+        executemany: bool,
+    ) -> None:
+        setattr(context, "resql_started_at", time.perf_counter())
+
+    def after_cursor_execute(  # pylint: disable=too-many-arguments,unused-argument
+        self,
+        conn: Connection,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: ExecutionContext,
+        executemany: bool,
+    ) -> None:
+        # a single statement may be run through the cursor more than once, so accumulate
+        elapsed = time.perf_counter() - getattr(context, "resql_started_at")
+        setattr(context, "resql_duration", getattr(context, "resql_duration", 0.0) + elapsed)
+        if self.aggregator is not None:
+            dialect_description = getattr(conn.dialect, "dialect_description")
+            self.aggregator.record(dialect_description, statement, elapsed, cursor.rowcount)
+
+    def _is_slow(self, duration: Optional[float]) -> bool:
+        return self.slow_threshold is not None and duration is not None and duration >= self.slow_threshold
 
     def after_execute(  # pylint: disable=too-many-arguments,unused-argument
         self,
@@ -36,27 +256,60 @@ class QueryLogger:
         execution_options: dict[str, Any],
         result: CursorResult,
     ) -> None:
-        if isinstance(clauseelement, Select):
+        if self.commit_scoped and isinstance(clauseelement, SAVEPOINT_CLAUSES):
+            # only the statements committed are logged, so savepoints have nothing left to undo when replayed
+            self._track_savepoint(conn, clauseelement)
             return
-        with self.session_maker.begin() as session:  # pylint: disable=no-member
-            log = QueryLog(
-                dialect_description=getattr(conn.dialect, "dialect_description"),
-                executed_at=now_in_utc(),
-                extra=self.extra,
-                statement=str(result.context.compiled),
-                parameters=getattr(result.context, "compiled_parameters"),
-                type=type(clauseelement).__name__,
-            )
-            session.add(log)
+        duration: Optional[float] = getattr(result.context, "resql_duration", None) if self.timed else None
+        # selects don't matter for recovery, so they're only logged when slow
+        if isinstance(clauseelement, Select) and not self._is_slow(duration):
+            return
+        extra, context_id = resolve_extra(self.context_cache, _get_engine(self.session_maker), QueryLog, self.extra)
+        parameter_sets = getattr(result.context, "compiled_parameters")
+        log = QueryLog(
+            context_id=context_id,
+            dialect_description=getattr(conn.dialect, "dialect_description"),
+            duration=duration,
+            executed_at=now_in_utc(),
+            extra=extra,
+            statement=str(result.context.compiled),
+            parameters=convert_parameters(result.context.compiled, parameter_sets),
+            parameter_types=get_parameter_types(parameter_sets),
+            row_count=result.rowcount if self.timed else None,
+            type=type(clauseelement).__name__,
+        )
+        if self.ids is not None:
+            log.id = self.ids.next_id()
+        # slow selects are logged for diagnosis rather than replay, even if their transaction is rolled back.
+        # Without a transaction (e.g. with AUTOCOMMIT), there's no commit to wait for
+        if self.commit_scoped and conn.in_transaction() and not isinstance(clauseelement, Select):
+            self._pending.setdefault(conn, PendingQueries()).logs.append(log)
+        else:
+            _write(self.session_maker, self.writer, [log])
 
 
 def log_queries(
     *,
     of: Union[Engine, Connection],
-    to: Engine,
+    to: Union[Engine, LogWriter],
     extra: Optional[dict[str, Any]] = None,
+    context_cache: Optional[LogContextCache] = None,
+    timed: bool = False,
+    slow_threshold: Optional[float] = None,
+    aggregator: Optional[StatementAggregator] = None,
+    ids: Optional[HybridLogicalClock] = None,
+    commit_scoped: bool = True,
 ) -> QueryLogger:
-    query_logger = QueryLogger(to, extra=extra)
+    query_logger = QueryLogger(
+        to,
+        extra=extra,
+        context_cache=context_cache,
+        timed=timed,
+        slow_threshold=slow_threshold,
+        aggregator=aggregator,
+        ids=ids,
+        commit_scoped=commit_scoped,
+    )
     query_logger.listen(of)
     return query_logger
 
@@ -73,12 +326,16 @@ class ModelDiff:
 
 
 def get_properties(state: InstanceState) -> Iterator[ColumnProperty]:
-    for obj_col in state.mapper.local_table.c:
+    return get_mapper_properties(state.mapper)
+
+
+def get_mapper_properties(mapper: Mapper) -> Iterator[ColumnProperty]:
+    for obj_col in mapper.local_table.c:
         # get the value of the attribute based on the MapperProperty related
         # to the mapped column.  this will allow usage of MapperProperties
         # that have a different keyname than that of the mapped column.
         try:
-            yield state.mapper.get_property_by_column(obj_col)
+            yield mapper.get_property_by_column(obj_col)
         except UnmappedColumnError:
             # in the case of single table inheritance, there may be
             # columns on the mapped table intended for the subclass only.
@@ -87,68 +344,487 @@ def get_properties(state: InstanceState) -> Iterator[ColumnProperty]:
             continue
 
 
-def get_model_diff(obj: Any) -> ModelDiff:
+# set to `False` in the `info` of a `Table` or `Column` to leave it out of the change log
+AUDIT_INFO_KEY = "resql_audit"
+
+# the column properties whose changes are logged, or `None` if none is
+DiffPlan = Optional[Tuple[ColumnProperty, ...]]
+
+
+def plan_diff(
+    mapper: Mapper,
+    *,
+    include_tables: Optional[Collection[str]] = None,
+    exclude_tables: Collection[str] = (),
+    exclude_columns: Collection[str] = (),
+) -> DiffPlan:
+    """
+    Which properties of `mapper` are audited, leaving out tables and columns with `info={"resql_audit": False}`,
+    tables not in `include_tables` (if given) or in `exclude_tables`,
+    and `exclude_columns`, named either `"column"` (of any table) or `"table.column"`.
+    """
+    table = mapper.local_table
+    table_name = str(table.name)
+    if (
+        not table.info.get(AUDIT_INFO_KEY, True)
+        or table_name in exclude_tables
+        or (include_tables is not None and table_name not in include_tables)
+    ):
+        return None
+    excluded = set(exclude_columns)
+    return tuple(
+        prop
+        for prop in get_mapper_properties(mapper)
+        if prop.columns[0].info.get(AUDIT_INFO_KEY, True)
+        and prop.columns[0].name not in excluded
+        and f"{table_name}.{prop.columns[0].name}" not in excluded
+    )
+
+
+def get_model_diff(obj: Any, properties: Optional[Iterable[ColumnProperty]] = None) -> ModelDiff:
     state: InstanceState = inspect(obj)
-    properties = get_properties(state)
+    properties = get_properties(state) if properties is None else properties
     model_diff = ModelDiff(values={})
+    converters = get_column_converters(state.mapper)
     for prop in properties:
         # expired object attributes and also deferred cols might not be in the dict.
         # force it to load no matter what by using getattr().
         if prop.key not in state.dict:
             getattr(obj, prop.key)
 
-        history = attributes.get_history(obj, prop.key)
-        if history.added and history.deleted:
-            model_diff.values[prop.key] = Diff(old=history.deleted[0], new=history.added[0])
-        elif history.added:
-            model_diff.values[prop.key] = Diff(old=None, new=history.added[0])
-        elif history.deleted:
-            model_diff.values[prop.key] = Diff(old=history.deleted[0], new=None)
+        _add_history(model_diff, prop.key, attributes.get_history(obj, prop.key), converters.get(prop.key))
+    return model_diff
+
+
+def _add_history(model_diff: ModelDiff, key: str, history: Any, converter: Optional[Converter]) -> None:
+    if not history.added and not history.deleted:
+        return
+    old = history.deleted[0] if history.deleted else None
+    new = history.added[0] if history.added else None
+    if converter is not None:
+        old = None if old is None else converter(old)
+        new = None if new is None else converter(new)
+    model_diff.values[key] = Diff(old=old, new=new)
+
+
+# values that can't be changed in place, so changes don't need copies of them
+_IMMUTABLE_TYPES = (str, int, float, bool, bytes, Decimal, dt.date, dt.time, dt.timedelta, uuid.UUID, enum.Enum)
+
+
+def _snapshot(values: dict[str, Any]) -> dict[str, Any]:
+    """`values`, with those that could be changed in place, like those of JSON columns, copied."""
+    return {
+        key: value if value is None or isinstance(value, _IMMUTABLE_TYPES) else copy.deepcopy(value)
+        for key, value in values.items()
+    }
+
+
+class RawChange:
+    """
+    The bare minimum read from an object during flush so that its diff can be built later.
+
+    Only the attributes that have history are copied, along with their current values, which are copied too
+    if they could be changed in place before then. Unlike `get_model_diff`, expired or deferred attributes are not loaded.
+    """
+
+    __slots__ = (
+        "committed_state",
+        "current",
+        "executed_at",
+        "log_id",
+        "mapper",
+        "op_type",
+        "properties",
+        "record_id",
+    )
+
+    def __init__(
+        self,
+        obj: Any,
+        op_type: OpType,
+        log_id: Optional[int] = None,
+        properties: Optional[Iterable[ColumnProperty]] = None,
+    ) -> None:
+        state: InstanceState = inspect(obj)
+        self.committed_state = _snapshot(state.committed_state)
+        self.current = _snapshot({key: state.dict.get(key, NO_VALUE) for key in self.committed_state})
+        self.executed_at = now_in_utc()
+        self.log_id = log_id
+        self.mapper: Mapper = state.mapper
+        self.op_type = op_type
+        self.properties = properties
+        self.record_id: int = getattr(obj, "id")
+
+    @classmethod
+    def from_values(  # pylint: disable=too-many-arguments
+        cls,
+        mapper: Mapper,
+        op_type: OpType,
+        record_id: int,
+        committed_state: dict[str, Any],
+        current: dict[str, Any],
+        log_id: Optional[int] = None,
+        properties: Optional[Iterable[ColumnProperty]] = None,
+    ) -> "RawChange":
+        """
+        A change without an object, from the values attributes had before (`NO_VALUE` for new records)
+        and those they were set to.
+        """
+        raw: RawChange = cls.__new__(cls)
+        raw.committed_state = _snapshot(committed_state)
+        raw.current = _snapshot(current)
+        raw.executed_at = now_in_utc()
+        raw.log_id = log_id
+        raw.mapper = mapper
+        raw.op_type = op_type
+        raw.properties = properties
+        raw.record_id = record_id
+        return raw
+
+
+def get_raw_model_diff(raw: RawChange) -> ModelDiff:
+    model_diff = ModelDiff(values={})
+    converters = get_column_converters(raw.mapper)
+    for prop in get_mapper_properties(raw.mapper) if raw.properties is None else raw.properties:
+        if prop.key in raw.committed_state:
+            # same history SQLAlchemy would have computed at flush time, since it only looks at `committed_state`
+            impl = raw.mapper.class_manager[prop.key].impl
+            history = attributes.History.from_scalar_attribute(impl, raw, raw.current[prop.key])
+            _add_history(model_diff, prop.key, history, converters.get(prop.key))
     return model_diff
 
 
+def _return_generated_ids(operation: BulkOperation) -> None:
+    """
+    Has a bulk insert of records without an id return the ids generated for them, which their logs need. Mappings are
+    copied first, since returning defaults fills them in, while objects get their ids as with `return_defaults=True`.
+    """
+    rows = [state.dict for state in operation.mappings] if operation.isstates else operation.mappings
+    if all(row.get("id") is not None for row in rows):
+        return
+    operation.return_defaults = True
+    if not operation.isstates:
+        operation.mappings = [dict(mapping) for mapping in operation.mappings]
+
+
 @dataclass
-class ChangeLogger:
-    session_maker: sessionmaker  # type: ignore[type-arg]
+class ChangeLogger:  # pylint: disable=too-many-instance-attributes
+    session_maker: Optional[sessionmaker]  # type: ignore[type-arg]
+    writer: Optional[LogWriter]
     extra: Optional[dict[str, Any]] = None
+    context_cache: Optional[LogContextCache] = None
+    worker: Optional[BackgroundWorker] = None
+    ids: Optional[HybridLogicalClock] = None
+    index_columns: bool = False
+    hash_column_values: bool = False
+    delta_threshold: Optional[int] = None
+    blob_store: Optional[BlobStore] = None
+    include_tables: Optional[Collection[str]] = None
+    exclude_tables: Collection[str] = ()
+    exclude_columns: Collection[str] = ()
+    chunk_size: Optional[int] = 1000
+    rollup_interval: Optional[dt.timedelta] = None
+    rollup_records: bool = False
 
-    def __init__(self, target_engine: Engine, extra: Optional[dict[str, Any]] = None) -> None:
-        self.session_maker = sessionmaker(target_engine, future=True)
+    def __init__(  # pylint: disable=too-many-arguments,too-many-locals
+        self,
+        target: Union[Engine, LogWriter],
+        extra: Optional[dict[str, Any]] = None,
+        context_cache: Optional[LogContextCache] = None,
+        worker: Optional[BackgroundWorker] = None,
+        ids: Optional[HybridLogicalClock] = None,
+        index_columns: bool = False,
+        hash_column_values: bool = False,
+        delta_threshold: Optional[int] = None,
+        blob_store: Optional[BlobStore] = None,
+        include_tables: Optional[Collection[str]] = None,
+        exclude_tables: Collection[str] = (),
+        exclude_columns: Collection[str] = (),
+        chunk_size: Optional[int] = 1000,
+        rollup_interval: Optional[dt.timedelta] = None,
+        rollup_records: bool = False,
+    ) -> None:
+        self.session_maker, self.writer = _split_target(target, context_cache)
+        if (index_columns or hash_column_values) and self.writer is not None:
+            raise ValueError("Indexing changed columns requires logging to an Engine")
+        if blob_store is not None and self.writer is not None:
+            raise ValueError("Storing blobs requires logging to an Engine")
+        if rollup_interval is not None and self.writer is not None:
+            raise ValueError("Maintaining rollups requires logging to an Engine")
         self.extra = extra
+        self.context_cache = context_cache
+        self.worker = worker
+        self.ids = ids
+        self.index_columns = index_columns or hash_column_values
+        self.hash_column_values = hash_column_values
+        self.delta_threshold = delta_threshold
+        self.blob_store = blob_store
+        self.include_tables = include_tables
+        self.exclude_tables = exclude_tables
+        self.exclude_columns = exclude_columns
+        self.chunk_size = chunk_size
+        self.rollup_interval = rollup_interval
+        self.rollup_records = rollup_records
+        self._plans: dict[Mapper, DiffPlan] = {}
 
     def __del__(self) -> None:
         print("ChangeLogger.__del__")
 
-    def _new_log(self, obj: Any, op_type: OpType) -> ChangeLog:
-        diff = get_model_diff(obj)
-        return ChangeLog(
+    def _get_plan(self, mapper: Mapper) -> DiffPlan:
+        """Resolved once per mapper, since the configuration doesn't change."""
+        if mapper not in self._plans:
+            self._plans[mapper] = plan_diff(
+                mapper,
+                include_tables=self.include_tables,
+                exclude_tables=self.exclude_tables,
+                exclude_columns=self.exclude_columns,
+            )
+        return self._plans[mapper]
+
+    def _get_changes(self, session: Session) -> Iterator[tuple[Any, OpType, tuple[ColumnProperty, ...]]]:
+        for objs, op_type in (
+            (session.deleted, OpType.DELETE),
+            (session.dirty, OpType.UPDATE),
+            (session.new, OpType.INSERT),
+        ):
+            for obj in objs:
+                properties = self._get_plan(inspect(obj).mapper)
+                if properties is not None:
+                    yield obj, op_type, properties
+
+    def _new_log(  # pylint: disable=too-many-arguments
+        self,
+        obj: Any,
+        op_type: OpType,
+        properties: tuple[ColumnProperty, ...],
+        extra: Optional[dict[str, Any]],
+        context_id: Optional[int],
+    ) -> ChangeLog:
+        model_diff = get_model_diff(obj, properties)
+        log = ChangeLog(
+            context_id=context_id,
             table_name=getattr(obj, "__table__").name,
-            diff=diff.values,
+            diff=self._encode(model_diff, op_type),
             executed_at=now_in_utc(),
-            extra=self.extra,
+            extra=extra,
             record_id=getattr(obj, "id"),
             type=op_type,
         )
+        if self.ids is not None:
+            log.id = self.ids.next_id()
+        self._hash_values(log, model_diff)
+        return log
+
+    def _hash_values(self, log: ChangeLog, diff: ModelDiff) -> None:
+        if self.hash_column_values:
+            setattr(log, _COLUMN_HASHES, change_log_column.hash_diff(diff.values))
+
+    def _encode(self, diff: ModelDiff, op_type: OpType) -> dict[str, Any]:
+        if self.delta_threshold is None or op_type != OpType.UPDATE:
+            return cast(dict[str, Any], diff.values)
+        return encode_diff(cast(dict[str, Any], diff.values), self.delta_threshold)
+
+    def _new_raw_change(self, obj: Any, op_type: OpType, properties: tuple[ColumnProperty, ...]) -> RawChange:
+        return RawChange(obj, op_type, log_id=None if self.ids is None else self.ids.next_id(), properties=properties)
 
     def listen(self, session: Union[Session, sessionmaker]) -> None:  # type: ignore[type-arg]
         event.listen(session, "after_flush", self.after_flush)
+        bulk.listen(session, self.before_bulk)
 
     def after_flush(self, session: Session, _: UOWTransaction) -> None:
-        with self.session_maker.begin() as target_session:  # pylint: disable=no-member
-            for obj in session.deleted:
-                target_session.add(self._new_log(obj, OpType.DELETE))
-            for obj in session.dirty:
-                target_session.add(self._new_log(obj, OpType.UPDATE))
-            for obj in session.new:
-                target_session.add(self._new_log(obj, OpType.INSERT))
+        if self.worker is not None:
+            self._log_raw_changes(self._new_raw_change(*change) for change in self._get_changes(session))
+            return
+        # resolved once per flush, since `extra` is the same for every object in it
+        extra, context_id = resolve_extra(self.context_cache, _get_engine(self.session_maker), ChangeLog, self.extra)
+        self._write(self._new_log(*change, extra, context_id) for change in self._get_changes(session))
+
+    def before_bulk(self, operation: BulkOperation) -> Callable[[], None]:
+        """
+        Reads what a bulk operation is about to change, and returns what logs it once it ran. Updates are logged with
+        the values they replace, read a chunk at a time, since mappings don't have them and objects may not either.
+        """
+        properties = self._get_plan(operation.mapper)
+        if properties is None or not operation.mappings:
+            return lambda: None
+        if not operation.isupdate and not operation.return_defaults:
+            _return_generated_ids(operation)
+        # the attributes written, as with `update_changed_only`, and where their values are
+        changes: list[tuple[Collection[str], dict[str, Any]]] = (
+            [(state.committed_state, state.dict) for state in operation.mappings]
+            if operation.isstates
+            else [(mapping, mapping) for mapping in operation.mappings]
+        )
+        if not operation.isupdate:
+            # ids generated by the database are only known once it ran
+            return lambda: self._log_raw_changes(
+                self._new_bulk_change(
+                    operation.mapper,
+                    OpType.INSERT,
+                    values["id"],
+                    dict.fromkeys(keys, NO_VALUE),
+                    {key: values.get(key, NO_VALUE) for key in keys},
+                )
+                for keys, values in changes
+            )
+        updates = {
+            values["id"]: {key: values.get(key, NO_VALUE) for key in keys if key != "id"} for keys, values in changes
+        }
+        old_values = self._read_old_values(operation, properties, updates)
+        raw_changes = [
+            self._new_bulk_change(
+                operation.mapper,
+                OpType.UPDATE,
+                record_id,
+                {key: value for key, value in old_values[record_id].items() if key in current},
+                current,
+            )
+            for record_id, current in updates.items()
+            # otherwise there's nothing to update
+            if record_id in old_values
+        ]
+        return lambda: self._log_raw_changes(raw_changes)
+
+    def _new_bulk_change(  # pylint: disable=too-many-arguments
+        self,
+        mapper: Mapper,
+        op_type: OpType,
+        record_id: int,
+        committed_state: dict[str, Any],
+        current: dict[str, Any],
+    ) -> RawChange:
+        return RawChange.from_values(
+            mapper,
+            op_type,
+            record_id,
+            committed_state,
+            current,
+            log_id=None if self.ids is None else self.ids.next_id(),
+            properties=self._get_plan(mapper),
+        )
+
+    def _read_old_values(
+        self,
+        operation: BulkOperation,
+        properties: tuple[ColumnProperty, ...],
+        updates: dict[int, dict[str, Any]],
+    ) -> dict[int, dict[str, Any]]:
+        """The values that `updates` replace, by record id, read in a query per chunk of `chunk_size` records."""
+        keys = {key for current in updates.values() for key in current}
+        updated = [prop for prop in properties if prop.key in keys]
+        id_column = operation.mapper.local_table.c.id
+        conn = operation.session.connection(bind_arguments={"mapper": operation.mapper})
+        old_values = {}
+        for ids in chunked(updates, self.chunk_size):
+            query = select(id_column, *(prop.columns[0] for prop in updated)).where(id_column.in_(ids))
+            for record_id, *values in conn.execute(query):
+                old_values[record_id] = {prop.key: value for prop, value in zip(updated, values)}
+        return old_values
+
+    def _log_raw_changes(self, raw_changes: Iterable[RawChange]) -> None:
+        if self.worker is None:
+            self._write_raw_changes(raw_changes, self.extra)
+            return
+        extra = None if self.extra is None else dict(self.extra)
+        # with a bounded worker queue, this also bounds how many raw changes are waiting in memory
+        for chunk in chunked(raw_changes, self.chunk_size):
+            self.worker.submit(self._write_raw_changes, chunk, extra)
+
+    def _write_raw_changes(self, raw_changes: Iterable[RawChange], extra: Optional[dict[str, Any]]) -> None:
+        extra, context_id = resolve_extra(self.context_cache, _get_engine(self.session_maker), ChangeLog, extra)
+        self._write(self._new_raw_log(raw, extra, context_id) for raw in raw_changes)
+
+    def _new_raw_log(self, raw: RawChange, extra: Optional[dict[str, Any]], context_id: Optional[int]) -> ChangeLog:
+        model_diff = get_raw_model_diff(raw)
+        log = ChangeLog(
+            context_id=context_id,
+            diff=self._encode(model_diff, raw.op_type),
+            executed_at=raw.executed_at,
+            extra=extra,
+            record_id=raw.record_id,
+            table_name=raw.mapper.local_table.name,
+            type=raw.op_type,
+        )
+        if raw.log_id is not None:
+            log.id = raw.log_id
+        self._hash_values(log, model_diff)
+        return log
+
+    def _write(self, logs: Iterable[ChangeLog]) -> None:
+        """
+        Builds and writes `logs` in chunks of `chunk_size`, releasing each chunk before building the next,
+        so that memory doesn't grow with the size of the flush. Written in a single transaction if to an `Engine`.
+        """
+        # updates are left with an empty diff e.g. when only excluded columns changed
+        chunks = chunked((log for log in logs if log.diff or log.type != OpType.UPDATE), self.chunk_size)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            return
+        if self.writer is not None:
+            for chunk in itertools.chain([first_chunk], chunks):
+                self.writer.write(chunk)
+            return
+        blob_hashes: set[str] = set()
+        with cast(sessionmaker, self.session_maker).begin() as session:  # type: ignore[type-arg]
+            for chunk in itertools.chain([first_chunk], chunks):
+                if self.blob_store is not None:
+                    # through the same connection, since a second one would wait on the locks this one holds
+                    blob_hashes |= self.blob_store.externalize(session.connection(), ChangeLog, chunk)
+                session.add_all(chunk)
+                # also gets the ids of the logs, which the index rows reference
+                session.flush()
+                if self.index_columns:
+                    rows = [
+                        row
+                        for log in chunk
+                        for row in change_log_column.get_rows(log, getattr(log, _COLUMN_HASHES, None))
+                    ]
+                    if rows:
+                        session.execute(insert(change_log_column.get_table(ChangeLog)), rows)
+                if self.rollup_interval is not None:
+                    change_rollup.add_changes(
+                        session, ChangeLog, chunk, self.rollup_interval, records=self.rollup_records
+                    )
+                session.expunge_all()
+        if self.blob_store is not None:
+            self.blob_store.remember(ChangeLog, blob_hashes)
 
 
-def log_changes(
+def log_changes(  # pylint: disable=too-many-locals
     *,
     of: Union[Session, sessionmaker],  # type: ignore[type-arg]
-    to: Engine,
+    to: Union[Engine, LogWriter],
     extra: Optional[dict[str, Any]] = None,
+    context_cache: Optional[LogContextCache] = None,
+    worker: Optional[BackgroundWorker] = None,
+    ids: Optional[HybridLogicalClock] = None,
+    index_columns: bool = False,
+    hash_column_values: bool = False,
+    delta_threshold: Optional[int] = None,
+    blob_store: Optional[BlobStore] = None,
+    include_tables: Optional[Collection[str]] = None,
+    exclude_tables: Collection[str] = (),
+    exclude_columns: Collection[str] = (),
+    chunk_size: Optional[int] = 1000,
+    rollup_interval: Optional[dt.timedelta] = None,
+    rollup_records: bool = False,
 ) -> ChangeLogger:
-    change_logger = ChangeLogger(to, extra=extra)
+    change_logger = ChangeLogger(
+        to,
+        extra=extra,
+        context_cache=context_cache,
+        worker=worker,
+        ids=ids,
+        index_columns=index_columns,
+        hash_column_values=hash_column_values,
+        delta_threshold=delta_threshold,
+        blob_store=blob_store,
+        include_tables=include_tables,
+        exclude_tables=exclude_tables,
+        exclude_columns=exclude_columns,
+        chunk_size=chunk_size,
+        rollup_interval=rollup_interval,
+        rollup_records=rollup_records,
+    )
     change_logger.listen(of)
     return change_logger
@@ -0,0 +1,70 @@
+"""
+Listens to the bulk operations of sessions: `Session.bulk_save_objects`, `bulk_insert_mappings` and
+`bulk_update_mappings`. They don't flush, so `after_flush` misses them, and SQLAlchemy has no event of its own for them,
+but they all go through `Session._bulk_save_mappings`, which is wrapped for the sessions listened to.
+"""
+import functools
+import types
+from dataclasses import dataclass
+from typing import Any, Callable, Union
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Mapper, Session, sessionmaker
+
+_METHOD = "_bulk_save_mappings"
+_LISTENERS = "_resql_bulk_listeners"
+
+
+@dataclass
+class BulkOperation:
+    """
+    The arguments of a bulk operation: `mappings` are the states of the objects saved, with `isstates`.
+    Listeners may replace `mappings` and set `return_defaults`, e.g. to learn the ids generated by the database.
+    """
+
+    session: Session
+    mapper: Mapper
+    mappings: list[Any]
+    isupdate: bool
+    isstates: bool
+    return_defaults: bool
+
+
+# called before a bulk operation runs, returning what's called once it succeeded
+BulkListener = Callable[[BulkOperation], Callable[[], None]]
+
+
+def _wrap(original: Callable[..., None], listeners: list[BulkListener]) -> Callable[..., None]:
+    @functools.wraps(original)
+    def bulk_save_mappings(  # pylint: disable=too-many-arguments
+        session: Session,
+        mapper: Any,
+        mappings: Any,
+        isupdate: bool,
+        isstates: bool,
+        return_defaults: bool,
+        *args: Any,
+    ) -> None:
+        # usually a generator, which listeners need to go through too
+        mappings = list(mappings)
+        operation = BulkOperation(session, inspect(mapper), mappings, isupdate, isstates, return_defaults)
+        callbacks = [listener(operation) for listener in listeners]
+        original(session, mapper, operation.mappings, isupdate, isstates, operation.return_defaults, *args)
+        for callback in callbacks:
+            callback()
+
+    return bulk_save_mappings
+
+
+def listen(target: Union[Session, sessionmaker], listener: BulkListener) -> None:  # type: ignore[type-arg]
+    """Calls `listener` for the bulk operations of `target`, a session or every session made by a sessionmaker."""
+    # each sessionmaker makes sessions of a subclass of its own, so wrapping that leaves other sessions alone
+    owner: Any = target.class_ if isinstance(target, sessionmaker) else target
+    if _LISTENERS not in vars(owner):
+        listeners: list[BulkListener] = []
+        setattr(owner, _LISTENERS, listeners)
+        if isinstance(owner, type):
+            setattr(owner, _METHOD, _wrap(getattr(owner, _METHOD), listeners))
+        else:
+            setattr(owner, _METHOD, types.MethodType(_wrap(getattr(type(owner), _METHOD), listeners), owner))
+    getattr(owner, _LISTENERS).append(listener)
@@ -0,0 +1,129 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Mapping, Union
+
+from sqlalchemy import Column, LargeBinary, MetaData, String, Table, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from resql.util import get_sibling_table, insert_missing
+
+TABLE_NAME = "change_blob"
+# how many hashes go in each `IN (...)`, to stay below the parameter limits of every dialect
+CHUNK_SIZE = 500
+# the key of the dict that replaces a value moved to the blob store, unlikely to clash with a JSON column's keys
+REFERENCE_KEY = "__resql_blob__"
+
+
+def default_table(metadata: MetaData) -> Table:
+    return Table(
+        TABLE_NAME,
+        metadata,
+        Column("hash", String(64), primary_key=True),
+        Column("data", LargeBinary, nullable=False),
+    )
+
+
+def get_table(log_class: type) -> Table:
+    return get_sibling_table(log_class, TABLE_NAME)
+
+
+def is_reference(value: Any) -> bool:
+    return isinstance(value, dict) and REFERENCE_KEY in value
+
+
+def make_reference(value: Union[bytes, str]) -> tuple[dict[str, str], str, bytes]:
+    """The `(reference, hash, data)` to store `value` by, with its type so that `str`s come back as such."""
+    data = value.encode() if isinstance(value, str) else value
+    digest = hashlib.sha256(data).hexdigest()
+    return {REFERENCE_KEY: digest, "type": "str" if isinstance(value, str) else "bytes"}, digest, data
+
+
+def dereference(value: Any, blobs: Mapping[str, bytes]) -> Any:
+    if not is_reference(value):
+        return value
+    data = blobs[value[REFERENCE_KEY]]
+    return data.decode() if value["type"] == "str" else data
+
+
+def find_references(diffs: Iterable[dict[str, Any]]) -> set[str]:
+    """The hashes of every blob referenced by `diffs`."""
+    return {
+        change[side][REFERENCE_KEY]
+        for diff in diffs
+        for change in diff.values()
+        for side in ("new", "old")
+        if is_reference(change.get(side))
+    }
+
+
+def load_blobs(session: Union[Session, Connection], log_class: type, hashes: Iterable[str]) -> dict[str, bytes]:
+    table = get_table(log_class)
+    wanted = sorted(hashes)
+    blobs: dict[str, bytes] = {}
+    for start in range(0, len(wanted), CHUNK_SIZE):
+        query = select(table.c.hash, table.c.data).where(table.c.hash.in_(wanted[start : start + CHUNK_SIZE]))
+        blobs.update((row.hash, bytes(row.data)) for row in session.execute(query))
+    return blobs
+
+
+@dataclass
+class BlobStore:
+    """
+    Moves `bytes` values, which JSON can't hold, and strings of at least `threshold` characters out of diffs
+    and into the `change_blob` table, each stored once by its SHA-256.
+
+    Remembers up to `max_known` hashes already in the table, so that repeated values are neither sent nor looked up
+    again. Meant to be shared by every logger writing to the same database, like `LogContextCache`.
+    """
+
+    threshold: int = 4096
+    max_known: int = 100_000
+    known: set[tuple[Table, str]] = field(default_factory=set)
+
+    def externalize(self, conn: Connection, log_class: type, logs: Iterable[Any]) -> set[str]:
+        """
+        Replaces large values in the diffs of `logs` with references, storing those values first through `conn`,
+        the connection the logs are written with, and returns their hashes. Those are only remembered as stored
+        once `remember` is called with them, which must be after the transaction of `conn` committed.
+        """
+        pending: dict[str, bytes] = {}
+        for log in logs:
+            log.diff = {key: self._externalize_change(change, pending) for key, change in log.diff.items()}
+        if pending:
+            self._store(conn, get_table(log_class), pending)
+        return set(pending)
+
+    def remember(self, log_class: type, hashes: Iterable[str]) -> None:
+        table = get_table(log_class)
+        hashes = set(hashes)
+        if len(self.known) + len(hashes) > self.max_known:
+            self.known.clear()
+        self.known.update((table, digest) for digest in hashes)
+
+    def _externalize_change(self, change: dict[str, Any], pending: dict[str, bytes]) -> dict[str, Any]:
+        externalized = dict(change)
+        for side in ("new", "old"):
+            value = change.get(side)
+            if isinstance(value, bytes) or (isinstance(value, str) and len(value) >= self.threshold):
+                externalized[side], digest, pending[digest] = make_reference(value)
+        return externalized
+
+    def _store(self, conn: Connection, table: Table, blobs: dict[str, bytes]) -> None:
+        missing = {digest: data for digest, data in blobs.items() if (table, digest) not in self.known}
+        if not missing:
+            return
+        for digest in load_hashes(conn, table, missing):
+            del missing[digest]
+        # another process may store some of the same blobs in the meantime
+        insert_missing(conn, table, [dict(hash=digest, data=data) for digest, data in missing.items()])
+
+
+def load_hashes(conn: Connection, table: Table, hashes: Iterable[str]) -> set[str]:
+    """Which of `hashes` are already in `table`."""
+    wanted = sorted(hashes)
+    found: set[str] = set()
+    for start in range(0, len(wanted), CHUNK_SIZE):
+        query = select(table.c.hash).where(table.c.hash.in_(wanted[start : start + CHUNK_SIZE]))
+        found.update(conn.execute(query).scalars())
+    return found
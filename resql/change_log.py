@@ -1,13 +1,16 @@
 import datetime as dt
 import enum
 from dataclasses import dataclass, field
-from typing import Any, Optional
+from typing import Any, Optional, Sequence, Union
 
-from sqlalchemy import JSON, Column, Enum, Integer, MetaData, String, Table
-from sqlalchemy.orm import registry
+from sqlalchemy import BigInteger, Column, Computed, Enum, ForeignKey, Index, Integer, MetaData, String, Table, select
+from sqlalchemy.orm import Session, registry
+from sqlalchemy.sql import Select
 from sqlalchemy_utc import UtcDateTime
 
-from resql.util import enum_values
+from resql import change_blob, change_log_column, change_rollup, log_context
+from resql.encoding import get_converter, to_json_value
+from resql.util import add_gin_index, enum_values, json_type
 
 
 class OpType(str, enum.Enum):
@@ -25,23 +28,133 @@ class ChangeLog:
     record_id: int
     table_name: str
     type: OpType
+    context_id: Optional[int] = None
 
 
-def default_table(metadata: MetaData) -> Table:
-    return Table(
+def default_table(
+    metadata: MetaData,
+    *,
+    gin_indexes: bool = False,
+    indexed_diff_keys: Sequence[str] = (),
+) -> Table:
+    """
+    On PostgreSQL, `diff` and `extra` are `JSONB` and, with `gin_indexes`, indexed for `@>` searches.
+    Each of the `indexed_diff_keys` also gets an indexed, generated column, `diff_<key>_new`,
+    holding the new value (as a string) of that key on every dialect.
+    The `change_log_column`, `change_blob` and `change_rollup` tables, used by loggers with `index_columns`,
+    `blob_store` and `rollup_interval`, are created alongside.
+    """
+    log_context.default_table(metadata)
+    table = Table(
         "change_log",
         metadata,
-        Column("id", Integer, primary_key=True),
-        Column("diff", JSON, nullable=False),
+        # 64-bit to hold ids from `resql.ids.HybridLogicalClock` (SQLite only autoincrements INTEGER, also 64-bit)
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+        Column("context_id", ForeignKey(f"{log_context.TABLE_NAME}.id"), nullable=True),
+        Column("diff", json_type(), nullable=False),
         Column("executed_at", UtcDateTime, nullable=False),
-        Column("extra", JSON, nullable=True),
+        Column("extra", json_type(), nullable=True),
         Column("record_id", Integer, nullable=False),
         Column("table_name", String(128), nullable=False),
         Column("type", Enum(OpType, values_callable=enum_values), nullable=False),
+        # BRIN is tiny and fits append-only tables, where rows are physically ordered by time. B-tree elsewhere
+        Index("ix_change_log_executed_at", "executed_at", postgresql_using="brin"),
+        Index("ix_change_log_table_name_record_id", "table_name", "record_id"),
     )
+    for key in indexed_diff_keys:
+        column = Column(f"diff_{key}_new", String(255), Computed(table.c.diff[(key, "new")].as_string()))
+        table.append_column(column)
+        Index(f"ix_change_log_diff_{key}_new", table.c.table_name, column)
+    if gin_indexes:
+        add_gin_index(table, "diff")
+        add_gin_index(table, "extra")
+    change_log_column.default_table(metadata)
+    change_blob.default_table(metadata)
+    change_rollup.default_table(metadata)
+    return table
 
 
-def map_default() -> registry:
+def map_default(*, gin_indexes: bool = False, indexed_diff_keys: Sequence[str] = ()) -> registry:
     mapper_registry = registry()
-    mapper_registry.map_imperatively(ChangeLog, default_table(mapper_registry.metadata))
+    table = default_table(mapper_registry.metadata, gin_indexes=gin_indexes, indexed_diff_keys=indexed_diff_keys)
+    mapper_registry.map_imperatively(ChangeLog, table)
     return mapper_registry
+
+
+def select_column_changes(
+    table: Union[str, Table],
+    column_name: str,
+    *,
+    record_id: Optional[int] = None,
+    old: Any = change_log_column.ANY,
+    new: Any = change_log_column.ANY,
+) -> Select:
+    """
+    Selects every `ChangeLog` that changed `column_name` of `table` (a `Table`, or its name) through the
+    `change_log_column` index, optionally only of `record_id` and/or from an `old` and/or to a `new` value
+    (if the logger hashed values). Those are converted as their column's values are when logged,
+    which for values that aren't JSON-native, like enums, takes passing the `Table`.
+    """
+    if isinstance(table, Table):
+        table_name, converter = table.name, get_converter(table.c[column_name].type)
+    else:
+        table_name, converter = table, to_json_value
+    index = change_log_column.get_table(ChangeLog)
+    log_id = getattr(ChangeLog, "id")
+    query = (
+        select(ChangeLog)
+        .join(index, index.c.log_id == log_id)
+        .where(index.c.table_name == table_name, index.c.column_name == column_name)
+        .order_by(log_id)
+    )
+    if record_id is not None:
+        query = query.where(index.c.record_id == record_id)
+    if old is not change_log_column.ANY:
+        query = query.where(index.c.old_hash == change_log_column.hash_value(old, converter))
+    if new is not change_log_column.ANY:
+        query = query.where(index.c.new_hash == change_log_column.hash_value(new, converter))
+    return query
+
+
+@dataclass
+class ChangeRate:
+    table_name: str
+    type: OpType
+    bucket: dt.datetime
+    changes: int
+    # distinct records changed, if counted by the logger (`rollup_records`)
+    records: Optional[int]
+
+
+def get_change_rates(  # pylint: disable=too-many-arguments
+    session: Session,
+    interval: dt.timedelta,
+    *,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    table_name: Optional[str] = None,
+    op_type: Optional[OpType] = None,
+) -> list[ChangeRate]:
+    """
+    How many changes were logged per table, type and bucket of `interval` (the `rollup_interval` of the loggers)
+    starting from `since` (inclusive) until `until` (exclusive), read from the `change_rollup` table,
+    ordered by bucket, table name and type. Buckets without changes are left out.
+    """
+    table = change_rollup.get_table(ChangeLog)
+    query = (
+        select(table)
+        .where(table.c.bucket_seconds == int(interval.total_seconds()))
+        .order_by(table.c.bucket, table.c.table_name, table.c.type)
+    )
+    if since is not None:
+        query = query.where(table.c.bucket >= change_rollup.get_bucket(since, interval))
+    if until is not None:
+        query = query.where(table.c.bucket < until)
+    if table_name is not None:
+        query = query.where(table.c.table_name == table_name)
+    if op_type is not None:
+        query = query.where(table.c.type == op_type.value)
+    return [
+        ChangeRate(row.table_name, OpType(row.type), row.bucket, row.changes, row.records)
+        for row in session.execute(query)
+    ]
@@ -0,0 +1,68 @@
+from typing import Any, Mapping, Optional
+
+from sqlalchemy import BigInteger, Column, ForeignKey, Index, Integer, MetaData, String, Table
+
+from resql.encoding import Converter, to_json_value
+from resql.util import get_sibling_table, hash_json
+
+TABLE_NAME = "change_log_column"
+
+# stands for "any value" in `resql.change_log.select_column_changes`, since `None` is a meaningful value there
+ANY: Any = object()
+
+
+def default_table(metadata: MetaData) -> Table:
+    """One row per column changed by each `ChangeLog`, so that column history can be searched through indexes."""
+    return Table(
+        TABLE_NAME,
+        metadata,
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+        Column("column_name", String(128), nullable=False),
+        Column("log_id", ForeignKey("change_log.id"), nullable=False),
+        Column("new_hash", String(64), nullable=True),
+        Column("old_hash", String(64), nullable=True),
+        Column("record_id", Integer, nullable=False),
+        Column("table_name", String(128), nullable=False),
+        Index("ix_change_log_column_record", "table_name", "column_name", "record_id"),
+        Index("ix_change_log_column_new_hash", "table_name", "column_name", "new_hash"),
+    )
+
+
+def get_table(log_class: type) -> Table:
+    return get_sibling_table(log_class, TABLE_NAME)
+
+
+def hash_value(value: Any, converter: Optional[Converter] = to_json_value) -> str:
+    """
+    The hash of `value` converted with `converter`, which must be that of its column
+    (see `resql.encoding.get_converter`) for values searched for to hash like the logged ones,
+    or `None` for values that already are.
+    `None` is hashed as well, so that a NULL hash only ever means that values weren't hashed.
+    """
+    return hash_json(value if value is None or converter is None else converter(value))
+
+
+def hash_diff(diff: Mapping[str, Any]) -> dict[str, tuple[str, str]]:
+    """
+    The hashes of the new and old values of each column of `diff`, which must be taken before any of them is stored
+    as a delta (see `resql.deltas`) or moved to the blob store (see `resql.change_blob`), since those aren't the values.
+    """
+    return {
+        column_name: (hash_value(values.get("new"), None), hash_value(values.get("old"), None))
+        for column_name, values in diff.items()
+    }
+
+
+def get_rows(log: Any, hashes: Optional[Mapping[str, tuple[str, str]]]) -> list[dict[str, Any]]:
+    """The rows describing each column changed by `log`, which must already have its id, hashed with `hashes`."""
+    return [
+        dict(
+            column_name=column_name,
+            log_id=log.id,
+            new_hash=None if hashes is None else hashes[column_name][0],
+            old_hash=None if hashes is None else hashes[column_name][1],
+            record_id=log.record_id,
+            table_name=log.table_name,
+        )
+        for column_name in log.diff
+    ]
@@ -0,0 +1,148 @@
+import datetime as dt
+from collections import Counter
+from typing import Any, Iterable, cast
+
+from sqlalchemy import BigInteger, Column, Integer, MetaData, String, Table, and_, func, insert, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.orm import Session
+from sqlalchemy_utc import UtcDateTime
+
+from resql.util import get_sibling_table, insert_missing
+
+TABLE_NAME = "change_rollup"
+RECORD_TABLE_NAME = "change_rollup_record"
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+
+# table name, type and bucket
+RollupKey = tuple[str, str, dt.datetime]
+
+
+def default_table(metadata: MetaData) -> Table:
+    """
+    How many change logs were written per table, type and bucket of `bucket_seconds`, maintained by loggers with
+    `rollup_interval`, and, with `rollup_records`, how many distinct records they changed, which the
+    `change_rollup_record` table keeps track of.
+    """
+    Table(
+        RECORD_TABLE_NAME,
+        metadata,
+        Column("table_name", String(128), primary_key=True),
+        Column("type", String(16), primary_key=True),
+        Column("bucket_seconds", Integer, primary_key=True),
+        Column("bucket", UtcDateTime, primary_key=True),
+        Column("record_id", Integer, primary_key=True),
+    )
+    return Table(
+        TABLE_NAME,
+        metadata,
+        Column("table_name", String(128), primary_key=True),
+        Column("type", String(16), primary_key=True),
+        Column("bucket_seconds", Integer, primary_key=True),
+        Column("bucket", UtcDateTime, primary_key=True),
+        Column("changes", BigInteger, nullable=False),
+        Column("records", BigInteger, nullable=True),
+    )
+
+
+def get_table(log_class: type) -> Table:
+    return get_sibling_table(log_class, TABLE_NAME)
+
+
+def get_bucket(executed_at: dt.datetime, interval: dt.timedelta) -> dt.datetime:
+    """The start of the bucket of `interval` that `executed_at` falls in, counting from the Unix epoch."""
+    return EPOCH + (executed_at - EPOCH) // interval * interval
+
+
+def _get_key(log: Any, interval: dt.timedelta) -> RollupKey:
+    return log.table_name, log.type.value, get_bucket(log.executed_at, interval)
+
+
+def _count_new_records(
+    session: Session, table: Table, logs: Iterable[Any], interval: dt.timedelta
+) -> Counter[RollupKey]:
+    """
+    Records changed by `logs` that weren't yet in their bucket, which are added to `table`. Only those actually
+    inserted are counted, so that concurrent writers adding the same records neither fail nor count them twice.
+    """
+    record_ids: dict[RollupKey, set[int]] = {}
+    for log in logs:
+        record_ids.setdefault(_get_key(log, interval), set()).add(log.record_id)
+    seconds = int(interval.total_seconds())
+    new_records: Counter[RollupKey] = Counter()
+    conn = session.connection()
+    # sorted, so that concurrent writers lock rows in the same order
+    for key in sorted(record_ids):
+        table_name, op_type, bucket = key
+        rows = [
+            dict(table_name=table_name, type=op_type, bucket_seconds=seconds, bucket=bucket, record_id=record_id)
+            for record_id in sorted(record_ids[key])
+        ]
+        new_records[key] = insert_missing(conn, table, rows)
+    return new_records
+
+
+def add_changes(
+    session: Session, log_class: type, logs: Iterable[Any], interval: dt.timedelta, *, records: bool = False
+) -> None:
+    """
+    Adds `logs` to the counts of their bucket of `interval`, in `session`'s transaction, with a native upsert where
+    available (PostgreSQL, SQLite and MySQL) so that concurrent writers don't lose counts.
+    """
+    logs = list(logs)
+    changes = Counter(_get_key(log, interval) for log in logs)
+    new_records: Counter[RollupKey] = Counter()
+    if records:
+        new_records = _count_new_records(session, get_sibling_table(log_class, RECORD_TABLE_NAME), logs, interval)
+    seconds = int(interval.total_seconds())
+    rows = [
+        dict(
+            table_name=table_name,
+            type=op_type,
+            bucket_seconds=seconds,
+            bucket=bucket,
+            changes=count,
+            records=new_records[(table_name, op_type, bucket)] if records else None,
+        )
+        # sorted, so that concurrent writers lock rows in the same order
+        for (table_name, op_type, bucket), count in sorted(changes.items())
+    ]
+    if rows:
+        _upsert(session, get_table(log_class), rows)
+
+
+def _upsert(session: Session, table: Table, rows: list[dict[str, Any]]) -> None:
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name in ("postgresql", "sqlite"):
+        statement = postgresql.insert(table) if dialect_name == "postgresql" else sqlite.insert(table)
+        excluded = statement.excluded
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=list(table.primary_key),
+                set_=dict(
+                    changes=table.c.changes + excluded.changes,
+                    records=func.coalesce(table.c.records, 0) + excluded.records,
+                ),
+            ),
+            rows,
+        )
+    elif dialect_name in ("mysql", "mariadb"):
+        statement = mysql.insert(table)
+        inserted = statement.inserted
+        session.execute(
+            statement.on_duplicate_key_update(
+                changes=table.c.changes + inserted.changes,
+                records=func.coalesce(table.c.records, 0) + inserted.records,
+            ),
+            rows,
+        )
+    else:
+        for row in rows:
+            condition = and_(*(column == row[column.name] for column in table.primary_key))
+            values = dict(
+                changes=table.c.changes + row["changes"],
+                records=None if row["records"] is None else func.coalesce(table.c.records, 0) + row["records"],
+            )
+            result = cast(CursorResult, session.execute(update(table).where(condition).values(values)))
+            if result.rowcount == 0:
+                session.execute(insert(table).values(row))
@@ -0,0 +1,234 @@
+"""
+Collapses the logged operations of each record into their net effect, so that a record updated thousands of times
+is replayed as a single insert, update or delete.
+
+Query logs are only understood when they are simple inserts, updates and deletes of a single row by its `id`,
+as SQLAlchemy compiles them. Any other statement is replayed as it is, after everything compacted before it.
+"""
+import datetime as dt
+import itertools
+import re
+from dataclasses import dataclass
+from typing import Any, Hashable, Iterable, Mapping, Optional, Sequence, Union
+
+from sqlalchemy import bindparam, column, delete, insert, select, table, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from resql.change_log import ChangeLog, OpType
+from resql.deltas import resolve_diff
+from resql.encoding import decode_parameters, get_parameter_types, to_driver_parameters
+from resql.query_log import QueryLog
+from resql.replication import apply_query_log
+
+# how many query logs are loaded, and compacted, at a time
+CHUNK_SIZE = 100_000
+_RECORD_ID = "resql_record_id"
+_NAME = r"[`\"]?\w+[`\"]?"
+_PLACEHOLDER = r"(?:\?|%s|:\w+|%\(\w+\)s)"
+_BY_ID = rf"(?:{_NAME}\.)?[`\"]?id[`\"]? = {_PLACEHOLDER}"
+_INSERT = re.compile(rf"INSERT INTO ({_NAME}) \(([^()]+)\) VALUES \(([^()]+)\)")
+_UPDATE = re.compile(rf"UPDATE ({_NAME}) SET (.+) WHERE {_BY_ID}")
+_DELETE = re.compile(rf"DELETE FROM ({_NAME}) WHERE {_BY_ID}")
+_ASSIGNMENT = re.compile(rf"({_NAME})={_PLACEHOLDER}")
+
+RecordKey = tuple[str, int]
+# the position of an operation in the log, its type and the values it sets
+Change = tuple[int, OpType, dict[str, Any]]
+
+
+@dataclass
+class RecordOp:
+    """The net effect of operations on a record: inserting it, updating some of its values or deleting it."""
+
+    table_name: str
+    record_id: int
+    type: OpType
+    values: dict[str, Any]
+
+
+@dataclass
+class ReplayStats:
+    logs: int = 0
+    statements: int = 0
+
+
+def _compact_record(key: RecordKey, changes: Sequence[Change]) -> list[tuple[int, RecordOp]]:
+    """The operations, with their positions, that take the record from before `changes` to after them."""
+    table_name, record_id = key
+    types = [op_type for _, op_type, _ in changes]
+    last_insert = max((index for index, op_type in enumerate(types) if op_type == OpType.INSERT), default=-1)
+    last_delete = max((index for index, op_type in enumerate(types) if op_type == OpType.DELETE), default=-1)
+    compacted = []
+    # whether it existed before is only known from its first operation
+    if types[0] != OpType.INSERT and last_delete >= 0:
+        first_delete = types.index(OpType.DELETE)
+        compacted.append((changes[first_delete][0], RecordOp(table_name, record_id, OpType.DELETE, {})))
+    if last_delete > last_insert:
+        return compacted
+    start = max(last_insert, 0)
+    if types[start] == OpType.INSERT:
+        # as it was inserted, where it was, so that it still comes before what refers to it
+        inserted = {**changes[start][2], "id": record_id}
+        compacted.append((changes[start][0], RecordOp(table_name, record_id, OpType.INSERT, inserted)))
+        start += 1
+    values: dict[str, Any] = {}
+    for _, _, changed in changes[start:]:
+        values.update(changed)
+    if values:
+        # where it last changed, after other records freed or took the values it ends up with
+        compacted.append((changes[-1][0], RecordOp(table_name, record_id, OpType.UPDATE, values)))
+    return compacted
+
+
+def _compact(changes: Mapping[RecordKey, Sequence[Change]]) -> list[RecordOp]:
+    """
+    The net effect of `changes` on each record, in the order of the changes they stand for: deletes at the first
+    deletion, inserts where they were, and updates at the last change they merge, so that statements that depend on
+    each other, like those of parents and children or of rows trading unique values, stay in order.
+    """
+    positioned = [item for key, record_changes in changes.items() for item in _compact_record(key, record_changes)]
+    return [record_op for _, record_op in sorted(positioned, key=lambda item: item[0])]
+
+
+def compact_change_logs(logs: Iterable[ChangeLog], blobs: Optional[Mapping[str, bytes]] = None) -> list[RecordOp]:
+    """
+    The net effect of `logs`, ordered by id, on each record, with deltas resolved as in `resql.deltas.resolve_diffs`
+    and large values taken from `blobs`. Records that existed before `logs` began are updated with the values that
+    changed since, and records deleted and inserted again are deleted and inserted.
+    """
+    current: dict[RecordKey, dict[str, Any]] = {}
+    changes: dict[RecordKey, list[Change]] = {}
+    for position, log in enumerate(logs):
+        key = (log.table_name, log.record_id)
+        diff = resolve_diff(log, current.setdefault(key, {}), blobs)
+        values = {} if log.type == OpType.DELETE else {name: change["new"] for name, change in diff.items()}
+        changes.setdefault(key, []).append((position, log.type, values))
+    return _compact(changes)
+
+
+def _unquote(name: str) -> str:
+    return name.strip('`"')
+
+
+def _parse(log: QueryLog) -> Optional[list[tuple[RecordKey, OpType, dict[str, Any]]]]:
+    """The operations of `log` on single rows by `id`, one per parameter set, or `None` if it isn't that simple."""
+    # as Python values, passed to the driver like their type would when applied
+    parameter_sets = decode_parameters(log.parameters or [{}], log.parameter_types)
+    if (match := _INSERT.fullmatch(log.statement)) is not None:
+        names = [_unquote(name) for name in match.group(2).split(", ")]
+        placeholders = match.group(3).split(", ")
+        if "id" not in names or not all(re.fullmatch(_PLACEHOLDER, value) for value in placeholders):
+            return None
+        op_type = OpType.INSERT
+    elif (match := _UPDATE.fullmatch(log.statement)) is not None:
+        assignments = [_ASSIGNMENT.fullmatch(assignment) for assignment in match.group(2).split(", ")]
+        names = [_unquote(assignment.group(1)) for assignment in assignments if assignment is not None] + ["id"]
+        if len(names) != len(assignments) + 1 or names.count("id") > 1:
+            return None
+        op_type = OpType.UPDATE
+    elif (match := _DELETE.fullmatch(log.statement)) is not None:
+        names, op_type = ["id"], OpType.DELETE
+    else:
+        return None
+    operations = []
+    table_name = _unquote(match.group(1))
+    for parameters in parameter_sets:
+        # parameters were compiled, and so are ordered, as their placeholders appear in the statement
+        if len(parameters) != len(names):
+            return None
+        values = dict(zip(names, parameters.values()))
+        record_id = values["id"] if op_type == OpType.INSERT else values.pop("id")
+        operations.append(((table_name, record_id), op_type, {} if op_type == OpType.DELETE else values))
+    return operations
+
+
+def compact_query_logs(logs: Iterable[QueryLog]) -> list[Union[RecordOp, QueryLog]]:
+    """
+    The net effect of `logs`, ordered by id, on each record, interleaved with the logs whose statements can't be
+    compacted. Those are kept in place: what was compacted before one of them comes before it,
+    and what comes after it is compacted separately. Slow selects are left out.
+    """
+    compacted: list[Union[RecordOp, QueryLog]] = []
+    changes: dict[RecordKey, list[Change]] = {}
+    position = itertools.count()
+    for log in logs:
+        if log.type == "Select":
+            continue
+        operations = _parse(log)
+        if operations is None:
+            compacted.extend(_compact(changes))
+            compacted.append(log)
+            changes = {}
+            continue
+        for key, op_type, values in operations:
+            changes.setdefault(key, []).append((next(position), op_type, values))
+    compacted.extend(_compact(changes))
+    return compacted
+
+
+def _shape(operation: Union[RecordOp, QueryLog]) -> Hashable:
+    """Operations of the same shape, one after the other, are applied together as an `executemany`."""
+    if isinstance(operation, RecordOp):
+        return operation.type, operation.table_name, frozenset(operation.values)
+    return id(operation)
+
+
+def apply_compacted(conn: Connection, ops: Iterable[Union[RecordOp, QueryLog]]) -> int:
+    """
+    Applies `ops` in order, consecutive operations of the same shape as a single `executemany`, and returns how many
+    statements that took. Values that aren't JSON-native, like datetimes, are processed for the driver as their type
+    would (see `resql.encoding.to_driver_parameters`), and others passed as they are.
+    """
+    statements = 0
+    for _, group in itertools.groupby(ops, key=_shape):
+        batch = list(group)
+        first = batch[0]
+        if not isinstance(first, RecordOp):
+            if first.type != "Select":
+                apply_query_log(conn, first)
+                statements += 1
+            continue
+        statements += 1
+        # a lightweight table, without types to process the values with
+        target = table(first.table_name, *(column(name) for name in dict.fromkeys([*first.values, "id"])))
+        record_ops = [record_op for record_op in batch if isinstance(record_op, RecordOp)]
+        values = [record_op.values for record_op in record_ops]
+        values = to_driver_parameters(conn.dialect, values, get_parameter_types(values))
+        if first.type == OpType.INSERT:
+            conn.execute(insert(target), values)
+            continue
+        rows = [{**row, _RECORD_ID: record_op.record_id} for row, record_op in zip(values, record_ops)]
+        if first.type == OpType.UPDATE:
+            conn.execute(update(target).where(target.c.id == bindparam(_RECORD_ID)), rows)
+        else:
+            conn.execute(delete(target).where(target.c.id == bindparam(_RECORD_ID)), rows)
+    return statements
+
+
+def replay_query_logs(  # pylint: disable=too-many-arguments
+    *,
+    source: Engine,
+    target: Engine,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    compact: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> ReplayStats:
+    """
+    Re-runs the statements logged to `source` from `since` (inclusive) until `until` (exclusive) on `target`,
+    in a single transaction. With `compact`, each chunk of `chunk_size` logs is compacted first.
+    """
+    stats = ReplayStats()
+    log_id = getattr(QueryLog, "id")
+    query = select(QueryLog).order_by(log_id)
+    if since is not None:
+        query = query.where(QueryLog.executed_at >= since)
+    if until is not None:
+        query = query.where(QueryLog.executed_at < until)
+    with Session(source, future=True) as session, target.begin() as conn:
+        for logs in session.execute(query.execution_options(yield_per=chunk_size)).scalars().partitions():
+            stats.logs += len(logs)
+            ops: Iterable[Union[RecordOp, QueryLog]] = compact_query_logs(logs) if compact else logs
+            stats.statements += apply_compacted(conn, ops)
+    return stats
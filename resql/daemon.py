@@ -0,0 +1,290 @@
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Optional, Sequence, Union
+
+from sqlalchemy import MetaData, insert
+from sqlalchemy.engine import Engine
+
+from resql.encoding import decode_row, dumps, loads
+from resql.writers import get_table_name, to_row
+
+logger = logging.getLogger(__name__)
+
+Address = Union[str, tuple[str, int]]
+Rows = list[dict[str, Any]]
+Grouped = dict[tuple[str, frozenset[str]], Rows]
+
+# the longest a failed batch waits before it's written again, in seconds
+MAX_RETRY_DELAY = 30.0
+
+
+def _check_authkey(address: Address, authkey: Optional[bytes]) -> None:
+    """
+    Messages are pickled, so anyone who can connect can run code in the daemon: only Unix sockets, guarded by file
+    permissions, may go without an `authkey`. Like TCP, Windows named pipes (paths starting with two backslashes)
+    can be reached from other hosts.
+    """
+    is_unix_socket = isinstance(address, str) and not address.startswith("\\\\")
+    if authkey is None and not is_unix_socket:
+        raise ValueError(f"An authkey is required to communicate over {address!r}, which isn't a Unix socket")
+
+
+class AuditWriterClient:
+    """
+    Hands logs over to an `AuditWriterDaemon`, to be used as the `to` of `log_changes` and `log_queries`.
+
+    Sending is fire-and-forget: logs are written by the daemon later on, together with those of other processes.
+    Safe to share among threads, and reconnects by itself after a fork.
+    """
+
+    def __init__(self, address: Address, authkey: Optional[bytes] = None) -> None:
+        _check_authkey(address, authkey)
+        self.address = address
+        self.authkey = authkey
+        self._lock = threading.Lock()
+        self._connection: Optional[Connection] = None
+        self._pid = os.getpid()
+
+    def write(self, logs: Sequence[Any]) -> None:
+        rows_by_table: dict[str, Rows] = {}
+        for log in logs:
+            rows_by_table.setdefault(get_table_name(log), []).append(to_row(log))
+        for table_name, rows in rows_by_table.items():
+            self._send(("write", table_name, rows))
+
+    def flush(self) -> None:
+        """Blocks until the daemon has written everything this client sent so far."""
+        with self._lock:
+            connection = self._connect()
+            connection.send(("flush", None, None))
+            connection.recv()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _send(self, message: tuple[str, Optional[str], Optional[Rows]]) -> None:
+        with self._lock:
+            try:
+                self._connect().send(message)
+            except OSError:
+                # the daemon may have restarted, so try again once with a new connection
+                self._connection = None
+                self._connect().send(message)
+
+    def _connect(self) -> Connection:
+        if self._connection is None or self._pid != os.getpid():
+            # a connection inherited from the parent process must not be shared with it
+            self._connection = Client(self.address, authkey=self.authkey)
+            self._pid = os.getpid()
+        return self._connection
+
+
+def write_spooled(engine: Engine, metadata: MetaData, path: str) -> int:
+    """
+    Writes the logs an `AuditWriterDaemon` spooled to `path` through `engine` in a single transaction, then empties it,
+    and returns how many were written.
+    """
+    if not os.path.exists(path):
+        return 0
+    written = 0
+    with open(path, encoding="utf-8") as file, engine.begin() as conn:
+        for line in file:
+            spooled = loads(line)
+            table = metadata.tables[spooled["table"]]
+            conn.execute(insert(table), [decode_row(table, row) for row in spooled["rows"]])
+            written += len(spooled["rows"])
+    os.truncate(path, 0)
+    return written
+
+
+def _group(batch: Sequence[tuple[str, Rows]]) -> Grouped:
+    """The rows of `batch` by table and keys, since an executemany needs every row to have the same keys."""
+    grouped: Grouped = {}
+    for table_name, rows in batch:
+        for row in rows:
+            grouped.setdefault((table_name, frozenset(row)), []).append(row)
+    return grouped
+
+
+class AuditWriterDaemon:  # pylint: disable=too-many-instance-attributes
+    """
+    Receives logs from the `AuditWriterClient`s of many processes and writes them through a single `Engine`,
+    committing everything that arrived within `max_delay` seconds (up to `max_batch_size` rows) together.
+
+    `metadata` must contain the tables that clients write to, e.g. the `metadata` of the registry from `map_default`.
+    A batch that fails to be written is tried again, waiting longer each time, up to `max_attempts` times.
+    Then, each message in it is written on its own, and each row of those that still fail, so that only rows that fail
+    on their own are set aside: appended to the file at `spool_path`, to be written later with `write_spooled`,
+    or, without one (or if spooling fails too), dropped and logged as an error, so that they can't stall all others.
+    Logs that were received but not yet written are lost if the daemon dies.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        engine: Engine,
+        metadata: MetaData,
+        address: Address,
+        authkey: Optional[bytes] = None,
+        max_batch_size: int = 10_000,
+        max_delay: float = 0.05,
+        spool_path: Optional[str] = None,
+        max_attempts: int = 5,
+        retry_delay: float = 0.5,
+    ) -> None:
+        _check_authkey(address, authkey)
+        self.engine = engine
+        self.metadata = metadata
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.spool_path = spool_path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._authkey = authkey
+        self._listener = Listener(address, authkey=authkey)
+        self.address: Address = self._listener.address
+        self._queue: queue.Queue[Union[tuple[str, Rows], threading.Event, None]] = queue.Queue()
+        self._threads: list[threading.Thread] = []
+        self._closed = threading.Event()
+
+    def start(self) -> None:
+        """Starts accepting and writing logs in background threads."""
+        for target, name in ((self._accept, "resql-daemon-accept"), (self._write, "resql-daemon-write")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def serve_forever(self) -> None:
+        self.start()
+        self._closed.wait()
+
+    def close(self) -> None:
+        """Stops accepting connections and writes whatever was already received."""
+        self._closed.set()
+        if self._threads:
+            # closing the listener doesn't interrupt a blocked accept(), but a new connection does
+            Client(self.address, authkey=self._authkey).close()
+        self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        self._listener.close()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                connection = self._listener.accept()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to accept connection")
+                continue
+            if self._closed.is_set():
+                connection.close()
+                return
+            threading.Thread(target=self._receive, args=(connection,), daemon=True).start()
+
+    def _receive(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    kind, table_name, rows = connection.recv()
+                except (EOFError, OSError):
+                    return
+                if kind == "flush":
+                    written = threading.Event()
+                    self._queue.put(written)
+                    written.wait()
+                    connection.send(True)
+                else:
+                    self._queue.put((table_name, rows))
+
+    def _write(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, waiter, stopping = self._next_batch()
+            self._commit(batch)
+            if waiter is not None:
+                waiter.set()
+
+    def _next_batch(self) -> tuple[list[tuple[str, Rows]], Optional[threading.Event], bool]:
+        """Waits for logs and keeps adding them to the batch until it's full, it's time to commit, or someone waits."""
+        batch: list[tuple[str, Rows]] = []
+        row_count = 0
+        item = self._queue.get()
+        deadline = time.monotonic() + self.max_delay
+        while True:
+            if item is None:
+                return batch, None, True
+            if isinstance(item, threading.Event):
+                return batch, item, False
+            batch.append(item)
+            row_count += len(item[1])
+            timeout = deadline - time.monotonic()
+            if row_count >= self.max_batch_size or timeout <= 0:
+                return batch, None, False
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                return batch, None, False
+
+    def _commit(self, batch: list[tuple[str, Rows]]) -> None:
+        if not batch:
+            return
+        grouped = _group(batch)
+        row_count = sum(len(rows) for rows in grouped.values())
+        for attempt in itertools.count(1):
+            if self._insert(grouped, f"Failed to write {row_count} rows (attempt {attempt})"):
+                return
+            if attempt >= self.max_attempts:
+                break
+            time.sleep(min(self.retry_delay * 2 ** (attempt - 1), MAX_RETRY_DELAY))
+        # a single bad row fails the batch of every client every time, so only the rows that fail on their own are
+        # set aside: each message is written on its own, and then each row of those that still fail
+        failed: Grouped = {}
+        for table_name, rows in batch:
+            if self._insert(_group([(table_name, rows)]), f"Failed to write a message of {len(rows)} rows"):
+                continue
+            for row in rows:
+                if not self._insert(_group([(table_name, [row])]), f"Failed to write a row of {table_name}"):
+                    failed.setdefault((table_name, frozenset(row)), []).append(row)
+        if failed and not self._spool(failed):
+            self._dead_letter(failed)
+
+    def _insert(self, grouped: Grouped, failure: str) -> bool:
+        """Writes `grouped` in a single transaction, and returns whether it succeeded, logging `failure` if not."""
+        try:
+            with self.engine.begin() as conn:
+                for (table_name, _), rows in grouped.items():
+                    conn.execute(insert(self.metadata.tables[table_name]), rows)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception(failure)
+            return False
+        return True
+
+    def _spool(self, grouped: Grouped) -> bool:
+        """Appends `grouped` to the spool file, if there's one, and returns whether it was."""
+        if self.spool_path is None:
+            return False
+        try:
+            with open(self.spool_path, "a", encoding="utf-8") as file:
+                for (table_name, _), rows in grouped.items():
+                    file.write(dumps({"table": table_name, "rows": rows}) + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError:
+            logger.exception("Failed to spool rows to %s", self.spool_path)
+            return False
+        logger.error("Spooled %d rows to %s", sum(len(rows) for rows in grouped.values()), self.spool_path)
+        return True
+
+    @staticmethod
+    def _dead_letter(grouped: Grouped) -> None:
+        """Drops `grouped`, logging its rows so that they can still be recovered by hand."""
+        for (table_name, _), rows in grouped.items():
+            logger.error("Dropped %d rows of %s: %s", len(rows), table_name, dumps(rows))
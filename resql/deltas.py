@@ -0,0 +1,175 @@
+import copy
+import difflib
+from typing import Any, Callable, Iterable, Mapping, Optional
+
+from resql.change_blob import dereference
+from resql.change_log import ChangeLog, OpType
+from resql.encoding import dumps
+
+# keys that replace `old` and `new` in the diff of a column whose change was stored as a delta
+JSON_PATCH = "json_patch"
+TEXT_PATCH = "text_patch"
+CHAR_PATCH = "char_patch"
+
+
+def _size(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    return len(dumps(value))
+
+
+def make_json_patch(old: Any, new: Any, path: Optional[list[Any]] = None) -> list[dict[str, Any]]:
+    """
+    JSON-patch style operations turning `old` into `new`, with paths as lists of keys and indexes.
+    Lists are only patched element-wise if their length didn't change, otherwise they are replaced.
+    """
+    path = path or []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops: list[dict[str, Any]] = [{"op": "remove", "path": [*path, key]} for key in old if key not in new]
+        for key, value in new.items():
+            if key not in old:
+                ops.append({"op": "add", "path": [*path, key], "value": value})
+            elif old[key] != value:
+                ops.extend(make_json_patch(old[key], value, [*path, key]))
+        return ops
+    if isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        ops = []
+        for index, (old_item, new_item) in enumerate(zip(old, new)):
+            if old_item != new_item:
+                ops.extend(make_json_patch(old_item, new_item, [*path, index]))
+        return ops
+    return [{"op": "replace", "path": path, "value": new}]
+
+
+def apply_json_patch(value: Any, ops: Iterable[dict[str, Any]]) -> Any:
+    value = copy.deepcopy(value)
+    for operation in ops:
+        path = operation["path"]
+        if not path:
+            value = operation["value"]
+            continue
+        target = value
+        for key in path[:-1]:
+            target = target[key]
+        if operation["op"] == "remove":
+            del target[path[-1]]
+        else:
+            target[path[-1]] = operation["value"]
+    return value
+
+
+def make_text_patch(old: str, new: str) -> list[tuple[int, int, str]]:
+    """Line deltas turning `old` into `new`: each `(start, end, text)` replaces lines `start:end` of `old` by `text`."""
+    old_lines, new_lines = old.splitlines(keepends=True), new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    return [
+        (old_start, old_end, "".join(new_lines[new_start:new_end]))
+        for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_text_patch(value: str, ops: Iterable[tuple[int, int, str]]) -> str:
+    lines = value.splitlines(keepends=True)
+    # from the end, so that earlier line numbers still hold
+    for start, end, text in sorted(ops, reverse=True):
+        lines[start:end] = [text]
+    return "".join(lines)
+
+
+def _common_prefix_length(first: str, second: str) -> int:
+    # by bisection over slice comparisons, which run in C, rather than comparing a character at a time
+    low, high = 0, min(len(first), len(second))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[:middle] == second[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def make_char_patch(old: str, new: str) -> list[tuple[int, int, str]]:
+    """
+    The character delta turning `old` into `new`, for text without lines to compare: `(start, end, text)` replaces
+    characters `start:end` of `old`, between what both start and end with, by `text`.
+    """
+    start = _common_prefix_length(old, new)
+    end = _common_prefix_length(old[start:][::-1], new[start:][::-1])
+    return [(start, len(old) - end, new[start : len(new) - end])]
+
+
+def apply_char_patch(value: str, ops: Iterable[tuple[int, int, str]]) -> str:
+    # from the end, so that earlier positions still hold
+    for start, end, text in sorted(ops, reverse=True):
+        value = value[:start] + text + value[end:]
+    return value
+
+
+_PATCHES: dict[str, Callable[[Any, Any], Any]] = {
+    JSON_PATCH: apply_json_patch,
+    TEXT_PATCH: apply_text_patch,
+    CHAR_PATCH: apply_char_patch,
+}
+
+
+def encode_diff(diff: dict[str, Any], threshold: int) -> dict[str, Any]:
+    """
+    Replaces the `old` and `new` values of each column of an update `diff` with a delta between them,
+    if both are JSON objects/arrays or text of at least `threshold` characters and the delta is smaller.
+    Text is compared by lines, or else, if it's all on one line, by characters.
+    """
+    encoded = {}
+    for key, values in diff.items():
+        old, new = values["old"], values["new"]
+        encoded[key] = values
+        patch: Any
+        if isinstance(old, str) and isinstance(new, str):
+            if len(new) >= threshold:
+                patch_key, patch = (
+                    (TEXT_PATCH, make_text_patch(old, new)) if "\n" in new else (CHAR_PATCH, make_char_patch(old, new))
+                )
+                if _size(patch) < len(new):
+                    encoded[key] = {patch_key: patch}
+        elif isinstance(old, (dict, list)) and isinstance(new, (dict, list)):
+            size = _size(new)
+            if size >= threshold:
+                patch = make_json_patch(old, new)
+                if _size(patch) < size:
+                    encoded[key] = {JSON_PATCH: patch}
+    return encoded
+
+
+def resolve_diff(
+    log: ChangeLog, current: dict[str, Any], blobs: Optional[Mapping[str, bytes]] = None
+) -> dict[str, Any]:
+    """
+    The diff of `log` resolved like in `resolve_diffs`, given the `current` values of its record after the earlier logs,
+    which are updated with its new values.
+    """
+    if log.type == OpType.DELETE:
+        current.clear()
+    diff = {}
+    for key, values in log.diff.items():
+        if blobs is not None and "new" in values:
+            values = {side: dereference(value, blobs) for side, value in values.items()}
+        patch_key = next((patch_key for patch_key in _PATCHES if patch_key in values), None)
+        if patch_key is not None:
+            if key not in current:
+                raise ValueError(f"Can't reconstruct {key!r} of log {log.id}: no earlier value of it was logged")
+            old = current[key]
+            values = {"old": old, "new": _PATCHES[patch_key](old, values[patch_key])}
+        diff[key] = values
+        current[key] = values["new"]
+    return diff
+
+
+def resolve_diffs(history: Iterable[ChangeLog], blobs: Optional[Mapping[str, bytes]] = None) -> list[dict[str, Any]]:
+    """
+    The diffs of `history`, the change logs of a single record ordered by id, with `old` and `new` values
+    reconstructed for the columns that were stored as deltas, and taken from `blobs` for those moved to the blob store
+    (see `resql.change_blob.load_blobs`).
+    Raises `ValueError` if a delta's base isn't in `history`, e.g. if the record was changed before being logged.
+    """
+    current: dict[str, Any] = {}
+    return [resolve_diff(log, current, blobs) for log in history]
@@ -0,0 +1,358 @@
+"""
+Converts column values and statement parameters to JSON-native values, with a converter chosen once per column type,
+and serializes JSON with the fastest library installed: orjson, python-rapidjson or else the standard library.
+
+Datetimes, dates and times become ISO 8601 strings, decimals strings, intervals seconds, UUIDs canonical strings
+and enums what their `Enum` column stores (their names, unless it has a `values_callable`), or else their values,
+as orjson writes them.
+Bytes are left to the blob store (see `resql.change_blob`), or else base64-encoded when written (see `JSONDocument`).
+`get_decoder` turns them back into the Python values of a column type.
+"""
+import base64
+import binascii
+import datetime as dt
+import enum
+import functools
+import json
+import uuid
+import weakref
+from decimal import Decimal
+from typing import Any, Callable, Optional, Sequence, Union, cast
+
+from sqlalchemy import types
+from sqlalchemy.engine import Compiled
+from sqlalchemy.orm import Mapper
+
+Converter = Callable[[Any], Any]
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment]
+try:
+    import rapidjson
+except ImportError:  # pragma: no cover
+    rapidjson = None  # type: ignore[assignment]
+
+
+def _to_iso(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (dt.date, dt.time)) else value
+
+
+def _to_seconds(value: Any) -> Any:
+    return value.total_seconds() if isinstance(value, dt.timedelta) else value
+
+
+def _to_value(value: Any) -> Any:
+    return value.value
+
+
+def _to_string(value: Any) -> Any:
+    return str(value) if isinstance(value, (Decimal, uuid.UUID)) else value
+
+
+def _to_base64(value: Any) -> str:
+    return base64.b64encode(value).decode()
+
+
+# by the class of a value, or of one of its bases
+_VALUE_ENCODERS: dict[type, Converter] = {
+    dt.date: _to_iso,
+    dt.time: _to_iso,
+    dt.timedelta: _to_seconds,
+    enum.Enum: _to_value,
+    Decimal: str,
+    uuid.UUID: str,
+    bytes: _to_base64,
+    bytearray: _to_base64,
+    memoryview: _to_base64,
+}
+
+
+_value_encoders_by_class: dict[type, Optional[Converter]] = {}
+
+
+def _find_value_encoder(cls: type) -> Optional[Converter]:
+    if cls not in _value_encoders_by_class:
+        encoder = next((_VALUE_ENCODERS[base] for base in cls.__mro__ if base in _VALUE_ENCODERS), None)
+        _value_encoders_by_class[cls] = encoder
+    return _value_encoders_by_class[cls]
+
+
+def encode_value(value: Any) -> Any:
+    """The JSON-native form of a value JSON can't hold, for use as the `default` of JSON serializers."""
+    encoder = _find_value_encoder(type(value))
+    if encoder is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return encoder(value)
+
+
+def to_json_value(value: Any) -> Any:
+    """`value` in its JSON-native form, if it has one, for values whose column type isn't known."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return value
+    encoder = _find_value_encoder(type(value))
+    return value if encoder is None else encoder(value)
+
+
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+
+def to_json_document(value: Any) -> Any:
+    """
+    `value` with whatever JSON can't hold, however deeply nested, in its JSON-native form, bytes base64-encoded,
+    so that any JSON serializer can write it.
+    """
+    if isinstance(value, _JSON_SCALARS):
+        return value
+    if isinstance(value, dict):
+        return {key: to_json_document(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_document(item) for item in value]
+    return encode_value(value)
+
+
+_BINARY_TYPES = (types.LargeBinary, types.BINARY, types.VARBINARY)
+# by column type, most specific first. Types not listed here, or decorated, are converted by the type of each value
+_TYPE_CONVERTERS: Sequence[tuple[Union[type, tuple[type, ...]], Optional[Converter]]] = (
+    (types.Interval, _to_seconds),
+    (types.TypeDecorator, to_json_value),
+    (types.DateTime, _to_iso),
+    (types.Date, _to_iso),
+    (types.Time, _to_iso),
+    (types.Numeric, _to_string),
+    (types.Integer, None),
+    (types.String, None),
+    (types.Boolean, None),
+    (_BINARY_TYPES, None),
+    (types.JSON, None),
+)
+
+
+_converters_by_class: dict[type, Optional[Converter]] = {}
+# by `Enum` column type, since what each stores depends on its arguments
+_enum_converters: "weakref.WeakKeyDictionary[types.Enum, Optional[tuple[Converter, Converter]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_enum_converters(type_: types.Enum) -> Optional[tuple[Converter, Converter]]:
+    """What turns members of the enum class of `type_` into what it stores, and back, or `None` for strings only."""
+    if type_ not in _enum_converters:
+        enum_class, enums = getattr(type_, "enum_class"), getattr(type_, "enums")
+        converters = None
+        if enum_class is not None:
+            # in the same order as SQLAlchemy lists them, aliases included
+            members = list(enum_class.__members__.values())
+            stored, by_stored = dict(zip(members, enums)), dict(zip(enums, members))
+            converters = (lambda value: stored.get(value, value), lambda value: by_stored.get(value, value))
+        _enum_converters[type_] = converters
+    return _enum_converters[type_]
+
+
+def get_converter(type_: types.TypeEngine) -> Optional[Converter]:  # type: ignore[type-arg]
+    """What turns the values of `type_` into JSON-native ones, or `None` if they already are."""
+    if isinstance(type_, types.Enum):
+        converters = _get_enum_converters(type_)
+        return None if converters is None else converters[0]
+    cls = type(type_)
+    if cls not in _converters_by_class:
+        converter = next((converter for base, converter in _TYPE_CONVERTERS if issubclass(cls, base)), to_json_value)
+        _converters_by_class[cls] = converter
+    return _converters_by_class[cls]
+
+
+@functools.lru_cache(maxsize=None)
+def get_column_converters(mapper: Mapper) -> dict[str, Converter]:
+    """The converters of the mapped columns of `mapper` that need one, by attribute key."""
+    converters = {}
+    for prop in mapper.column_attrs:
+        converter = get_converter(prop.columns[0].type)
+        if converter is not None:
+            converters[prop.key] = converter
+    return converters
+
+
+def convert_parameters(compiled: Optional[Compiled], parameter_sets: Sequence[dict[str, Any]]) -> list[dict[str, Any]]:
+    """The compiled parameters of a statement, each converted according to the type of its bind parameter."""
+    if not parameter_sets or not parameter_sets[0]:
+        return list(parameter_sets)
+    binds = getattr(compiled, "binds", {})
+    converters = {}
+    for key in parameter_sets[0]:
+        # values of expanded `IN` lists don't have a bind parameter of their own
+        converter = get_converter(binds[key].type) if key in binds else to_json_value
+        if converter is not None:
+            converters[key] = converter
+    if not converters:
+        return list(parameter_sets)
+    return [
+        {
+            key: value if value is None or key not in converters else converters[key](value)
+            for key, value in params.items()
+        }
+        for params in parameter_sets
+    ]
+
+
+# the types of parameters that aren't passed to the driver as they're logged, by the class of their values
+_PARAMETER_TYPES: Sequence[tuple[Union[type, tuple[type, ...]], str]] = (
+    (dt.datetime, "datetime"),
+    (dt.date, "date"),
+    (dt.time, "time"),
+    (dt.timedelta, "interval"),
+    (Decimal, "decimal"),
+    ((bytes, bytearray, memoryview), "binary"),
+)
+# what each is bound as on replay
+_PARAMETER_BIND_TYPES: dict[str, types.TypeEngine] = {  # type: ignore[type-arg]
+    "datetime": types.DateTime(),
+    "date": types.Date(),
+    "time": types.Time(),
+    "interval": types.Interval(),
+    "decimal": types.Numeric(asdecimal=True),
+    "binary": types.LargeBinary(),
+}
+
+
+def get_parameter_types(parameter_sets: Sequence[dict[str, Any]]) -> Optional[dict[str, str]]:
+    """
+    The type of each parameter that is converted when logged, like `"datetime"`, by the class of its first value
+    that isn't `None`, or `None` if there are none. Logged along with them, so that they can be replayed.
+    """
+    parameter_types = {}
+    for key in parameter_sets[0] if parameter_sets else ():
+        value = next((params[key] for params in parameter_sets if params.get(key) is not None), None)
+        if value is None or isinstance(value, _JSON_SCALARS):
+            continue
+        parameter_type = next((name for cls, name in _PARAMETER_TYPES if isinstance(value, cls)), None)
+        if parameter_type is not None:
+            parameter_types[key] = parameter_type
+    return parameter_types or None
+
+
+# by dialect, then parameter type
+_bind_processors: "weakref.WeakKeyDictionary[Any, dict[str, Optional[Converter]]]" = weakref.WeakKeyDictionary()
+
+
+def _get_bind_processor(dialect: Any, parameter_type: str) -> Optional[Converter]:
+    processors = _bind_processors.setdefault(dialect, {})
+    if parameter_type not in processors:
+        type_ = _PARAMETER_BIND_TYPES[parameter_type]
+        processors[parameter_type] = type_.dialect_impl(dialect).bind_processor(dialect)
+    return processors[parameter_type]
+
+
+def decode_parameters(
+    parameter_sets: Sequence[dict[str, Any]], parameter_types: Optional[dict[str, str]]
+) -> list[dict[str, Any]]:
+    """Logged parameters with those of `parameter_types` (see `get_parameter_types`) decoded back into Python values."""
+    if not parameter_types:
+        return list(parameter_sets)
+    decoders = {key: cast(Converter, get_decoder(_PARAMETER_BIND_TYPES[name])) for key, name in parameter_types.items()}
+    return [
+        {key: value if value is None or key not in decoders else decoders[key](value) for key, value in params.items()}
+        for params in parameter_sets
+    ]
+
+
+def to_driver_parameters(
+    dialect: Any, parameter_sets: Sequence[dict[str, Any]], parameter_types: Optional[dict[str, str]]
+) -> list[dict[str, Any]]:
+    """
+    Parameters, with those of `parameter_types` as Python values, as they'd be passed to the driver of `dialect`:
+    processed like their type does when binding them.
+    """
+    processors = {}
+    for key, name in (parameter_types or {}).items():
+        processor = _get_bind_processor(dialect, name)
+        if processor is not None:
+            processors[key] = processor
+    if not processors:
+        return list(parameter_sets)
+    return [
+        {
+            key: value if value is None or key not in processors else processors[key](value)
+            for key, value in params.items()
+        }
+        for params in parameter_sets
+    ]
+
+
+def _from_iso(parse: Callable[[str], Any]) -> Converter:
+    return lambda value: parse(value) if isinstance(value, str) else value
+
+
+def _from_seconds(value: Any) -> Any:
+    return dt.timedelta(seconds=value) if isinstance(value, (int, float)) else value
+
+
+def _from_decimal_string(value: Any) -> Any:
+    return Decimal(value) if isinstance(value, str) else value
+
+
+def _from_base64(value: Any) -> Any:
+    if not isinstance(value, str):
+        return value
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        return value
+
+
+_TEMPORAL_DECODERS: Sequence[tuple[type, Converter]] = (
+    (types.DateTime, _from_iso(dt.datetime.fromisoformat)),
+    (types.Date, _from_iso(dt.date.fromisoformat)),
+    (types.Time, _from_iso(dt.time.fromisoformat)),
+)
+
+
+def get_decoder(type_: types.TypeEngine) -> Optional[Converter]:  # type: ignore[type-arg]
+    """What turns the JSON-native values of `type_` back into its Python values, or `None` if they already are."""
+    if isinstance(type_, types.Interval):
+        return _from_seconds
+    if isinstance(type_, types.Enum):
+        converters = _get_enum_converters(type_)
+        return None if converters is None else converters[1]
+    # decorated types, like `UtcDateTime`, are only known to take the values of their implementation if it's temporal
+    temporal_type = type_.impl if isinstance(type_, types.TypeDecorator) else type_
+    temporal_decoder = next((decoder for base, decoder in _TEMPORAL_DECODERS if isinstance(temporal_type, base)), None)
+    if temporal_decoder is not None or isinstance(type_, types.TypeDecorator):
+        return temporal_decoder
+    if isinstance(type_, types.Numeric) and type_.asdecimal:
+        return _from_decimal_string
+    if isinstance(type_, _BINARY_TYPES):
+        return _from_base64
+    return None
+
+
+def decode_row(table: Any, row: dict[str, Any]) -> dict[str, Any]:
+    """`row`, with logged values of the columns of `table` decoded back into Python values."""
+    decoded = dict(row)
+    for key, value in row.items():
+        if value is not None and key in table.c:
+            decoder = get_decoder(table.c[key].type)
+            if decoder is not None:
+                decoded[key] = decoder(value)
+    return decoded
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(value: Any) -> str:
+        return orjson.dumps(value, default=encode_value, option=_ORJSON_OPTIONS).decode()
+
+    loads: Callable[[Any], Any] = orjson.loads
+elif rapidjson is not None:  # pragma: no cover
+
+    def dumps(value: Any) -> str:
+        return rapidjson.dumps(value, default=encode_value)
+
+    loads = rapidjson.loads
+else:  # pragma: no cover
+
+    def dumps(value: Any) -> str:
+        return json.dumps(value, default=encode_value, separators=(",", ":"))
+
+    loads = json.loads
@@ -0,0 +1,78 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from resql.util import get_sibling_table, hash_json, json_type
+
+TABLE_NAME = "log_context"
+
+
+def default_table(metadata: MetaData) -> Table:
+    if TABLE_NAME in metadata.tables:
+        return metadata.tables[TABLE_NAME]
+    return Table(
+        TABLE_NAME,
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("extra", json_type(), nullable=False),
+        Column("hash", String(64), nullable=False, unique=True),
+    )
+
+
+def get_table(log_class: type) -> Table:
+    """The `log_context` table living alongside the table that `log_class` is mapped to."""
+    return get_sibling_table(log_class, TABLE_NAME)
+
+
+def hash_extra(extra: dict[str, Any]) -> str:
+    return hash_json(extra)
+
+
+@dataclass
+class LogContextCache:
+    """
+    Maps each distinct `extra` to the id of the `log_context` row that stores it.
+
+    Meant to be shared by every logger writing to the same database,
+    so that a given `extra` is looked up or inserted only once per process.
+    """
+
+    ids: dict[tuple[Table, str], int] = field(default_factory=dict)
+
+    def get_id(self, engine: Engine, table: Table, extra: dict[str, Any]) -> int:
+        digest = hash_extra(extra)
+        context_id = self.ids.get((table, digest))
+        if context_id is None:
+            context_id = self.ids[(table, digest)] = _get_or_insert(engine, table, digest, extra)
+        return context_id
+
+
+def _get_or_insert(engine: Engine, table: Table, digest: str, extra: dict[str, Any]) -> int:
+    query = select(table.c.id).where(table.c.hash == digest)
+    with engine.connect() as conn:
+        context_id: Optional[int] = conn.execute(query).scalar()
+    if context_id is not None:
+        return context_id
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(insert(table).values(extra=extra, hash=digest))
+            return int(result.inserted_primary_key[0])
+    except IntegrityError:
+        # another process inserted the same context in the meantime
+        with engine.connect() as conn:
+            return int(conn.execute(query).scalar_one())
+
+
+def resolve_extra(
+    cache: Optional[LogContextCache],
+    engine: Optional[Engine],
+    log_class: type,
+    extra: Optional[dict[str, Any]],
+) -> tuple[Optional[dict[str, Any]], Optional[int]]:
+    """Returns the `(extra, context_id)` pair to be saved in each log."""
+    if cache is None or engine is None or extra is None:
+        return extra, None
+    return None, cache.get_id(engine, get_table(log_class), extra)
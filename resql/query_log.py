@@ -2,13 +2,16 @@ import datetime as dt
 from dataclasses import dataclass, field
 from typing import Any, Optional
 
-from sqlalchemy import JSON, Column, Integer, MetaData, String, Table, Text
+from sqlalchemy import BigInteger, Column, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text
 from sqlalchemy.orm import registry
 from sqlalchemy_utc import UtcDateTime
 
+from resql import log_context, query_stats
+from resql.util import add_gin_index, json_type
+
 
 @dataclass
-class QueryLog:
+class QueryLog:  # pylint: disable=too-many-instance-attributes
     id: int = field(init=False)
     dialect_description: str
     executed_at: dt.datetime
@@ -16,23 +19,43 @@ class QueryLog:
     parameters: list[dict[str, Any]]
     statement: str
     type: str
+    context_id: Optional[int] = None
+    # in seconds, only filled when the logger times statements
+    duration: Optional[float] = None
+    row_count: Optional[int] = None
+    # the types of the parameters that were converted to be logged, to decode them with on replay
+    parameter_types: Optional[dict[str, str]] = None
 
 
-def default_table(metadata: MetaData) -> Table:
-    return Table(
+def default_table(metadata: MetaData, *, gin_indexes: bool = False) -> Table:
+    """On PostgreSQL, `extra` and `parameters` are `JSONB` and, with `gin_indexes`, indexed for `@>` searches."""
+    log_context.default_table(metadata)
+    table = Table(
         "query_log",
         metadata,
-        Column("id", Integer, primary_key=True),
+        # 64-bit to hold ids from `resql.ids.HybridLogicalClock` (SQLite only autoincrements INTEGER, also 64-bit)
+        Column("id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+        Column("context_id", ForeignKey(f"{log_context.TABLE_NAME}.id"), nullable=True),
         Column("dialect_description", String(64), nullable=False),
+        Column("duration", Float, nullable=True),
         Column("executed_at", UtcDateTime, nullable=False),
-        Column("extra", JSON, nullable=True),
-        Column("parameters", JSON, nullable=True),
+        Column("extra", json_type(), nullable=True),
+        Column("parameters", json_type(), nullable=True),
+        Column("parameter_types", json_type(), nullable=True),
+        Column("row_count", Integer, nullable=True),
         Column("statement", Text, nullable=False),
         Column("type", String(32), nullable=False),
+        # BRIN is tiny and fits append-only tables, where rows are physically ordered by time. B-tree elsewhere
+        Index("ix_query_log_executed_at", "executed_at", postgresql_using="brin"),
     )
+    if gin_indexes:
+        add_gin_index(table, "extra")
+        add_gin_index(table, "parameters")
+    return table
 
 
-def map_default() -> registry:
+def map_default(*, gin_indexes: bool = False) -> registry:
     mapper_registry = registry()
-    mapper_registry.map_imperatively(QueryLog, default_table(mapper_registry.metadata))
+    mapper_registry.map_imperatively(QueryLog, default_table(mapper_registry.metadata, gin_indexes=gin_indexes))
+    mapper_registry.map_imperatively(query_stats.QueryStat, query_stats.default_table(mapper_registry.metadata))
     return mapper_registry
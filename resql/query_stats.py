@@ -0,0 +1,182 @@
+import bisect
+import datetime as dt
+import functools
+import hashlib
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, Text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy_utc import UtcDateTime
+
+from resql.util import now_in_utc
+from resql.worker import BackgroundWorker
+
+
+@dataclass
+class QueryStat:  # pylint: disable=too-many-instance-attributes
+    id: int = field(init=False)
+    calls: int
+    dialect_description: str
+    fingerprint: str
+    max_duration: float
+    min_duration: float
+    p50_duration: float
+    p95_duration: float
+    p99_duration: float
+    period_end: dt.datetime
+    period_start: dt.datetime
+    row_count: int
+    statement: str
+    total_duration: float
+
+
+def default_table(metadata: MetaData) -> Table:
+    return Table(
+        "query_stat",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("calls", Integer, nullable=False),
+        Column("dialect_description", String(64), nullable=False),
+        Column("fingerprint", String(32), nullable=False, index=True),
+        Column("max_duration", Float, nullable=False),
+        Column("min_duration", Float, nullable=False),
+        Column("p50_duration", Float, nullable=False),
+        Column("p95_duration", Float, nullable=False),
+        Column("p99_duration", Float, nullable=False),
+        Column("period_end", UtcDateTime, nullable=False),
+        Column("period_start", UtcDateTime, nullable=False),
+        Column("row_count", Integer, nullable=False),
+        Column("statement", Text, nullable=False),
+        Column("total_duration", Float, nullable=False),
+    )
+
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+# `?`, `%s`, `%(name)s`, `:name`, `$1` and SQLAlchemy's "expanding" IN placeholders
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+|\$\d+|__\[POSTCOMPILE_\w+\]|\?")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES_LIST = re.compile(r"(VALUES\s*\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+", re.IGNORECASE)
+# bounded, since statements with inlined literals would otherwise grow the cache forever
+MAX_CACHED_STATEMENTS = 10_000
+
+
+@functools.lru_cache(maxsize=MAX_CACHED_STATEMENTS)
+def normalize(statement: str) -> str:
+    """Reduces `statement` to its shape by replacing literals and placeholders with `?` and collapsing lists."""
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    normalized = _STRING_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(...)", normalized)
+    return _VALUES_LIST.sub(r"\1", normalized)
+
+
+def fingerprint(normalized_statement: str) -> str:
+    return hashlib.md5(normalized_statement.encode()).hexdigest()
+
+
+# histogram buckets growing by ~19% from 1µs up to ~10min, so percentiles are within that error margin
+BUCKET_BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(118)]
+
+
+class _Stat:
+    __slots__ = ("calls", "dialect_description", "histogram", "max", "min", "rows", "total")
+
+    def __init__(self, dialect_description: str) -> None:
+        self.calls = 0
+        self.dialect_description = dialect_description
+        self.histogram = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.max = 0.0
+        self.min = float("inf")
+        self.rows = 0
+        self.total = 0.0
+
+    def percentile(self, fraction: float) -> float:
+        rank = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                # report the bucket's upper bound, but never past what was actually observed
+                return min(BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.max, self.max)
+        return self.max
+
+
+class StatementAggregator:
+    """
+    Keeps per-statement-fingerprint execution statistics in memory,
+    writing them to the `query_stat` table every `flush_interval` seconds (and on `flush()`).
+
+    Each written row covers the period since the previous flush.
+    If a `worker` is given, writing happens in its thread instead of the thread that triggered it.
+    """
+
+    def __init__(
+        self,
+        target_engine: Engine,
+        flush_interval: float = 60.0,
+        worker: Optional[BackgroundWorker] = None,
+    ) -> None:
+        self.session_maker = sessionmaker(target_engine, future=True)
+        self.flush_interval = flush_interval
+        self.worker = worker
+        self._lock = threading.Lock()
+        self._stats: dict[str, _Stat] = {}
+        self._period_start = now_in_utc()
+        self._next_flush = time.monotonic() + flush_interval
+
+    def record(self, dialect_description: str, statement: str, duration: float, row_count: int) -> None:
+        normalized = normalize(statement)
+        with self._lock:
+            stat = self._stats.get(normalized)
+            if stat is None:
+                stat = self._stats[normalized] = _Stat(dialect_description)
+            stat.calls += 1
+            stat.total += duration
+            stat.max = max(stat.max, duration)
+            stat.min = min(stat.min, duration)
+            stat.rows += max(row_count, 0)
+            stat.histogram[bisect.bisect_left(BUCKET_BOUNDS, duration)] += 1
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            period_start, period_end = self._period_start, now_in_utc()
+            self._period_start = period_end
+            self._next_flush = time.monotonic() + self.flush_interval
+        if not stats:
+            return
+        if self.worker is None:
+            self._write(stats, period_start, period_end)
+        else:
+            self.worker.submit(self._write, stats, period_start, period_end)
+
+    def _write(self, stats: dict[str, _Stat], period_start: dt.datetime, period_end: dt.datetime) -> None:
+        with self.session_maker.begin() as session:  # pylint: disable=no-member
+            for statement, stat in stats.items():
+                session.add(
+                    QueryStat(
+                        calls=stat.calls,
+                        dialect_description=stat.dialect_description,
+                        fingerprint=fingerprint(statement),
+                        max_duration=stat.max,
+                        min_duration=stat.min,
+                        p50_duration=stat.percentile(0.50),
+                        p95_duration=stat.percentile(0.95),
+                        p99_duration=stat.percentile(0.99),
+                        period_end=period_end,
+                        period_start=period_start,
+                        row_count=stat.rows,
+                        statement=statement,
+                        total_duration=stat.total,
+                    )
+                )
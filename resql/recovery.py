@@ -0,0 +1,196 @@
+import datetime as dt
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional, Sequence
+
+from sqlalchemy import MetaData, bindparam, delete, insert, select, tuple_, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from resql import log_context
+from resql.change_blob import find_references, load_blobs
+from resql.change_log import ChangeLog, OpType
+from resql.deltas import resolve_diffs
+from resql.encoding import decode_row
+from resql.util import MAX_PARAMETERS, chunked
+
+# how many record ids go in each `IN (...)`, to stay below the parameter limits of every dialect
+CHUNK_SIZE = 500
+_RECORD_ID = "resql_record_id"
+
+RecordKey = tuple[str, int]
+
+
+@dataclass
+class InverseOp:
+    """The operation that takes a record back to how it was before the undone changes."""
+
+    table_name: str
+    record_id: int
+    type: OpType
+    values: dict[str, Any]
+
+
+def fold(logs: Sequence[ChangeLog], diffs: Optional[Sequence[dict[str, Any]]] = None) -> Optional[dict[str, Any]]:
+    """
+    The values of a record after the given changes, oldest first, or `None` if they leave it deleted.
+    Only values that appear in the diffs are known, so records that existed before logging began are partial.
+    `diffs` are those of `logs` already resolved with `resolve_diffs`, if at hand.
+    """
+    values: Optional[dict[str, Any]] = None
+    for log, diff in zip(logs, resolve_diffs(logs) if diffs is None else diffs):
+        if log.type == OpType.DELETE:
+            values = None
+        else:
+            values = {**(values or {}), **{key: change["new"] for key, change in diff.items()}}
+    return values
+
+
+def _invert(history: Sequence[ChangeLog], first_undone_id: int, blobs: Mapping[str, bytes]) -> Optional[InverseOp]:
+    """Given the whole `history` of a record, the operation that reverts it to before the log `first_undone_id`."""
+    split = next(index for index, log in enumerate(history) if log.id >= first_undone_id)
+    before, undone = history[:split], history[split:]
+    diffs = resolve_diffs(history, blobs)
+    existed_before = undone[0].type != OpType.INSERT if not before else before[-1].type != OpType.DELETE
+    exists_now = history[-1].type != OpType.DELETE
+    record_id = history[0].record_id
+    if not existed_before:
+        return InverseOp(history[0].table_name, record_id, OpType.DELETE, {}) if exists_now else None
+    # values that weren't changed before the undone logs are known from the first undone change to them
+    values = fold(before, diffs[:split]) or {}
+    for diff in diffs[split:]:
+        for key, change in diff.items():
+            values.setdefault(key, change["old"])
+    if not exists_now:
+        return InverseOp(history[0].table_name, record_id, OpType.INSERT, {**values, "id": record_id})
+    if all(log.type == OpType.UPDATE for log in undone):
+        changed = {key for log in undone for key in log.diff}
+        values = {key: value for key, value in values.items() if key in changed}
+    return InverseOp(history[0].table_name, record_id, OpType.UPDATE, values) if values else None
+
+
+def _get_context_extras(session: Session, logs: Sequence[ChangeLog]) -> dict[int, dict[str, Any]]:
+    context_ids = sorted({log.context_id for log in logs if log.context_id is not None})
+    table = log_context.get_table(ChangeLog)
+    extras: dict[int, dict[str, Any]] = {}
+    for start in range(0, len(context_ids), CHUNK_SIZE):
+        query = select(table.c.id, table.c.extra).where(table.c.id.in_(context_ids[start : start + CHUNK_SIZE]))
+        extras.update((row.id, row.extra) for row in session.execute(query))
+    return extras
+
+
+def _get_extra(log: ChangeLog, context_extras: dict[int, dict[str, Any]]) -> dict[str, Any]:
+    if log.context_id is not None:
+        return context_extras[log.context_id]
+    return log.extra or {}
+
+
+def _get_histories(session: Session, keys: Iterable[RecordKey]) -> dict[RecordKey, list[ChangeLog]]:
+    record_ids_by_table: dict[str, list[int]] = {}
+    for table_name, record_id in keys:
+        record_ids_by_table.setdefault(table_name, []).append(record_id)
+    histories: dict[RecordKey, list[ChangeLog]] = {}
+    for table_name, record_ids in record_ids_by_table.items():
+        for start in range(0, len(record_ids), CHUNK_SIZE):
+            query = (
+                select(ChangeLog)
+                .where(ChangeLog.table_name == table_name)
+                .where(ChangeLog.record_id.in_(record_ids[start : start + CHUNK_SIZE]))  # type: ignore[attr-defined]
+                .order_by(ChangeLog.id)
+            )
+            for log in session.execute(query).scalars():
+                histories.setdefault((log.table_name, log.record_id), []).append(log)
+    return histories
+
+
+def plan_undo(
+    session: Session,
+    *,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    extra: Optional[dict[str, Any]] = None,
+    records: Optional[Iterable[RecordKey]] = None,
+) -> list[InverseOp]:
+    """
+    Computes, from the change logs in `session`, the operations that revert every record changed
+    between `since` (inclusive) and `until` (exclusive), by logs whose `extra` contains `extra`,
+    and whose `(table_name, record_id)` is in `records`, to how it was before its first such change.
+
+    Later changes to the same records are reverted as well, since they were built on top of the undone ones.
+    """
+    query = select(ChangeLog).order_by(ChangeLog.id)
+    if since is not None:
+        query = query.where(ChangeLog.executed_at >= since)
+    if until is not None:
+        query = query.where(ChangeLog.executed_at < until)
+    logs: Sequence[ChangeLog]
+    if records is None:
+        logs = session.execute(query).scalars().all()
+    else:
+        # filtered in the database, by `ix_change_log_table_name_record_id`, two parameters per record
+        key: Any = tuple_(getattr(ChangeLog, "table_name"), getattr(ChangeLog, "record_id"))
+        chunks = chunked(sorted(set(records)), MAX_PARAMETERS // 2)
+        logs = sorted(
+            (log for chunk in chunks for log in session.execute(query.where(key.in_(chunk))).scalars()),
+            key=lambda log: log.id,
+        )
+    if extra is not None:
+        context_extras = _get_context_extras(session, logs)
+        logs = [log for log in logs if extra.items() <= _get_extra(log, context_extras).items()]
+    first_undone_ids: dict[RecordKey, int] = {}
+    for log in logs:
+        first_undone_ids.setdefault((log.table_name, log.record_id), log.id)
+    histories = _get_histories(session, first_undone_ids)
+    blobs = load_blobs(session, ChangeLog, find_references(log.diff for logs in histories.values() for log in logs))
+    inverse_ops = (_invert(histories[key], first_undone_id, blobs) for key, first_undone_id in first_undone_ids.items())
+    return [inverse_op for inverse_op in inverse_ops if inverse_op is not None]
+
+
+def apply_inverse_ops(conn: Connection, metadata: MetaData, inverse_ops: Iterable[InverseOp]) -> None:
+    """
+    Applies `inverse_ops` to the tables of `metadata` as batches of `executemany`: reinserts first, parents first,
+    then updates, then deletes, children first, so that foreign keys hold along the way.
+    """
+    batches: dict[tuple[OpType, str, frozenset[str]], list[dict[str, Any]]] = {}
+    for inverse_op in inverse_ops:
+        row = dict(inverse_op.values)
+        if inverse_op.type != OpType.INSERT:
+            row[_RECORD_ID] = inverse_op.record_id
+        batches.setdefault((inverse_op.type, inverse_op.table_name, frozenset(row)), []).append(row)
+    tables = metadata.sorted_tables
+    for op_type, ordered_tables in (
+        (OpType.INSERT, tables),
+        (OpType.UPDATE, tables),
+        (OpType.DELETE, tables[::-1]),
+    ):
+        for table in ordered_tables:
+            for (batch_type, table_name, _), rows in batches.items():
+                if batch_type != op_type or table_name != table.name:
+                    continue
+                rows = [decode_row(table, row) for row in rows]
+                if op_type == OpType.INSERT:
+                    conn.execute(insert(table), rows)
+                elif op_type == OpType.UPDATE:
+                    conn.execute(update(table).where(table.c.id == bindparam(_RECORD_ID)), rows)
+                else:
+                    conn.execute(delete(table).where(table.c.id == bindparam(_RECORD_ID)), rows)
+
+
+def undo(  # pylint: disable=too-many-arguments
+    *,
+    source: Engine,
+    target: Engine,
+    metadata: MetaData,
+    since: Optional[dt.datetime] = None,
+    until: Optional[dt.datetime] = None,
+    extra: Optional[dict[str, Any]] = None,
+    records: Optional[Iterable[RecordKey]] = None,
+) -> list[InverseOp]:
+    """
+    Reverts changes logged to `source` (see `plan_undo`) in the tables of `metadata` in `target`,
+    in a single transaction, and returns the operations that were applied.
+    """
+    with Session(source, future=True) as session:
+        inverse_ops = plan_undo(session, since=since, until=until, extra=extra, records=records)
+    with target.begin() as conn:
+        apply_inverse_ops(conn, metadata, inverse_ops)
+    return inverse_ops
@@ -0,0 +1,297 @@
+"""
+Keeps a standby database up to date by tailing the query log of its primary and re-running each new statement on it,
+e.g. `QueryLogFollower(source=recovery_engine, target=standby_engine).start()`.
+
+Statements are replayed as they were compiled, so the standby must use the same dialect and driver as the primary.
+Parameters that were converted to be logged, like datetimes, are decoded and processed as their type would again.
+"""
+import datetime as dt
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import BigInteger, Column, MetaData, String, Table, delete, insert, select, update
+from sqlalchemy.engine import Connection, Engine, Row
+from sqlalchemy.sql import Select
+from sqlalchemy_utc import UtcDateTime
+
+from resql.encoding import decode_parameters, to_driver_parameters
+from resql.query_log import QueryLog
+from resql.util import now_in_utc
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "replication_position"
+APPLIED_TABLE_NAME = "replication_applied"
+# how many logs are fetched and applied in each transaction
+BATCH_SIZE = 1000
+# how many ids go in each `IN (...)`, to stay below the parameter limits of every dialect
+CHUNK_SIZE = 500
+POSITIONAL_PARAMSTYLES = ("qmark", "format")
+# the placeholder of an `IN` list, expanded to one parameter per value right before execution
+_POSTCOMPILE = re.compile(r"__\[POSTCOMPILE_(\w+)\]")
+
+
+def default_table(metadata: MetaData) -> Table:
+    """
+    Where each follower, by `name`, is: every log up to `settled_id` was applied or will never be, and those after it
+    that were applied are in the `replication_applied` table, created alongside. `last_id` is the highest applied.
+    """
+    Table(
+        APPLIED_TABLE_NAME,
+        metadata,
+        Column("name", String(64), primary_key=True),
+        Column("log_id", BigInteger, primary_key=True),
+        Column("executed_at", UtcDateTime, nullable=False),
+    )
+    return Table(
+        TABLE_NAME,
+        metadata,
+        Column("name", String(64), primary_key=True),
+        Column("last_id", BigInteger, nullable=False),
+        Column("settled_id", BigInteger, nullable=False),
+        Column("last_executed_at", UtcDateTime, nullable=True),
+        Column("updated_at", UtcDateTime, nullable=False),
+    )
+
+
+@dataclass
+class ReplicationStatus:
+    last_id: int
+    # when the last applied statement executed on the primary
+    last_executed_at: Optional[dt.datetime]
+    # how long ago the oldest statement not yet applied executed on the primary, zero when caught up
+    lag: dt.timedelta
+
+
+def _placeholder(paramstyle: str, name: str) -> str:
+    if paramstyle == "qmark":
+        return "?"
+    if paramstyle == "format":
+        return "%s"
+    if paramstyle == "named":
+        return f":{name}"
+    return f"%({name})s"
+
+
+def _expand(statement: str, parameters: dict[str, Any], paramstyle: str) -> str:
+    """`statement` with the placeholder of each `IN` list replaced by one per value, as named in `parameters`."""
+
+    def replace(match: "re.Match[str]") -> str:
+        name = match.group(1)
+        pattern = re.compile(rf"{re.escape(name)}_\d+")
+        names = [key for key in parameters if pattern.fullmatch(key)] or [name]
+        return ", ".join(_placeholder(paramstyle, key) for key in names)
+
+    return _POSTCOMPILE.sub(replace, statement)
+
+
+def apply_query_log(conn: Connection, log: Any) -> None:
+    """Re-runs the statement of `log`, a `QueryLog` or a row of its columns, unless it's a select."""
+    # slow selects are logged for diagnosis and change nothing
+    if log.type == "Select":
+        return
+    dialect_description = getattr(conn.dialect, "dialect_description")
+    if log.dialect_description != dialect_description:
+        raise ValueError(f"Query log {log.id} was compiled for {log.dialect_description}, not {dialect_description}")
+    paramstyle = conn.dialect.paramstyle
+    parameter_types = getattr(log, "parameter_types", None)
+    parameters = to_driver_parameters(
+        conn.dialect, decode_parameters(log.parameters or [{}], parameter_types), parameter_types
+    )
+    statement = _expand(log.statement, parameters[0], paramstyle)
+    # positional parameters were compiled, and so are ordered, as they appear in the statement
+    driver_parameters: list[Any] = [
+        tuple(values.values()) if paramstyle in POSITIONAL_PARAMSTYLES else values for values in parameters
+    ]
+    conn.exec_driver_sql(statement, driver_parameters[0] if len(driver_parameters) == 1 else driver_parameters)
+
+
+def _select_logs() -> Select:
+    log_id = getattr(QueryLog, "id")
+    columns = (
+        QueryLog.dialect_description,
+        QueryLog.executed_at,
+        QueryLog.parameters,
+        QueryLog.parameter_types,
+        QueryLog.statement,
+    )
+    return select(log_id, *columns, QueryLog.type).order_by(log_id)
+
+
+class QueryLogFollower:  # pylint: disable=too-many-instance-attributes
+    """
+    Applies the statements in the `query_log` of `source` to `target`, `batch_size` new logs per transaction,
+    saving which ones it applied under `name` in the `replication_position` and `replication_applied` tables of
+    `target` (created if missing) in that same transaction, so that every statement is applied exactly once across
+    restarts. A new follower starts after `start_id`.
+
+    Logs don't show up in id order: ids are assigned when statements execute (with `resql.ids.HybridLogicalClock`)
+    or when logs are inserted, but logs are only visible once written, at the commit of their transaction.
+    So new logs are applied in id order, waiting up to `gap_timeout` seconds for missing ids before going on without
+    them (`None` not to wait, e.g. for ids that aren't consecutive), and every poll also applies those that showed up
+    late, with ids below others already applied, as long as they did within `settle_time` seconds of executing.
+    That must be longer than the longest transaction, plus the time to write its logs: later ones are skipped.
+    Slow selects are skipped, and a log compiled for another dialect fails, and is retried by, its batch.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        *,
+        source: Engine,
+        target: Engine,
+        name: str = "default",
+        start_id: int = 0,
+        batch_size: int = BATCH_SIZE,
+        min_interval: float = 0.05,
+        max_interval: float = 5.0,
+        gap_timeout: Optional[float] = 1.0,
+        settle_time: float = 60.0,
+    ) -> None:
+        if target.dialect.paramstyle == "numeric":
+            raise ValueError("Replaying statements for the numeric paramstyle is not supported")
+        self.source = source
+        self.target = target
+        self.name = name
+        self.batch_size = batch_size
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.gap_timeout = gap_timeout
+        self.settle_time = settle_time
+        metadata = MetaData()
+        self.table = default_table(metadata)
+        self.applied_table = metadata.tables[APPLIED_TABLE_NAME]
+        metadata.create_all(target, checkfirst=True)
+        self._settled_id, self._last_executed_at, self._applied = self._load_position(start_id)
+        # the first missing id and when it was first found missing
+        self._gap: Optional[tuple[int, float]] = None
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_position(self, start_id: int) -> tuple[int, Optional[dt.datetime], dict[int, dt.datetime]]:
+        with self.target.begin() as conn:
+            query = select(self.table.c.settled_id, self.table.c.last_executed_at).where(self.table.c.name == self.name)
+            row = conn.execute(query).first()
+            if row is None:
+                position = dict(name=self.name, last_id=start_id, settled_id=start_id, updated_at=now_in_utc())
+                conn.execute(insert(self.table).values(**position))
+                return start_id, None, {}
+            applied = self.applied_table
+            query = select(applied.c.log_id, applied.c.executed_at).where(applied.c.name == self.name)
+            return (
+                row.settled_id,
+                row.last_executed_at,
+                {row.log_id: row.executed_at for row in conn.execute(query)},
+            )
+
+    @property
+    def last_id(self) -> int:
+        """The highest id applied."""
+        return max(self._applied, default=self._settled_id)
+
+    def poll(self) -> int:
+        """Applies the logs that showed up late and the next batch of new ones, and returns how many it applied."""
+        with self.source.connect() as conn:
+            # in id order, since late ones are below the last one applied, and new ones above it
+            rows = [*self._late_rows(conn), *self._new_rows(conn)]
+        applied = {**self._applied, **{row.id: row.executed_at for row in rows}}
+        # logs that executed before then were all written already, so none will show up below the last of those
+        settled_before = now_in_utc() - dt.timedelta(seconds=self.settle_time)
+        settled_id = max(
+            (log_id for log_id, executed_at in applied.items() if executed_at < settled_before),
+            default=self._settled_id,
+        )
+        applied = {log_id: executed_at for log_id, executed_at in applied.items() if log_id > settled_id}
+        if not rows and settled_id == self._settled_id:
+            return 0
+        last_id = max(applied, default=settled_id)
+        last_executed_at = rows[-1].executed_at if rows and rows[-1].id == last_id else self._last_executed_at
+        with self.target.begin() as conn:
+            for row in rows:
+                apply_query_log(conn, row)
+            applied_table = self.applied_table
+            unsettled = [
+                dict(name=self.name, log_id=row.id, executed_at=row.executed_at) for row in rows if row.id > settled_id
+            ]
+            if unsettled:
+                conn.execute(insert(applied_table), unsettled)
+            conn.execute(
+                delete(applied_table).where(applied_table.c.name == self.name, applied_table.c.log_id <= settled_id)
+            )
+            position = dict(
+                last_id=last_id,
+                settled_id=settled_id,
+                last_executed_at=last_executed_at,
+                updated_at=now_in_utc(),
+            )
+            conn.execute(update(self.table).where(self.table.c.name == self.name).values(**position))
+        self._settled_id, self._last_executed_at, self._applied = settled_id, last_executed_at, applied
+        return len(rows)
+
+    def _late_rows(self, conn: Connection) -> list[Row]:
+        """The logs below the last one applied that weren't applied yet, since they showed up after it."""
+        log_id = getattr(QueryLog, "id")
+        window = select(log_id).where(log_id > self._settled_id, log_id <= self.last_id)
+        missing = sorted(set(conn.execute(window).scalars()) - set(self._applied))
+        return [
+            row
+            for start in range(0, len(missing), CHUNK_SIZE)
+            for row in conn.execute(_select_logs().where(log_id.in_(missing[start : start + CHUNK_SIZE])))
+        ]
+
+    def _new_rows(self, conn: Connection) -> Sequence[Row]:
+        log_id = getattr(QueryLog, "id")
+        query = _select_logs().where(log_id > self.last_id).limit(self.batch_size)
+        return self._until_gap(conn.execute(query).all())
+
+    def _until_gap(self, rows: Sequence[Row]) -> Sequence[Row]:
+        """The logs before the first missing id, unless it's been missing for `gap_timeout` seconds already."""
+        expected = self.last_id + 1
+        for index, row in enumerate(rows):
+            if row.id != expected and self.gap_timeout is not None:
+                if self._gap is None or self._gap[0] != expected:
+                    self._gap = (expected, time.monotonic())
+                if time.monotonic() - self._gap[1] < self.gap_timeout:
+                    return rows[:index]
+            expected = row.id + 1
+        return rows
+
+    def status(self) -> ReplicationStatus:
+        log_id = getattr(QueryLog, "id")
+        query = select(QueryLog.executed_at).where(log_id > self.last_id).order_by(log_id).limit(1)
+        with self.source.connect() as conn:
+            oldest_pending: Optional[dt.datetime] = conn.execute(query).scalar()
+        lag = dt.timedelta(0) if oldest_pending is None else max(now_in_utc() - oldest_pending, dt.timedelta(0))
+        return ReplicationStatus(last_id=self.last_id, last_executed_at=self._last_executed_at, lag=lag)
+
+    def run(self) -> None:
+        """
+        Polls until `close`: right away while a backlog remains, and otherwise every `min_interval` seconds,
+        backing off up to `max_interval` while there is nothing new or applying fails.
+        """
+        interval = self.min_interval
+        while not self._closed.is_set():
+            try:
+                applied = self.poll()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Failed to apply the query log after id %d", self.last_id)
+                applied = 0
+            if applied >= self.batch_size:
+                continue
+            interval = self.min_interval if applied else min(max(interval * 2, self.min_interval), self.max_interval)
+            self._closed.wait(interval)
+
+    def start(self) -> None:
+        """Runs in a background thread."""
+        self._closed.clear()
+        self._thread = threading.Thread(target=self.run, name="resql-follower", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,230 @@
+import datetime as dt
+import pickle
+import sqlite3
+import tempfile
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, Optional, Sequence, cast
+
+from sqlalchemy import MetaData, Table, delete, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Insert
+
+from resql.change_blob import find_references, load_blobs
+from resql.change_log import ChangeLog, OpType
+from resql.deltas import resolve_diff
+from resql.encoding import decode_row
+from resql.util import chunked
+
+# how many logs are fetched and folded at a time
+CHUNK_SIZE = 1000
+# how many rows go in each `executemany`
+BATCH_SIZE = 5000
+# records deleted by the end of the log
+_DELETED = None
+_MISSING = object()
+
+RecordKey = tuple[str, int]
+
+
+class FoldedRecords:
+    """
+    The values of records, by `(table_name, record_id)`, or `None` for deleted ones. Up to `max_in_memory` of them
+    are kept in memory, past which they are all moved to a temporary SQLite file in `directory`.
+    """
+
+    def __init__(self, max_in_memory: int = 100_000, directory: Optional[str] = None) -> None:
+        self.max_in_memory = max_in_memory
+        self._directory = directory
+        self._memory: dict[RecordKey, Optional[dict[str, Any]]] = {}
+        self._spill: Optional[tempfile.TemporaryDirectory] = None  # type: ignore[type-arg]
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def __enter__(self) -> "FoldedRecords":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+    @property
+    def spilled(self) -> bool:
+        return self._conn is not None
+
+    def get(self, key: RecordKey, default: Any = None) -> Any:
+        if key in self._memory:
+            return self._memory[key]
+        if self._conn is not None:
+            row = self._conn.execute("SELECT state FROM records WHERE table_name = ? AND record_id = ?", key).fetchone()
+            if row is not None:
+                return pickle.loads(row[0])
+        return default
+
+    def __setitem__(self, key: RecordKey, values: Optional[dict[str, Any]]) -> None:
+        self._memory[key] = values
+        if len(self._memory) > self.max_in_memory:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._conn is None:
+            # cleaned up by `close`
+            self._spill = tempfile.TemporaryDirectory(  # pylint: disable=consider-using-with
+                prefix="resql-restore-", dir=self._directory
+            )
+            self._conn = sqlite3.connect(f"{self._spill.name}/records.sqlite3")
+            self._conn.execute(
+                "CREATE TABLE records (table_name TEXT, record_id INTEGER, state BLOB, "
+                "PRIMARY KEY (table_name, record_id))"
+            )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+            ((table_name, record_id, pickle.dumps(values)) for (table_name, record_id), values in self._memory.items()),
+        )
+        self._memory.clear()
+
+    def items(self, table_name: str) -> Iterator[tuple[int, Optional[dict[str, Any]]]]:
+        """The `(record_id, values)` of the records of `table_name`."""
+        if self._conn is None:
+            for (record_table_name, record_id), values in self._memory.items():
+                if record_table_name == table_name:
+                    yield record_id, values
+            return
+        self._flush()
+        query = "SELECT record_id, state FROM records WHERE table_name = ? ORDER BY record_id"
+        for record_id, state in self._conn.execute(query, (table_name,)):
+            yield record_id, pickle.loads(state)
+
+    def close(self) -> None:
+        self._memory.clear()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._spill is not None:
+            self._spill.cleanup()
+            self._spill = None
+
+
+@dataclass
+class RestoreStats:
+    upserted: int = 0
+    deleted: int = 0
+    # whether the folded records didn't fit in memory
+    spilled: bool = False
+
+
+def fold_logs(
+    session: Session,
+    table_names: Iterable[str],
+    records: FoldedRecords,
+    *,
+    until: Optional[dt.datetime] = None,
+    chunk_size: int = CHUNK_SIZE,
+    record_ids: Optional[tuple[int, int]] = None,
+) -> None:
+    """
+    Streams the change logs of `table_names` executed before `until`, `chunk_size` at a time, and folds them
+    into `records`, optionally only those of the records with ids between `record_ids` (inclusive).
+    Only values that appear in the diffs are known, so records that existed before logging began are partial.
+    """
+    query = select(ChangeLog).where(ChangeLog.table_name.in_(list(table_names)))  # type: ignore[attr-defined]
+    if until is not None:
+        query = query.where(ChangeLog.executed_at < until)
+    if record_ids is not None:
+        query = query.where(ChangeLog.record_id.between(*record_ids))  # type: ignore[attr-defined]
+    query = query.order_by(ChangeLog.id).execution_options(yield_per=chunk_size)
+    # blobs are loaded on a connection of their own, since that of a streaming cursor, like MySQL's,
+    # can't run other queries until the stream is exhausted
+    with session.get_bind().engine.connect() as blob_conn:
+        for logs in session.execute(query).scalars().partitions():
+            blobs = load_blobs(blob_conn, ChangeLog, find_references(log.diff for log in logs))
+            for log in logs:
+                key = (log.table_name, log.record_id)
+                if log.type == OpType.DELETE:
+                    records[key] = _DELETED
+                    continue
+                current = records.get(key, _MISSING)
+                values = {} if current is _MISSING or current is _DELETED else current
+                resolve_diff(log, values, blobs)
+                records[key] = values
+
+
+def _upsert(table: Table, dialect_name: str, columns: Iterable[str]) -> Insert:
+    updated = [column for column in columns if column != "id"]
+    if dialect_name in ("postgresql", "sqlite"):
+        statement = postgresql.insert(table) if dialect_name == "postgresql" else sqlite.insert(table)
+        if not updated:
+            return cast(Insert, statement.on_conflict_do_nothing(index_elements=[table.c.id]))
+        excluded = statement.excluded
+        return cast(
+            Insert,
+            statement.on_conflict_do_update(
+                index_elements=[table.c.id], set_={column: excluded[column] for column in updated}
+            ),
+        )
+    if dialect_name in ("mysql", "mariadb"):
+        statement = mysql.insert(table)
+        inserted = statement.inserted
+        return cast(
+            Insert, statement.on_duplicate_key_update({column: inserted[column] for column in updated or ["id"]})
+        )
+    raise ValueError(f"Bulk upserts are only supported on MySQL, PostgreSQL and SQLite, not {dialect_name}")
+
+
+def write_records(
+    conn: Connection, tables: Sequence[Table], records: FoldedRecords, *, batch_size: int = BATCH_SIZE
+) -> RestoreStats:
+    """
+    Upserts the values of `records` into `tables`, in their order (parents first, e.g. `MetaData.sorted_tables`),
+    as `executemany` batches of up to `batch_size` rows, then deletes the deleted ones in reverse order.
+    """
+    stats = RestoreStats(spilled=records.spilled)
+    deleted_ids: dict[str, list[int]] = {}
+    for table in tables:
+        batches: dict[frozenset[str], list[dict[str, Any]]] = {}
+        for record_id, values in records.items(table.name):
+            if values is _DELETED:
+                deleted_ids.setdefault(table.name, []).append(record_id)
+                continue
+            row = decode_row(table, {**values, "id": record_id})
+            batch = batches.setdefault(frozenset(row), [])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.execute(_upsert(table, conn.dialect.name, row), batch)
+                stats.upserted += len(batch)
+                batch.clear()
+        for columns, batch in batches.items():
+            if batch:
+                conn.execute(_upsert(table, conn.dialect.name, columns), batch)
+                stats.upserted += len(batch)
+    for table in reversed(tables):
+        for record_ids in chunked(deleted_ids.get(table.name, []), batch_size):
+            stats.deleted += conn.execute(delete(table).where(table.c.id.in_(record_ids))).rowcount
+    return stats
+
+
+def restore(  # pylint: disable=too-many-arguments
+    *,
+    source: Engine,
+    target: Engine,
+    metadata: MetaData,
+    tables: Optional[Iterable[str]] = None,
+    until: Optional[dt.datetime] = None,
+    max_in_memory: int = 100_000,
+    chunk_size: int = CHUNK_SIZE,
+    batch_size: int = BATCH_SIZE,
+) -> RestoreStats:
+    """
+    Rebuilds `tables` of `metadata` (all of them by default) in `target` as they were before `until`, from the change
+    logs in `source` alone, in a single transaction (see `fold_logs` and `write_records`).
+    Rows not in the change log are left as they are.
+    """
+    table_names = list(metadata.tables) if tables is None else list(tables)
+    unknown = set(table_names) - set(metadata.tables)
+    if unknown:
+        raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+    with FoldedRecords(max_in_memory) as records:
+        with Session(source, future=True) as session:
+            fold_logs(session, table_names, records, until=until, chunk_size=chunk_size)
+        with target.begin() as conn:
+            sorted_tables = [table for table in metadata.sorted_tables if table.name in table_names]
+            return write_records(conn, sorted_tables, records, batch_size=batch_size)
@@ -0,0 +1,335 @@
+"""
+Append-only segment files that loggers can write to instead of a database,
+e.g. `log_changes(of=session, to=SegmentWriter(path))`.
+
+Each segment, named after the id of its first record, is a sequence of records, each one a fixed header
+(payload length, CRC-32, id, microseconds since the Unix epoch and table name length) followed by the table name
+and the rest of the row as compact JSON. Next to it, a sparse index holds the id, time and offset of every
+`index_interval`-th record as fixed-size entries, which readers memory-map and binary search.
+"""
+import datetime as dt
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Iterator, Optional, Sequence, Union, cast
+
+from sqlalchemy import MetaData, insert
+from sqlalchemy.engine import Engine
+
+from resql.encoding import dumps, loads
+from resql.util import chunked
+from resql.writers import get_table_name, to_row
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+SEGMENT_SUFFIX = ".seg"
+INDEX_SUFFIX = ".idx"
+# payload length, CRC-32 of everything after it, id, microseconds since EPOCH, table name length
+HEADER = struct.Struct("<IIqqB")
+# id, microseconds since EPOCH, offset of the record in the segment
+INDEX_ENTRY = struct.Struct("<qqQ")
+
+PathLike = Union[str, "os.PathLike[str]"]
+
+
+def _to_microseconds(value: dt.datetime) -> int:
+    return (value - EPOCH) // dt.timedelta(microseconds=1)
+
+
+def _from_microseconds(value: int) -> dt.datetime:
+    return EPOCH + dt.timedelta(microseconds=value)
+
+
+def _segment_path(directory: Path, first_id: int) -> Path:
+    # zero-padded, so that segments sort by name
+    return directory / f"{first_id:020d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory: PathLike) -> list[Path]:
+    """The segments in `directory`, oldest first."""
+    return sorted(Path(directory).glob(f"*{SEGMENT_SUFFIX}"))
+
+
+@dataclass
+class SegmentRecord:
+    id: int
+    executed_at: dt.datetime
+    table_name: str
+    # every column but `id` and `executed_at`
+    values: dict[str, Any]
+
+    @property
+    def row(self) -> dict[str, Any]:
+        return {**self.values, "id": self.id, "executed_at": self.executed_at}
+
+
+def _encode(log_id: int, executed_at: dt.datetime, table_name: str, values: dict[str, Any]) -> bytes:
+    name = table_name.encode()
+    payload = dumps(values).encode()
+    rest = struct.pack("<qqB", log_id, _to_microseconds(executed_at), len(name)) + name + payload
+    return struct.pack("<II", len(payload), zlib.crc32(rest)) + rest
+
+
+def _decode(buffer: Union[bytes, mmap.mmap], offset: int) -> Optional[tuple[SegmentRecord, int]]:
+    """The record at `offset` and the offset of the next one, or `None` if it's incomplete or corrupt (a torn write)."""
+    if offset + HEADER.size > len(buffer):
+        return None
+    length, crc, log_id, microseconds, name_length = HEADER.unpack_from(buffer, offset)
+    end = offset + HEADER.size + name_length + length
+    if end > len(buffer) or zlib.crc32(buffer[offset + 8 : end]) != crc:
+        return None
+    name_end = offset + HEADER.size + name_length
+    record = SegmentRecord(
+        id=log_id,
+        executed_at=_from_microseconds(microseconds),
+        table_name=bytes(buffer[offset + HEADER.size : name_end]).decode(),
+        values=loads(buffer[name_end:end]),
+    )
+    return record, end
+
+
+def _scan(path: Path, offset: int = 0) -> Iterator[tuple[SegmentRecord, int]]:
+    """Every complete record of the segment at `path` from `offset` on, with its offset."""
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            while (decoded := _decode(buffer, offset)) is not None:
+                record, next_offset = decoded
+                yield record, offset
+                offset = next_offset
+
+
+class SegmentWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Appends logs to segments in `directory`, to be used as the `to` of `log_changes` and `log_queries`.
+
+    Logs without an id are given the one after the last written. Starts a new segment once the current one reaches
+    `max_segment_bytes`, and whenever it's opened, so that a segment torn by a crash is never appended to.
+    Each `write` hands its logs to the OS, so they survive the process crashing and readers see them,
+    but they're only made durable (`fsync`) by the first `write` at least `fsync_interval` seconds after the last
+    `fsync`, or by `flush` and `close`. Safe to share among threads, but only one writer, in a single process,
+    may use a directory at a time.
+    """
+
+    def __init__(
+        self,
+        directory: PathLike,
+        *,
+        max_segment_bytes: int = 64 * 1024 * 1024,
+        index_interval: int = 256,
+        fsync_interval: float = 1.0,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_segment_bytes = max_segment_bytes
+        self.index_interval = index_interval
+        self.fsync_interval = fsync_interval
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segment: Optional[IO[bytes]] = None
+        self._index: Optional[IO[bytes]] = None
+        self._pending_index: list[bytes] = []
+        self._segment_size = 0
+        self._segment_records = 0
+        self._last_id = self._find_last_id()
+        self._synced_at = time.monotonic()
+
+    def _find_last_id(self) -> int:
+        segments = list_segments(self.directory)
+        if not segments:
+            return 0
+        last_id = int(segments[-1].stem) - 1
+        for record, _ in _scan(segments[-1], _last_indexed_offset(segments[-1])):
+            last_id = record.id
+        return last_id
+
+    def write(self, logs: Sequence[Any]) -> None:
+        with self._lock:
+            for log in logs:
+                row = to_row(log)
+                log_id = row.pop("id", None)
+                log_id = self._last_id + 1 if log_id is None else log_id
+                executed_at = row.pop("executed_at")
+                self._append(log_id, executed_at, get_table_name(log), row)
+            if time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync()
+            else:
+                self._flush_files()
+
+    def _append(self, log_id: int, executed_at: dt.datetime, table_name: str, values: dict[str, Any]) -> None:
+        if self._segment is None or self._segment_size >= self.max_segment_bytes:
+            self._rotate(log_id)
+        if self._segment_records % self.index_interval == 0:
+            self._pending_index.append(INDEX_ENTRY.pack(log_id, _to_microseconds(executed_at), self._segment_size))
+        data = _encode(log_id, executed_at, table_name, values)
+        cast(IO[bytes], self._segment).write(data)
+        self._segment_size += len(data)
+        self._segment_records += 1
+        self._last_id = log_id
+
+    def _rotate(self, first_id: int) -> None:
+        self._close_files()
+        path = _segment_path(self.directory, first_id)
+        # a segment of the same name can only exist if none of its records were complete, so it's overwritten.
+        # Buffered, so that many small records become few system calls
+        self._segment = open(path, "wb", buffering=1024 * 1024)  # pylint: disable=consider-using-with
+        self._index = open(path.with_suffix(INDEX_SUFFIX), "wb")  # pylint: disable=consider-using-with
+        self._segment_size = self._segment_records = 0
+
+    def _flush_files(self) -> None:
+        if self._segment is None or self._index is None:
+            return
+        # index entries are only written after the records they point to, so that they never point past the end
+        self._segment.flush()
+        self._index.write(b"".join(self._pending_index))
+        self._index.flush()
+        self._pending_index.clear()
+
+    def _sync(self) -> None:
+        self._flush_files()
+        for file in (self._segment, self._index):
+            if file is not None:
+                os.fsync(file.fileno())
+        self._synced_at = time.monotonic()
+
+    def _close_files(self) -> None:
+        self._sync()
+        for file in (self._segment, self._index):
+            if file is not None:
+                file.close()
+        self._segment = self._index = None
+
+    def flush(self) -> None:
+        """Blocks until everything written so far is on disk."""
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+
+
+def _map_index(path: Path) -> Optional[mmap.mmap]:
+    """The memory-mapped index of the segment at `path`, if it has any entries."""
+    index_path = path.with_suffix(INDEX_SUFFIX)
+    if not index_path.exists() or index_path.stat().st_size < INDEX_ENTRY.size:
+        return None
+    with open(index_path, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _index_entry(buffer: mmap.mmap, position: int) -> tuple[int, int, int]:
+    return cast(tuple[int, int, int], INDEX_ENTRY.unpack_from(buffer, position * INDEX_ENTRY.size))
+
+
+def _last_indexed_offset(path: Path) -> int:
+    buffer = _map_index(path)
+    if buffer is None:
+        return 0
+    with buffer:
+        # a partially written last entry is ignored
+        return _index_entry(buffer, len(buffer) // INDEX_ENTRY.size - 1)[2]
+
+
+def _first_indexed_time(path: Path) -> Optional[int]:
+    buffer = _map_index(path)
+    if buffer is None:
+        return None
+    with buffer:
+        return _index_entry(buffer, 0)[1]
+
+
+def _seek(path: Path, key: int, field: int) -> int:
+    """
+    The offset from which to scan the segment at `path` for records whose id (`field` 0) or time (`field` 1)
+    is at least `key`: that of the last indexed record below it, found by binary search over the memory-mapped index.
+    """
+    buffer = _map_index(path)
+    if buffer is None:
+        return 0
+    with buffer:
+        low, high = 0, len(buffer) // INDEX_ENTRY.size
+        while low < high:
+            middle = (low + high) // 2
+            if _index_entry(buffer, middle)[field] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return 0 if low == 0 else _index_entry(buffer, low - 1)[2]
+
+
+class SegmentReader:
+    """Reads the segments written by a `SegmentWriter` to `directory`, even while it's still writing."""
+
+    def __init__(self, directory: PathLike) -> None:
+        self.directory = Path(directory)
+
+    def read(
+        self,
+        *,
+        since_id: Optional[int] = None,
+        since: Optional[dt.datetime] = None,
+        until: Optional[dt.datetime] = None,
+        table_name: Optional[str] = None,
+    ) -> Iterator[SegmentRecord]:
+        """
+        The records with id at least `since_id`, executed from `since` (inclusive) until `until` (exclusive),
+        of `table_name`, in the order they were written. Uses the indexes to skip segments and to start reading
+        each one close to the first wanted record, assuming ids and times (roughly) increase along the segments.
+        """
+        segments = list_segments(self.directory)
+        if since_id is not None:
+            # the last segment starting at or before `since_id` is the first that may contain it
+            starts = [int(path.stem) for path in segments]
+            first = max((index for index, start in enumerate(starts) if start <= since_id), default=0)
+            segments = segments[first:]
+        for path in segments:
+            first_time = _first_indexed_time(path)
+            if until is not None and first_time is not None and first_time >= _to_microseconds(until):
+                return
+            offset = 0
+            if since_id is not None:
+                offset = _seek(path, since_id, 0)
+            elif since is not None:
+                offset = _seek(path, _to_microseconds(since), 1)
+            for record, _ in _scan(path, offset):
+                if until is not None and record.executed_at >= until:
+                    continue
+                if since_id is not None and record.id < since_id:
+                    continue
+                if since is not None and record.executed_at < since:
+                    continue
+                if table_name is None or record.table_name == table_name:
+                    yield record
+
+
+def replay(
+    reader: SegmentReader,
+    engine: Engine,
+    metadata: MetaData,
+    *,
+    since_id: Optional[int] = None,
+    batch_size: int = 10_000,
+) -> int:
+    """
+    Inserts the records of `reader` with id at least `since_id` into the tables of `metadata` in `engine`
+    (e.g. the `metadata` of the registry from `map_default`), keeping their ids, each batch of `batch_size` records
+    in its own transaction, and returns how many were inserted. Resuming from the last id replayed plus one
+    continues where a previous replay stopped.
+    """
+    replayed = 0
+    for batch in chunked(reader.read(since_id=since_id), batch_size):
+        # an executemany needs every row to have the same keys
+        grouped: dict[tuple[str, frozenset[str]], list[dict[str, Any]]] = {}
+        for record in batch:
+            row = record.row
+            grouped.setdefault((record.table_name, frozenset(row)), []).append(row)
+        with engine.begin() as conn:
+            for (table_name, _), rows in grouped.items():
+                conn.execute(insert(metadata.tables[table_name]), rows)
+        replayed += len(batch)
+    return replayed
@@ -0,0 +1,186 @@
+import json
+from typing import Any, Iterable, Optional
+
+from sqlalchemy import JSON, Column, LargeBinary, Table
+from sqlalchemy.engine import Dialect, Engine
+
+from resql.auditing import AUDIT_INFO_KEY
+from resql.change_log import OpType
+
+SUPPORTED_DIALECTS = ("postgresql", "sqlite")
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def get_audited_columns(table: Table, dialect: Dialect) -> list[Column]:  # type: ignore[type-arg]
+    """
+    The columns whose changes the triggers of `table` log: all but primary keys, generated columns,
+    those with `info={"resql_audit": False}` and, on SQLite, binary ones, which JSON can't hold.
+    """
+    return [
+        column
+        for column in table.columns
+        if not column.primary_key
+        and column.computed is None
+        and column.info.get(AUDIT_INFO_KEY, True)
+        and not (dialect.name == "sqlite" and isinstance(column.type, LargeBinary))
+    ]
+
+
+def _trigger_name(table: Table, suffix: str = "") -> str:
+    return f"resql_{table.name}{suffix}"
+
+
+def _sqlite_value(column: Column, row: str, dialect: Dialect) -> str:  # type: ignore[type-arg]
+    value = f"{row}.{dialect.identifier_preparer.quote(column.name)}"
+    # JSON columns are stored as text, which would otherwise end up as a string in the diff
+    return f"json({value})" if isinstance(column.type, JSON) else value
+
+
+def _sqlite_diff(columns: list[Column], dialect: Dialect, op_type: OpType) -> str:  # type: ignore[type-arg]
+    if not columns:
+        return "'{}'"
+    changes = []
+    for column in columns:
+        name = dialect.identifier_preparer.quote(column.name)
+        if op_type == OpType.INSERT:
+            old, condition = "NULL", f"NEW.{name} IS NOT NULL"
+        else:
+            old, condition = _sqlite_value(column, "OLD", dialect), f"OLD.{name} IS NOT NEW.{name}"
+        new = _sqlite_value(column, "NEW", dialect)
+        changes.append(
+            f"SELECT {_quote_literal(column.name)} AS key, json_object('old', {old}, 'new', {new}) AS value "
+            f"WHERE {condition}"
+        )
+    return f"(SELECT json_group_object(key, json(value)) FROM ({' UNION ALL '.join(changes)}))"
+
+
+def _sqlite_ddl(table: Table, dialect: Dialect, log_table: str, extra: str) -> list[str]:
+    quote = dialect.identifier_preparer.quote
+    columns = get_audited_columns(table, dialect)
+    insert_log = f"INSERT INTO {quote(log_table)} (diff, executed_at, extra, record_id, table_name, type)"
+    # the format SQLAlchemy stores datetimes in
+    log_values = f"strftime('%Y-%m-%d %H:%M:%f000', 'now'), {extra}"
+    table_name = _quote_literal(str(table.name))
+    return [
+        f"CREATE TRIGGER {_trigger_name(table, '_insert')} AFTER INSERT ON {quote(table.name)} BEGIN "
+        f"{insert_log} VALUES ({_sqlite_diff(columns, dialect, OpType.INSERT)}, {log_values}, "
+        f"NEW.id, {table_name}, '{OpType.INSERT.value}'); END",
+        # updates that changed no audited column aren't logged, as with `log_changes`
+        f"CREATE TRIGGER {_trigger_name(table, '_update')} AFTER UPDATE ON {quote(table.name)} BEGIN "
+        f"{insert_log} SELECT diff, {log_values}, NEW.id, {table_name}, '{OpType.UPDATE.value}' "
+        f"FROM (SELECT {_sqlite_diff(columns, dialect, OpType.UPDATE)} AS diff) WHERE diff <> '{{}}'; END",
+        f"CREATE TRIGGER {_trigger_name(table, '_delete')} AFTER DELETE ON {quote(table.name)} BEGIN "
+        f"{insert_log} VALUES ('{{}}', {log_values}, OLD.id, {table_name}, '{OpType.DELETE.value}'); END",
+    ]
+
+
+def _postgresql_ddl(table: Table, dialect: Dialect, log_table: str, extra: str) -> list[str]:
+    quote = dialect.identifier_preparer.quote
+    keys = ", ".join(_quote_literal(column.name) for column in get_audited_columns(table, dialect)) or "NULL"
+    function = _trigger_name(table, "_log")
+    insert_log = (
+        f"INSERT INTO {quote(log_table)} (diff, executed_at, extra, record_id, table_name, type) "
+        f"VALUES (row_diff, now(), {extra}, changed_row.id, TG_TABLE_NAME"
+    )
+    return [
+        f"""CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+DECLARE
+    row_diff jsonb;
+    changed_row {quote(table.name)};
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        row_diff := '{{}}';
+        changed_row := OLD;
+        {insert_log}, '{OpType.DELETE.value}');
+        RETURN OLD;
+    END IF;
+    changed_row := NEW;
+    IF TG_OP = 'INSERT' THEN
+        SELECT coalesce(jsonb_object_agg(after.key, jsonb_build_object('old', NULL, 'new', after.value)), '{{}}')
+        INTO row_diff FROM jsonb_each(to_jsonb(NEW)) AS after
+        WHERE after.key IN ({keys}) AND after.value <> 'null';
+        {insert_log}, '{OpType.INSERT.value}');
+    ELSE
+        SELECT coalesce(
+            jsonb_object_agg(after.key, jsonb_build_object('old', before.value, 'new', after.value)), '{{}}'
+        )
+        INTO row_diff
+        FROM jsonb_each(to_jsonb(NEW)) AS after JOIN jsonb_each(to_jsonb(OLD)) AS before USING (key)
+        WHERE after.key IN ({keys}) AND after.value IS DISTINCT FROM before.value;
+        -- updates that changed no audited column aren't logged, as with `log_changes`
+        IF row_diff <> '{{}}' THEN
+            {insert_log}, '{OpType.UPDATE.value}');
+        END IF;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql""",
+        f"CREATE TRIGGER {_trigger_name(table)} AFTER INSERT OR UPDATE OR DELETE ON {quote(table.name)} "
+        f"FOR EACH ROW EXECUTE PROCEDURE {function}()",
+    ]
+
+
+def get_trigger_ddl(
+    table: Table,
+    dialect: Dialect,
+    *,
+    log_table: str = "change_log",
+    extra: Optional[dict[str, Any]] = None,
+) -> list[str]:
+    """
+    The statements that create triggers logging every insert, update and delete of `table` into `log_table`,
+    in the same format as `log_changes`, with the given constant `extra`.
+
+    Values are logged as the database stores them, e.g. on SQLite, datetimes are strings and booleans are integers.
+    """
+    extra_literal = "NULL" if extra is None else _quote_literal(json.dumps(extra, separators=(",", ":")))
+    if dialect.name == "sqlite":
+        return _sqlite_ddl(table, dialect, log_table, extra_literal)
+    if dialect.name == "postgresql":
+        return _postgresql_ddl(table, dialect, log_table, extra_literal)
+    raise ValueError(f"Triggers are only supported on {' and '.join(SUPPORTED_DIALECTS)}, not {dialect.name}")
+
+
+def get_drop_trigger_ddl(table: Table, dialect: Dialect) -> list[str]:
+    quote = dialect.identifier_preparer.quote
+    if dialect.name == "sqlite":
+        return [
+            f"DROP TRIGGER IF EXISTS {_trigger_name(table, suffix)}" for suffix in ("_insert", "_update", "_delete")
+        ]
+    if dialect.name == "postgresql":
+        return [
+            f"DROP TRIGGER IF EXISTS {_trigger_name(table)} ON {quote(table.name)}",
+            f"DROP FUNCTION IF EXISTS {_trigger_name(table, '_log')}()",
+        ]
+    raise ValueError(f"Triggers are only supported on {' and '.join(SUPPORTED_DIALECTS)}, not {dialect.name}")
+
+
+def install_triggers(
+    engine: Engine,
+    tables: Iterable[Table],
+    *,
+    log_table: str = "change_log",
+    extra: Optional[dict[str, Any]] = None,
+) -> None:
+    """
+    Captures changes to `tables` in the database itself, including those made through Core or raw SQL,
+    replacing triggers previously installed by resql. The `log_table` must be in the same database as `tables`.
+    Tables with `info={"resql_audit": False}` are skipped.
+    """
+    with engine.begin() as conn:
+        for table in tables:
+            if table.info.get(AUDIT_INFO_KEY, True):
+                statements = get_drop_trigger_ddl(table, conn.dialect)
+                statements.extend(get_trigger_ddl(table, conn.dialect, log_table=log_table, extra=extra))
+                for statement in statements:
+                    conn.exec_driver_sql(statement)
+
+
+def drop_triggers(engine: Engine, tables: Iterable[Table]) -> None:
+    with engine.begin() as conn:
+        for table in tables:
+            for statement in get_drop_trigger_ddl(table, conn.dialect):
+                conn.exec_driver_sql(statement)
@@ -1,6 +1,112 @@
+import datetime as dt
+import hashlib
+import itertools
+import json
 from enum import Enum
-from typing import Any
+from typing import Any, Iterable, Iterator, Optional, TypeVar, cast
+
+from sqlalchemy import DDL, JSON, MetaData, Table, event, insert, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Connection, Dialect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import Insert
+from sqlalchemy.types import TypeDecorator, TypeEngine
+
+from resql.encoding import dumps, to_json_document
+
+Item = TypeVar("Item")
+
+# how many parameters go in each multi-row `INSERT`, to stay below the limits of every dialect
+MAX_PARAMETERS = 500
 
 
 def enum_values(enumeration: Enum) -> list[Any]:
     return [elem.value for elem in enumeration]  # type: ignore[attr-defined]
+
+
+def now_in_utc() -> dt.datetime:
+    return dt.datetime.now(tz=dt.timezone.utc)
+
+
+class JSONDocument(TypeDecorator):  # type: ignore[type-arg]  # pylint: disable=abstract-method
+    """
+    `JSON`, except on PostgreSQL, where `JSONB` is smaller, faster to query and indexable. Values JSON can't hold,
+    like datetimes or bytes, are converted by `resql.encoding.dumps` as it serializes them, when it is the engine's
+    `json_serializer`, or else first (see `resql.encoding.to_json_document`), so that logs can be written with the
+    default JSON serializer of any engine.
+    """
+
+    impl: TypeEngine[Any] = JSON().with_variant(JSONB(), "postgresql")  # type: ignore[arg-type]
+    cache_ok = True
+
+    def process_bind_param(self, value: Any, dialect: Dialect) -> Any:
+        # which dialects keep from the `json_serializer` of their engine
+        if getattr(dialect, "_json_serializer", None) is dumps:
+            return value
+        return to_json_document(value)
+
+
+def json_type() -> TypeEngine:  # type: ignore[type-arg]
+    return JSONDocument()
+
+
+def add_gin_index(table: Table, column_name: str) -> None:
+    """Adds a GIN index on a `json_type()` column that is only created on PostgreSQL, to speed up `@>` searches."""
+    index_name = f"ix_{table.name}_{column_name}_gin"
+    ddl = DDL(f"CREATE INDEX {index_name} ON {table.name} USING gin ({column_name} jsonb_path_ops)")
+    event.listen(table, "after_create", ddl.execute_if(dialect="postgresql"))
+
+
+def get_sibling_table(log_class: type, table_name: str) -> Table:
+    """The table named `table_name` that lives in the same `MetaData` as the table `log_class` is mapped to."""
+    metadata: MetaData = inspect(log_class).local_table.metadata
+    return metadata.tables[table_name]
+
+
+def hash_json(value: Any) -> str:
+    """SHA-256 of `value` serialized as JSON, with sorted keys so that equal dicts have equal hashes."""
+    serialized = json.dumps(value, default=str, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(serialized.encode()).hexdigest()
+
+
+def chunked(iterable: Iterable[Item], size: Optional[int]) -> Iterator[list[Item]]:
+    """Consecutive lists of up to `size` items of `iterable`, or a single one with all of them if `size` is `None`."""
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _insert_ignoring_duplicates(table: Table, dialect_name: str) -> Optional[Insert]:
+    if dialect_name == "postgresql":
+        return cast(Insert, postgresql.insert(table).on_conflict_do_nothing())
+    if dialect_name == "sqlite":
+        return cast(Insert, sqlite.insert(table).on_conflict_do_nothing())
+    if dialect_name in ("mysql", "mariadb"):
+        return insert(table).prefix_with("IGNORE")
+    return None
+
+
+def insert_missing(conn: Connection, table: Table, rows: list[dict[str, Any]]) -> int:
+    """
+    Inserts those of `rows` whose primary key isn't in `table`, even if concurrent transactions insert some of them too,
+    without failing the transaction of `conn`, and returns how many were inserted. Rows go in multi-row `INSERT`s,
+    since every dialect reports their row count (unlike that of `executemany`), with a native "ignore duplicates"
+    where available (PostgreSQL, SQLite and MySQL), or one row per savepoint elsewhere.
+    """
+    if not rows:
+        return 0
+    statement = _insert_ignoring_duplicates(table, conn.dialect.name)
+    inserted = 0
+    if statement is not None:
+        for chunk in chunked(rows, max(1, MAX_PARAMETERS // len(rows[0]))):
+            inserted += conn.execute(statement.values(chunk)).rowcount
+        return inserted
+    for row in rows:
+        try:
+            with conn.begin_nested():
+                conn.execute(insert(table), row)
+            inserted += 1
+        except IntegrityError:
+            pass
+    return inserted
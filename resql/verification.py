@@ -0,0 +1,232 @@
+"""
+Checks that tables hold what their change log says they should, without comparing them row by row: the records
+of each range of ids are checksummed on both sides, ranges in parallel, and only the ranges whose checksums differ
+are split and checked again, down to ranges small enough to compare their records.
+
+Records are compared as the change log sees them, so it must cover them since they were inserted
+(e.g. the table was restored from it, or logged from the start): records it doesn't know, or only partially,
+and values it never logs (like server defaults) show up as mismatched unless their columns are excluded.
+"""
+import datetime as dt
+import math
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Collection, Iterable, Iterator, Mapping, Optional, Sequence
+
+from sqlalchemy import Column, MetaData, Table, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from resql.auditing import AUDIT_INFO_KEY
+from resql.change_log import ChangeLog
+from resql.encoding import decode_row, get_converter
+from resql.restore import FoldedRecords, fold_logs
+from resql.util import hash_json
+
+# how many ids each range spans at first
+RANGE_SIZE = 100_000
+# how many ranges a range whose checksums differ is split into
+FANOUT = 16
+# ranges spanning up to this many ids have their records compared instead of split
+LEAF_SIZE = 100
+WORKERS = 8
+
+IdRange = tuple[int, int]
+
+
+@dataclass
+class TableVerification:
+    table_name: str
+    # how many ranges were checked, including those split
+    ranges: int = 0
+    mismatched_ids: list[int] = field(default_factory=list)
+
+    @property
+    def matches(self) -> bool:
+        return not self.mismatched_ids
+
+
+def get_verified_columns(table: Table, exclude_columns: Collection[str] = ()) -> list[Column]:  # type: ignore[type-arg]
+    """
+    The columns of `table` compared besides `id`: those the change log has values for, which leaves out computed ones,
+    those with `info={"resql_audit": False}` and `exclude_columns`, named `"column"` or `"table.column"`.
+    """
+    excluded = set(exclude_columns)
+    return [
+        column
+        for column in table.c
+        if column.name != "id"
+        and column.computed is None
+        and column.info.get(AUDIT_INFO_KEY, True)
+        and column.name not in excluded
+        and f"{table.name}.{column.name}" not in excluded
+    ]
+
+
+def _split(id_range: IdRange, size: int) -> list[IdRange]:
+    low, high = id_range
+    return [(start, min(start + size - 1, high)) for start in range(low, high + 1, size)]
+
+
+@dataclass
+class _RangeVerifier:
+    source: Engine
+    target: Engine
+    table: Table
+    columns: Sequence[Column]  # type: ignore[type-arg]
+    until: Optional[dt.datetime]
+    leaf_size: int
+
+    def __post_init__(self) -> None:
+        # values are hashed in their JSON-native form, as they're logged
+        self._converters = [get_converter(column.type) for column in self.columns]
+
+    def _hash(self, record_id: int, values: Mapping[str, Any]) -> int:
+        normalized = []
+        for column, converter in zip(self.columns, self._converters):
+            value = values.get(column.name)
+            normalized.append(value if value is None or converter is None else converter(value))
+        return int(hash_json([record_id, normalized])[:32], 16)
+
+    def _target_hashes(self, id_range: IdRange) -> Iterator[tuple[int, int]]:
+        query = select(self.table.c.id, *self.columns).where(self.table.c.id.between(*id_range))
+        with self.target.connect() as conn:
+            for row in conn.execute(query).mappings():
+                yield row["id"], self._hash(row["id"], row)
+
+    def _log_hashes(self, id_range: IdRange) -> Iterator[tuple[int, int]]:
+        with FoldedRecords() as records:
+            with Session(self.source, future=True) as session:
+                fold_logs(session, [self.table.name], records, until=self.until, record_ids=id_range)
+            for record_id, values in records.items(self.table.name):
+                # deleted by the end of the log
+                if values is not None:
+                    yield record_id, self._hash(record_id, decode_row(self.table, values))
+
+    @staticmethod
+    def _checksum(hashes: Iterable[tuple[int, int]]) -> tuple[int, int]:
+        """How many records there are and their hashes combined, in any order."""
+        count, checksum = 0, 0
+        for _, row_hash in hashes:
+            count += 1
+            checksum ^= row_hash
+        return count, checksum
+
+    def compare(self, id_range: IdRange) -> Optional[list[int]]:
+        """
+        The ids of the records in `id_range` that differ, or `None` if some do but the range is too large to tell which.
+        """
+        low, high = id_range
+        if high - low + 1 > self.leaf_size:
+            matches = self._checksum(self._target_hashes(id_range)) == self._checksum(self._log_hashes(id_range))
+            return [] if matches else None
+        target = dict(self._target_hashes(id_range))
+        logged = dict(self._log_hashes(id_range))
+        return sorted(
+            record_id for record_id in target.keys() | logged.keys() if target.get(record_id) != logged.get(record_id)
+        )
+
+
+def _get_bounds(source: Engine, target: Engine, table: Table, until: Optional[dt.datetime]) -> Optional[IdRange]:
+    """The lowest and highest ids of `table` in either `target` or its change log."""
+    log_query = select(func.min(ChangeLog.record_id), func.max(ChangeLog.record_id)).where(
+        ChangeLog.table_name == table.name
+    )
+    if until is not None:
+        log_query = log_query.where(ChangeLog.executed_at < until)
+    with Session(source, future=True) as session:
+        bounds = list(session.execute(log_query).one())
+    with target.connect() as conn:
+        bounds.extend(conn.execute(select(func.min(table.c.id), func.max(table.c.id))).one())
+    known = [bound for bound in bounds if bound is not None]
+    return (min(known), max(known)) if known else None
+
+
+def _check_ranges(
+    verification: TableVerification,
+    verifier: _RangeVerifier,
+    executor: Executor,
+    id_ranges: list[IdRange],
+    fanout: int,
+) -> None:
+    """Checks `id_ranges` on `executor`, splitting those that differ in `fanout` until their records are compared."""
+    pending = id_ranges
+    while pending:
+        verification.ranges += len(pending)
+        split = []
+        for id_range, mismatched_ids in zip(pending, executor.map(verifier.compare, pending)):
+            if mismatched_ids is not None:
+                verification.mismatched_ids.extend(mismatched_ids)
+                continue
+            low, high = id_range
+            split.extend(_split(id_range, max(math.ceil((high - low + 1) / fanout), 1)))
+        pending = split
+
+
+def verify_table(  # pylint: disable=too-many-arguments
+    *,
+    source: Engine,
+    target: Engine,
+    table: Table,
+    executor: Executor,
+    until: Optional[dt.datetime] = None,
+    exclude_columns: Collection[str] = (),
+    range_size: int = RANGE_SIZE,
+    fanout: int = FANOUT,
+    leaf_size: int = LEAF_SIZE,
+) -> TableVerification:
+    """
+    Compares `table` in `target` with the state its change logs in `source`, executed before `until`, imply,
+    by ranges of `range_size` ids checked on `executor`. Ranges that differ are split in `fanout`
+    until they span `leaf_size` ids or less, whose records are compared.
+    """
+    verification = TableVerification(table.name)
+    bounds = _get_bounds(source, target, table, until)
+    if bounds is None:
+        return verification
+    verifier = _RangeVerifier(source, target, table, get_verified_columns(table, exclude_columns), until, leaf_size)
+    _check_ranges(verification, verifier, executor, _split(bounds, range_size), fanout)
+    verification.mismatched_ids.sort()
+    return verification
+
+
+def verify(  # pylint: disable=too-many-arguments
+    *,
+    source: Engine,
+    target: Engine,
+    metadata: MetaData,
+    tables: Optional[Iterable[str]] = None,
+    until: Optional[dt.datetime] = None,
+    exclude_columns: Collection[str] = (),
+    range_size: int = RANGE_SIZE,
+    fanout: int = FANOUT,
+    leaf_size: int = LEAF_SIZE,
+    workers: int = WORKERS,
+) -> dict[str, TableVerification]:
+    """
+    Compares `tables` of `metadata` (all audited ones by default) in `target` with their change logs in `source`
+    (see `verify_table`), checking up to `workers` ranges at a time. To check a restore or replay `until` some time,
+    pass the same `until`.
+    """
+    if tables is None:
+        table_names = [name for name, table in metadata.tables.items() if table.info.get(AUDIT_INFO_KEY, True)]
+    else:
+        table_names = list(tables)
+    unknown = set(table_names) - set(metadata.tables)
+    if unknown:
+        raise ValueError(f"Unknown tables: {', '.join(sorted(unknown))}")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resql-verify") as executor:
+        return {
+            name: verify_table(
+                source=source,
+                target=target,
+                table=metadata.tables[name],
+                executor=executor,
+                until=until,
+                exclude_columns=exclude_columns,
+                range_size=range_size,
+                fanout=fanout,
+                leaf_size=leaf_size,
+            )
+            for name in table_names
+        }
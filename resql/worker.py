@@ -0,0 +1,53 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Task = Tuple[Callable[..., Any], Tuple[Any, ...]]
+
+
+class BackgroundWorker:
+    """
+    Runs submitted tasks one at a time, in submission order, in a daemon thread.
+
+    Meant to be shared by many loggers, so that work taken off the hot path
+    of the application does not require a thread per logger.
+    """
+
+    def __init__(self, max_pending: int = 0) -> None:
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[Optional[Task]] = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, function: Callable[..., Any], *args: Any) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="resql-worker", daemon=True)
+                self._thread.start()
+        self._queue.put((function, args))
+
+    def join(self) -> None:
+        """Blocks until every task submitted so far has finished."""
+        self._queue.join()
+
+    def close(self) -> None:
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                function, args = task
+                function(*args)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Background task failed")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,29 @@
+from typing import Any, Protocol, Sequence
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Mapper
+
+
+class LogWriter(Protocol):
+    """Something other than an `Engine` that loggers can write to, e.g. `resql.daemon.AuditWriterClient`."""
+
+    def write(self, logs: Sequence[Any]) -> None:
+        ...
+
+
+def get_table_name(log: Any) -> str:
+    mapper: Mapper = inspect(type(log))
+    return str(mapper.local_table.name)
+
+
+def to_row(log: Any) -> dict[str, Any]:
+    """The values of the columns that `log` is mapped to, leaving out those generated by the database."""
+    mapper: Mapper = inspect(type(log))
+    row = {}
+    for prop in mapper.column_attrs:
+        value = getattr(log, prop.key)
+        column = prop.columns[0]
+        if column.computed is not None or (value is None and column.primary_key):
+            continue
+        row[column.key] = value
+    return row
@@ -0,0 +1,136 @@
+import datetime as dt
+from typing import Optional
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from resql.change_log import ChangeLog, OpType
+from resql.query_log import QueryLog
+
+np = pytest.importorskip("numpy")
+# pylint: disable=wrong-import-position
+from resql.analytics import (
+    bucket_counts,
+    changes_per_record,
+    duration_percentiles,
+    find_bursts,
+    inter_change_intervals,
+    load_change_logs,
+    load_query_logs,
+)
+
+START = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def new_change_log(minutes: float, table_name: str, record_id: int, op_type: OpType = OpType.UPDATE) -> ChangeLog:
+    return ChangeLog(
+        diff={},
+        executed_at=START + dt.timedelta(minutes=minutes),
+        extra=None,
+        record_id=record_id,
+        table_name=table_name,
+        type=op_type,
+    )
+
+
+def new_query_log(minutes: float, statement_type: str, duration: Optional[float]) -> QueryLog:
+    return QueryLog(
+        dialect_description="sqlite+pysqlite",
+        duration=duration,
+        executed_at=START + dt.timedelta(minutes=minutes),
+        extra=None,
+        parameters=[],
+        statement="SELECT 1",
+        type=statement_type,
+    )
+
+
+def test_change_logs_are_loaded_and_aggregated(audit_mksession: sessionmaker) -> None:  # type: ignore[type-arg]
+    # Arrange
+    with audit_mksession.begin() as session:
+        session.add_all(
+            [
+                new_change_log(0, "person", 1, OpType.INSERT),
+                new_change_log(1, "person", 1),
+                new_change_log(4, "person", 1),
+                new_change_log(5, "account", 1, OpType.INSERT),
+                new_change_log(30, "person", 2, OpType.INSERT),
+                new_change_log(31, "person", 2),
+                new_change_log(90, "person", 1),
+            ]
+        )
+
+    # Act
+    with audit_mksession() as session:
+        logs = load_change_logs(session, chunk_size=2)
+        ranged = load_change_logs(
+            session,
+            since=START + dt.timedelta(minutes=1),
+            until=START + dt.timedelta(minutes=31),
+            table_names=["person"],
+        )
+        inserts = load_change_logs(session, op_types=[OpType.INSERT])
+
+    # Assert
+    assert len(logs) == 7
+    assert logs.executed_at[0] == np.datetime64("2021-01-01T00:00:00")
+    assert [logs.tables[code] for code in logs.table] == ["person"] * 3 + ["account"] + ["person"] * 3
+    assert [logs.types[code] for code in logs.type][:2] == [OpType.INSERT, OpType.UPDATE]
+    assert list(ranged.record_id) == [1, 1, 2]
+    assert len(inserts) == 3
+
+    starts, counts = bucket_counts(logs.executed_at, dt.timedelta(minutes=30))
+    assert list(starts) == [np.datetime64("2021-01-01T00:00"), np.datetime64("2021-01-01T00:30")] + [
+        np.datetime64("2021-01-01T01:00"),
+        np.datetime64("2021-01-01T01:30"),
+    ]
+    assert list(counts) == [4, 2, 0, 1]
+    burst_starts, _ = find_bursts(logs.executed_at, dt.timedelta(minutes=30), threshold=1.0)
+    assert list(burst_starts) == [np.datetime64("2021-01-01T00:00")]
+
+    tables, record_ids, changes = changes_per_record(logs)
+    assert [(logs.tables[table], record_id, count) for table, record_id, count in zip(tables, record_ids, changes)] == [
+        ("person", 1, 4),
+        ("person", 2, 2),
+        ("account", 1, 1),
+    ]
+    intervals = inter_change_intervals(logs)
+    assert sorted(intervals.astype("timedelta64[m]").astype(int)) == [1, 1, 3, 86]
+
+
+def test_query_logs_are_loaded_and_aggregated(recovery_mksession: sessionmaker) -> None:  # type: ignore[type-arg]
+    # Arrange
+    with recovery_mksession.begin() as session:
+        session.add_all(
+            [
+                *(new_query_log(minute, "select", minute / 100) for minute in range(1, 101)),
+                new_query_log(0, "insert", None),
+            ]
+        )
+
+    # Act
+    with recovery_mksession() as session:
+        queries = load_query_logs(session)
+        selects = load_query_logs(session, types=["select"], until=START + dt.timedelta(minutes=51))
+
+    # Assert
+    assert len(queries) == 101
+    assert np.isnan(queries.row_count).all()
+    assert len(selects) == 50
+    percentiles = duration_percentiles(queries, (0, 50, 100))
+    assert list(percentiles) == ["select"]
+    assert np.allclose(percentiles["select"], [0.01, 0.505, 1.0])
+
+
+def test_aggregations_of_nothing(audit_mksession: sessionmaker) -> None:  # type: ignore[type-arg]
+    # Act
+    with audit_mksession() as session:
+        logs = load_change_logs(session)
+
+    # Assert
+    assert len(logs) == 0
+    starts, counts = bucket_counts(logs.executed_at, dt.timedelta(hours=1))
+    assert len(starts) == len(counts) == 0
+    tables, record_ids, changes = changes_per_record(logs)
+    assert len(tables) == len(record_ids) == len(changes) == 0
+    assert len(inter_change_intervals(logs)) == 0
@@ -0,0 +1,86 @@
+from sqlalchemy import func, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_blob import REFERENCE_KEY, BlobStore, find_references, get_table, load_blobs
+from resql.change_log import ChangeLog
+from resql.deltas import resolve_diffs
+from resql.recovery import undo
+from tests.models import Base, Document
+from tests.utils import now_in_utc
+
+
+def test_large_values_are_stored_once(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    blob_store = BlobStore(threshold=100)
+    log_changes(of=production_mksession, to=audit_engine, blob_store=blob_store)
+    attachment, body = bytes(range(256)) * 4, "x" * 100
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add_all([Document(attachment=attachment, body=body), Document(attachment=attachment, body="short")])
+    with production_mksession.begin() as session:
+        session.add(Document(attachment=b"tiny"))
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        history = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        assert [set(log.diff) for log in history] == [{"attachment", "body"}, {"attachment", "body"}, {"attachment"}]
+        assert history[1].diff["body"] == {"old": None, "new": "short"}
+        assert all(REFERENCE_KEY in log.diff["attachment"]["new"] for log in history)
+        hashes = find_references(log.diff for log in history)
+        blobs = load_blobs(audit_session, ChangeLog, hashes)
+        assert sorted(blobs.values(), key=len) == [b"tiny", body.encode(), attachment]
+        assert audit_session.execute(select(func.count()).select_from(get_table(ChangeLog))).scalar_one() == 3
+        assert [diff["attachment"]["new"] for diff in resolve_diffs([history[0]], blobs)] == [attachment]
+        assert [diff["body"]["new"] for diff in resolve_diffs([history[0]], blobs)] == [body]
+    assert len(blob_store.known) == 3
+
+
+def test_undo_restores_blobs(
+    audit_engine: Engine,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, blob_store=BlobStore(threshold=100))
+    with production_mksession.begin() as session:
+        document = Document(attachment=b"\x00" * 1000, body="y" * 1000)
+        session.add(document)
+    since = now_in_utc()
+    with production_mksession.begin() as session:
+        session.delete(session.get(Document, document.id))
+
+    # Act
+    undo(source=audit_engine, target=production_engine, metadata=Base.metadata, since=since)
+
+    # Assert
+    with production_mksession.begin() as session:
+        restored = session.get(Document, document.id)
+        assert (restored.attachment, restored.body) == (b"\x00" * 1000, "y" * 1000)
+
+
+def test_blobs_of_many_chunks_are_stored_in_the_same_transaction(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    blob_store = BlobStore(threshold=10)
+    log_changes(of=production_mksession, to=audit_engine, blob_store=blob_store, chunk_size=1)
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add_all([Document(attachment=b"first" * 10), Document(attachment=b"second" * 10)])
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        history = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        blobs = load_blobs(audit_session, ChangeLog, find_references(log.diff for log in history))
+        assert [diff["attachment"]["new"] for diff in resolve_diffs(history, blobs)] == [b"first" * 10, b"second" * 10]
+    assert len(blob_store.known) == 2
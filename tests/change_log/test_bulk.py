@@ -0,0 +1,106 @@
+from typing import Iterator
+
+from pytest import fixture
+from sqlalchemy import select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import Diff, log_changes
+from resql.change_log import ChangeLog, OpType
+from resql.worker import BackgroundWorker
+from tests.models import Person
+
+
+@fixture(name="worker")
+def _worker() -> Iterator[BackgroundWorker]:
+    worker = BackgroundWorker()
+    yield worker
+    worker.close()
+
+
+def get_logs(audit_mksession: sessionmaker) -> list[tuple[OpType, int, dict[str, Diff]]]:  # type: ignore[type-arg]
+    with audit_mksession.begin() as session:
+        logs = session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars()
+        return [(log.type, log.record_id, log.diff) for log in logs]
+
+
+def test_bulk_mappings_should_be_audited(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, chunk_size=1)
+    with production_mksession.begin() as session:
+        session.bulk_insert_mappings(Person, [{"id": 1, "name": "A", "age": 1}, {"id": 2, "name": "B", "age": 2}])
+
+    # Act
+    with production_mksession.begin() as session:
+        session.bulk_update_mappings(Person, [{"id": 1, "name": "Renamed", "age": 1}, {"id": 2, "age": 20}])
+
+    # Assert
+    assert get_logs(audit_mksession) == [
+        (
+            OpType.INSERT,
+            1,
+            {"id": Diff(old=None, new=1), "name": Diff(old=None, new="A"), "age": Diff(old=None, new=1)},
+        ),
+        (
+            OpType.INSERT,
+            2,
+            {"id": Diff(old=None, new=2), "name": Diff(old=None, new="B"), "age": Diff(old=None, new=2)},
+        ),
+        (OpType.UPDATE, 1, {"name": Diff(old="A", new="Renamed")}),
+        (OpType.UPDATE, 2, {"age": Diff(old=2, new=20)}),
+    ]
+
+
+def test_bulk_saved_objects_should_be_audited(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    worker: BackgroundWorker,
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, worker=worker)
+    person = Person(name="Someone", age=25)
+
+    # Act
+    with production_mksession.begin() as session:
+        session.bulk_save_objects([person], return_defaults=True)
+    person.name = "Someone Else"
+    with production_mksession.begin() as session:
+        session.bulk_save_objects([person])
+    worker.join()
+
+    # Assert
+    assert get_logs(audit_mksession) == [
+        (OpType.INSERT, person.id, {"name": Diff(old=None, new="Someone"), "age": Diff(old=None, new=25)}),
+        (OpType.UPDATE, person.id, {"name": Diff(old="Someone", new="Someone Else")}),
+    ]
+
+
+def test_bulk_inserts_without_ids_should_be_audited_with_the_generated_ids(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine)
+    mappings = [{"name": "A"}, {"name": "B"}]
+    person = Person(name="C")
+
+    # Act
+    with production_mksession.begin() as session:
+        session.bulk_insert_mappings(Person, mappings)
+        session.bulk_save_objects([person])
+
+    # Assert
+    with production_mksession.begin() as session:
+        people = session.execute(select(Person.id, Person.name).order_by(Person.id)).all()
+    assert [(op_type, record_id, diff["name"]["new"]) for op_type, record_id, diff in get_logs(audit_mksession)] == [
+        (OpType.INSERT, record_id, name) for record_id, name in people
+    ]
+    assert [name for _, name in people] == ["A", "B", "C"]
+    assert mappings == [{"name": "A"}, {"name": "B"}]
+    assert person.id == people[-1].id
@@ -0,0 +1,88 @@
+from typing import Any, Sequence
+
+from sqlalchemy import event, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_log import ChangeLog, OpType, select_column_changes
+from resql.util import chunked
+from resql.worker import BackgroundWorker
+from tests.models import Person
+
+
+class ListWriter:
+    def __init__(self) -> None:
+        self.chunks: list[Sequence[Any]] = []
+
+    def write(self, logs: Sequence[Any]) -> None:
+        self.chunks.append(logs)
+
+
+def test_chunked() -> None:
+    assert list(chunked(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked(range(5), None)) == [[0, 1, 2, 3, 4]]
+    assert not list(chunked([], 2))
+
+
+def test_logs_are_written_in_chunks(
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    writer = ListWriter()
+    log_changes(of=production_mksession, to=writer, chunk_size=2)
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add_all([Person(name=f"Person {person_no}") for person_no in range(5)])
+
+    # Assert
+    assert [len(chunk) for chunk in writer.chunks] == [2, 2, 1]
+
+
+def test_chunks_are_flushed_and_released_in_one_transaction(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    identity_map_sizes: list[int] = []
+    audit_sessions: sessionmaker = sessionmaker(audit_engine, future=True)  # type: ignore[type-arg]
+    change_logger = log_changes(of=production_mksession, to=audit_engine, chunk_size=3, index_columns=True)
+    change_logger.session_maker = audit_sessions
+
+    def count_logs(session: Session, _: Any) -> None:
+        identity_map_sizes.append(len(session.identity_map))
+
+    event.listen(audit_sessions, "after_flush_postexec", count_logs)
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add_all([Person(name=f"Person {person_no}", age=person_no) for person_no in range(7)])
+
+    # Assert
+    # earlier chunks are no longer held by the session
+    assert identity_map_sizes == [3, 3, 1]
+    with audit_mksession.begin() as audit_session:
+        assert len(audit_session.execute(select(ChangeLog)).scalars().all()) == 7
+        assert len(audit_session.execute(select_column_changes("person", "age")).scalars().all()) == 7
+
+
+def test_deferred_logs_are_submitted_in_chunks(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    worker = BackgroundWorker(max_pending=1)
+    log_changes(of=production_mksession, to=audit_engine, worker=worker, chunk_size=2)
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add_all([Person(name=f"Person {person_no}") for person_no in range(5)])
+    worker.close()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog)).scalars().all()
+        assert [log.type for log in change_logs] == [OpType.INSERT] * 5
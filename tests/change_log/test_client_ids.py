@@ -0,0 +1,102 @@
+import datetime as dt
+import os
+
+import pytest
+from sqlalchemy import insert, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes, log_queries
+from resql.change_log import ChangeLog, OpType
+from resql.ids import MAX_COUNTER, HybridLogicalClock, id_to_datetime
+from resql.query_log import QueryLog
+from tests.models import Person
+from tests.utils import now_in_utc
+
+
+def test_clock_ids_are_strictly_increasing_and_time_ordered() -> None:
+    # Arrange
+    clock = HybridLogicalClock(node_id=7)
+    before = now_in_utc() - dt.timedelta(milliseconds=1)
+
+    # Act
+    ids = [clock.next_id() for _ in range(3 * MAX_COUNTER)]
+
+    # Assert
+    assert ids == sorted(set(ids))
+    assert ids[-1] < 2 ** 63
+    assert before <= id_to_datetime(ids[0]) <= now_in_utc() + dt.timedelta(seconds=1)
+
+
+def test_invalid_node_id_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        HybridLogicalClock(node_id=1024)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_clock_is_unusable_in_forked_child() -> None:
+    # Arrange
+    clock = HybridLogicalClock(node_id=5)
+    clock.next_id()
+
+    # Act
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        try:
+            clock.next_id()
+        except RuntimeError:
+            os._exit(0)  # pylint: disable=protected-access
+        os._exit(1)  # pylint: disable=protected-access
+    _, status = os.waitpid(pid, 0)
+
+    # Assert
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    assert clock.next_id() > 0
+
+
+def test_change_logs_get_client_generated_ids(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    clock = HybridLogicalClock(node_id=3)
+    first_id = clock.next_id()
+
+    # Act
+    log_changes(of=production_mksession, to=audit_engine, ids=clock)
+    with production_mksession.begin() as session:
+        session.add_all([Person(name="A", age=1), Person(name="B", age=2)])
+    with production_mksession.begin() as session:
+        person = session.execute(select(Person).where(Person.name == "A")).scalar_one()
+        person.age = 10
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        assert [log.type for log in change_logs] == [OpType.INSERT, OpType.INSERT, OpType.UPDATE]
+        assert all(log.id > first_id for log in change_logs)
+        assert change_logs[-1].record_id == person.id
+
+
+def test_query_logs_get_client_generated_ids(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    clock = HybridLogicalClock(node_id=4)
+    first_id = clock.next_id()
+
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, ids=clock)
+        conn.execute(insert(Person).values(name="A", age=1))
+        conn.execute(insert(Person).values(name="B", age=2))
+        conn.commit()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_logs = recovery_session.execute(select(QueryLog).order_by(QueryLog.id)).scalars().all()
+        assert [log.parameters[0]["name"] for log in query_logs] == ["A", "B"]
+        assert first_id < query_logs[0].id < query_logs[1].id
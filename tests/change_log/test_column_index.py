@@ -0,0 +1,133 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_blob import BlobStore
+from resql.change_log import ChangeLog, OpType, select_column_changes
+from resql.change_log_column import get_table
+from resql.daemon import AuditWriterClient
+from resql.deltas import JSON_PATCH
+from tests.models import Document, Payment, PaymentKind, Person
+
+
+def test_changed_columns_are_indexed(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, index_columns=True)
+
+    # Act
+    with production_mksession.begin() as session:
+        person = Person(name="Someone", age=20)
+        session.add(person)
+    for age in (30, 40):
+        with production_mksession.begin() as session:
+            session.get(Person, person.id).age = age
+    with production_mksession.begin() as session:
+        session.get(Person, person.id).name = "Someone Else"
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        age_logs = audit_session.execute(select_column_changes("person", "age", record_id=person.id)).scalars().all()
+        assert [log.type for log in age_logs] == [OpType.INSERT, OpType.UPDATE, OpType.UPDATE]
+        assert [log.diff["age"]["new"] for log in age_logs] == [20, 30, 40]
+        name_logs = audit_session.execute(select_column_changes("person", "name")).scalars().all()
+        assert [log.diff["name"]["new"] for log in name_logs] == ["Someone", "Someone Else"]
+        hashes = audit_session.execute(select(get_table(ChangeLog).c.new_hash, get_table(ChangeLog).c.old_hash)).all()
+        assert all(new_hash is None and old_hash is None for new_hash, old_hash in hashes)
+
+
+def test_changes_are_found_by_value(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, hash_column_values=True)
+
+    # Act
+    with production_mksession.begin() as session:
+        first, second = Person(name="First", age=50), Person(name="Second")
+        session.add_all([first, second])
+    with production_mksession.begin() as session:
+        session.get(Person, first.id).age = 51
+        session.get(Person, second.id).age = 50
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        to_fifty = audit_session.execute(select_column_changes("person", "age", new=50)).scalars().all()
+        assert [(log.record_id, log.type) for log in to_fifty] == [
+            (first.id, OpType.INSERT),
+            (second.id, OpType.UPDATE),
+        ]
+        from_fifty = audit_session.execute(select_column_changes("person", "age", old=50)).scalars().all()
+        assert [log.diff["age"]["new"] for log in from_fifty] == [51]
+        from_null = audit_session.execute(select_column_changes("person", "age", old=None, new=50)).scalars().all()
+        assert [log.record_id for log in from_null] == [first.id, second.id]
+
+
+def test_deltas_and_blobs_are_found_by_their_values(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(
+        of=production_mksession,
+        to=audit_engine,
+        hash_column_values=True,
+        delta_threshold=10,
+        blob_store=BlobStore(threshold=10),
+    )
+    old_content, new_content = {"keys": list(range(20)), "flag": False}, {"keys": list(range(20)), "flag": True}
+
+    # Act
+    with production_mksession.begin() as session:
+        document = Document(attachment=b"a" * 20, content=old_content)
+        session.add(document)
+    with production_mksession.begin() as session:
+        session.get(Document, document.id).content = new_content
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        to_new = audit_session.execute(select_column_changes("document", "content", new=new_content)).scalars().all()
+        assert [log.type for log in to_new] == [OpType.UPDATE]
+        assert JSON_PATCH in to_new[0].diff["content"]
+        from_old = audit_session.execute(select_column_changes("document", "content", old=old_content)).scalars().all()
+        assert [log.id for log in from_old] == [to_new[0].id]
+        assert not audit_session.execute(select_column_changes("document", "content", new=None)).scalars().all()
+        to_attachment = select_column_changes("document", "attachment", new=b"a" * 20)
+        assert [log.type for log in audit_session.execute(to_attachment).scalars()] == [OpType.INSERT]
+
+
+def test_enums_are_found_by_their_members(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, hash_column_values=True)
+    payment_table = Payment.__table__
+
+    # Act
+    with production_mksession.begin() as session:
+        payment = Payment(kind=PaymentKind.CARD)
+        session.add(payment)
+    with production_mksession.begin() as session:
+        session.get(Payment, payment.id).kind = PaymentKind.TRANSFER
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        to_card = audit_session.execute(select_column_changes(payment_table, "kind", new=PaymentKind.CARD)).scalars()
+        assert [log.type for log in to_card] == [OpType.INSERT]
+        from_card = select_column_changes(payment_table, "kind", old=PaymentKind.CARD, new=PaymentKind.TRANSFER)
+        assert [log.type for log in audit_session.execute(from_card).scalars()] == [OpType.UPDATE]
+
+
+def test_indexing_columns_requires_an_engine() -> None:
+    with pytest.raises(ValueError):
+        log_changes(of=sessionmaker(), to=AuditWriterClient("/nonexistent"), index_columns=True)
@@ -0,0 +1,129 @@
+import threading
+from typing import Iterator
+
+from freezegun import freeze_time
+from pytest import fixture
+from sqlalchemy import select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import Diff, log_changes
+from resql.change_log import ChangeLog, OpType
+from resql.worker import BackgroundWorker
+from tests.models import Document, Number, Person
+from tests.utils import now_in_utc
+
+
+@fixture(name="worker")
+def _worker() -> Iterator[BackgroundWorker]:
+    worker = BackgroundWorker()
+    yield worker
+    worker.close()
+
+
+def test_deferred_insert_update_and_delete_should_be_audited(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    worker: BackgroundWorker,
+) -> None:
+    # Arrange
+    now = now_in_utc()
+    extra = dict(user_agent="testing")
+
+    # Act
+    log_changes(of=production_mksession, to=audit_engine, extra=extra, worker=worker)
+    with freeze_time(now):
+        with production_mksession.begin() as session:
+            person = Person(name="Someone", age=25)
+            session.add(person)
+        with production_mksession.begin() as session:
+            session.add(person)
+            person.name = "Someone Else"
+            person.age = 25
+        with production_mksession.begin() as session:
+            session.delete(person)
+    worker.join()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        assert [log.type for log in change_logs] == [OpType.INSERT, OpType.UPDATE, OpType.DELETE]
+        assert change_logs[0].diff == dict(name=Diff(old=None, new="Someone"), age=Diff(old=None, new=25))
+        assert change_logs[1].diff == dict(name=Diff(old="Someone", new="Someone Else"))
+        assert change_logs[2].diff == {}
+        assert all(log.executed_at == now for log in change_logs)
+        assert all(log.extra == extra for log in change_logs)
+        assert all(log.record_id == person.id for log in change_logs)
+        assert all(log.table_name == Person.__tablename__ for log in change_logs)
+
+
+def test_deferred_diff_does_not_include_computed_columns(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    worker: BackgroundWorker,
+) -> None:
+    # Arrange
+    with production_mksession.begin() as session:
+        number = Number(value=3)
+        session.add(number)
+
+    # Act
+    log_changes(of=production_mksession, to=audit_engine, worker=worker)
+    with production_mksession.begin() as session:
+        number = session.execute(select(Number)).scalar_one()
+        number.value = 5
+    worker.join()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog)).scalars().all()
+        assert len(change_logs) == 1
+        assert change_logs[0].type == OpType.UPDATE
+        assert change_logs[0].diff == dict(value=Diff(old=3, new=5))
+        assert change_logs[0].record_id == number.id
+
+
+def test_deferred_diff_has_the_values_as_they_were_flushed(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    worker: BackgroundWorker,
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, worker=worker)
+    flushed = threading.Event()
+    # keeps the worker from building the diff until the value was changed
+    worker.submit(flushed.wait, 5)
+    tags = ["draft"]
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add(Document(content={"tags": tags}))
+    tags.append("changed in place")
+    flushed.set()
+    worker.join()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_log = audit_session.execute(select(ChangeLog)).scalar_one()
+        assert change_log.diff["content"] == Diff(old=None, new={"tags": ["draft"]})
+
+
+def test_worker_keeps_running_after_a_failed_task() -> None:
+    # Arrange
+    results: list[int] = []
+    worker = BackgroundWorker()
+
+    def fail() -> None:
+        raise RuntimeError("nope")
+
+    # Act
+    worker.submit(fail)
+    worker.submit(results.append, 1)
+    worker.join()
+    worker.close()
+
+    # Assert
+    assert results == [1]
@@ -0,0 +1,148 @@
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_log import ChangeLog
+from resql.deltas import (
+    CHAR_PATCH,
+    JSON_PATCH,
+    TEXT_PATCH,
+    apply_char_patch,
+    apply_json_patch,
+    apply_text_patch,
+    make_char_patch,
+    make_json_patch,
+    make_text_patch,
+    resolve_diffs,
+)
+from resql.recovery import undo
+from tests.models import Base, Document
+from tests.utils import now_in_utc
+
+
+def make_content(size: int) -> dict[str, Any]:
+    return {"items": [{"id": item_id, "tags": ["a", "b"]} for item_id in range(size)], "title": "Report"}
+
+
+def make_body(size: int) -> str:
+    return "".join(f"Line {line_no}\n" for line_no in range(size))
+
+
+def test_json_patch_round_trip() -> None:
+    # Arrange
+    old = make_content(10)
+    new = make_content(10)
+    new["items"][3]["tags"].append("c")
+    new["title"] = "Final report"
+    new["author"] = "Someone"
+    del new["items"][5]["tags"]
+
+    # Act
+    patch = make_json_patch(old, new)
+
+    # Assert
+    assert len(patch) == 4
+    assert apply_json_patch(old, patch) == new
+    assert old == make_content(10)
+    assert apply_json_patch(old, make_json_patch(old, [1, 2])) == [1, 2]
+
+
+def test_text_patch_round_trip() -> None:
+    # Arrange
+    old = make_body(100)
+    new = old.replace("Line 10\n", "Line ten\n").replace("Line 50\n", "") + "The end"
+
+    # Act
+    patch = make_text_patch(old, new)
+
+    # Assert
+    assert len(patch) == 3
+    assert apply_text_patch(old, patch) == new
+
+
+def test_char_patch_round_trip() -> None:
+    # Arrange
+    old = "token-" * 100
+
+    # Act
+    patches = [make_char_patch(old, new) for new in (old[:300] + "changed" + old[310:], old[6:], old + old, "")]
+
+    # Assert
+    assert patches[0] == [(300, 310, "changed")]
+    assert [apply_char_patch(old, patch) for patch in patches] == [
+        old[:300] + "changed" + old[310:],
+        old[6:],
+        old + old,
+        "",
+    ]
+
+
+def test_large_changes_are_logged_as_deltas(  # pylint: disable=too-many-locals
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, delta_threshold=1000)
+    content, body = make_content(100), make_body(200)
+    with production_mksession.begin() as session:
+        document = Document(body=body, content=content)
+        session.add(document)
+    new_content, new_body = {**content, "title": "Final report"}, body.replace("Line 150\n", "Line 150!\n")
+    since = now_in_utc()
+
+    # Act
+    with production_mksession.begin() as session:
+        loaded = session.get(Document, document.id)
+        loaded.content = new_content
+        loaded.body = new_body
+    with production_mksession.begin() as session:
+        loaded = session.get(Document, document.id)
+        loaded.content = {"title": "Short"}
+        loaded.body = "Short"
+    undo(source=audit_engine, target=production_engine, metadata=Base.metadata, since=since)
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        history = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        _, first_update, second_update = history
+        assert first_update.diff == {
+            "body": {TEXT_PATCH: [[150, 151, "Line 150!\n"]]},
+            "content": {JSON_PATCH: [{"op": "replace", "path": ["title"], "value": "Final report"}]},
+        }
+        assert second_update.diff["body"] == {"old": new_body, "new": "Short"}
+        diffs = resolve_diffs(history)
+        assert diffs[1] == {"body": {"old": body, "new": new_body}, "content": {"old": content, "new": new_content}}
+        assert diffs[2]["content"] == {"old": new_content, "new": {"title": "Short"}}
+    with production_mksession.begin() as session:
+        restored = session.get(Document, document.id)
+        assert (restored.body, restored.content) == (body, content)
+
+
+def test_single_line_text_is_logged_as_a_character_delta(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, delta_threshold=100)
+    body = '{"tokens": [' + ",".join(f'"token-{token_no}"' for token_no in range(100)) + "]}"
+    with production_mksession.begin() as session:
+        document = Document(body=body)
+        session.add(document)
+    new_body = body.replace('"token-50"', '"renamed"')
+
+    # Act
+    with production_mksession.begin() as session:
+        session.get(Document, document.id).body = new_body
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        history = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        start = body.index("50")
+        assert history[1].diff == {"body": {CHAR_PATCH: [[start - 6, start + 2, "renamed"]]}}
+        assert resolve_diffs(history)[1] == {"body": {"old": body, "new": new_body}}
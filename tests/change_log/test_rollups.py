@@ -0,0 +1,104 @@
+import datetime as dt
+from collections import Counter
+from typing import Any
+
+import pytest
+from sqlalchemy import event, insert, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_log import ChangeLog, OpType, get_change_rates
+from resql.change_rollup import RECORD_TABLE_NAME, add_changes, get_bucket
+from resql.daemon import AuditWriterClient
+from resql.util import get_sibling_table
+from tests.models import Person
+
+HOUR = dt.timedelta(hours=1)
+
+
+def test_change_rates_match_the_change_log(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, rollup_interval=HOUR, rollup_records=True, chunk_size=2)
+
+    # Act
+    with production_mksession.begin() as session:
+        first, second, third = Person(name="First"), Person(name="Second"), Person(name="Third")
+        session.add_all([first, second, third])
+    for age in (10, 20):
+        with production_mksession.begin() as session:
+            session.get(Person, first.id).age = age
+            session.get(Person, second.id).age = age
+    with production_mksession.begin() as session:
+        session.delete(session.get(Person, third.id))
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        logs = audit_session.execute(select(ChangeLog)).scalars().all()
+        rates = get_change_rates(audit_session, HOUR)
+        updates = get_change_rates(audit_session, HOUR, table_name="person", op_type=OpType.UPDATE)
+        other_interval = get_change_rates(audit_session, dt.timedelta(minutes=1))
+    expected = Counter((log.table_name, log.type, get_bucket(log.executed_at, HOUR)) for log in logs)
+    assert Counter({(rate.table_name, rate.type, rate.bucket): rate.changes for rate in rates}) == expected
+    assert sum(rate.changes for rate in updates) == 4
+    assert sum(rate.records or 0 for rate in updates) == len({rate.bucket for rate in updates}) * 2
+    assert sorted((rate.type, rate.records) for rate in rates if rate.type != OpType.UPDATE) == [
+        (OpType.DELETE, 1),
+        (OpType.INSERT, 3),
+    ]
+    assert not other_interval
+
+
+def test_records_added_concurrently_are_neither_duplicated_nor_counted_twice(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    executed_at = dt.datetime(2021, 3, 4, 5, 6, 7, tzinfo=dt.timezone.utc)
+    logs = [
+        ChangeLog(
+            diff={}, executed_at=executed_at, extra=None, record_id=record_id, table_name="person", type=OpType.UPDATE
+        )
+        for record_id in (1, 2)
+    ]
+    record_table = get_sibling_table(ChangeLog, RECORD_TABLE_NAME)
+    competing_rows = [
+        dict(table_name="person", type="Update", bucket_seconds=3600, bucket=get_bucket(executed_at, HOUR), record_id=1)
+    ]
+
+    def add_record_concurrently(_: Any, __: Any, statement: str, *___: Any) -> None:
+        # as if another writer added record 1 to the bucket right before this one does
+        if competing_rows and statement.startswith("INSERT") and RECORD_TABLE_NAME in statement:
+            with audit_engine.begin() as conn:
+                conn.execute(insert(record_table).values(competing_rows.pop()))
+
+    event.listen(audit_engine, "before_cursor_execute", add_record_concurrently)
+
+    # Act
+    with audit_mksession.begin() as audit_session:
+        add_changes(audit_session, ChangeLog, logs, HOUR, records=True)
+    event.remove(audit_engine, "before_cursor_execute", add_record_concurrently)
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        rates = get_change_rates(audit_session, HOUR)
+        assert len(audit_session.execute(select(record_table)).all()) == 2
+    assert [(rate.changes, rate.records) for rate in rates] == [(2, 1)]
+
+
+def test_get_bucket() -> None:
+    # Act
+    bucket = get_bucket(dt.datetime(2021, 3, 4, 5, 6, 7, tzinfo=dt.timezone.utc), dt.timedelta(minutes=15))
+
+    # Assert
+    assert bucket == dt.datetime(2021, 3, 4, 5, 0, tzinfo=dt.timezone.utc)
+
+
+def test_rollups_require_an_engine() -> None:
+    # Act / Assert
+    with pytest.raises(ValueError):
+        log_changes(of=sessionmaker(), to=AuditWriterClient("/nonexistent"), rollup_interval=HOUR)
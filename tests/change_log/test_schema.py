@@ -0,0 +1,75 @@
+from typing import Any
+
+from sqlalchemy import MetaData, create_engine, create_mock_engine, insert, inspect, select
+
+from resql import change_log, query_log
+from resql.change_log import OpType
+from resql.util import now_in_utc
+
+
+def postgresql_ddl(metadata: MetaData) -> str:
+    statements = []
+
+    def executor(sql: Any, *_: Any, **__: Any) -> None:
+        statements.append(str(sql.compile(dialect=engine.dialect)))
+
+    engine = create_mock_engine("postgresql+psycopg2://", executor)
+    metadata.create_all(engine, checkfirst=False)  # type: ignore[arg-type]
+    return "\n".join(statements)
+
+
+def test_postgresql_tables_use_jsonb_brin_and_gin() -> None:
+    # Arrange
+    metadata = MetaData()
+    change_log.default_table(metadata, gin_indexes=True)
+    query_log.default_table(metadata, gin_indexes=True)
+
+    # Act
+    ddl = postgresql_ddl(metadata)
+
+    # Assert
+    assert "diff JSONB NOT NULL" in ddl
+    assert "parameters JSONB" in ddl
+    assert "ON change_log USING brin (executed_at)" in ddl
+    assert "ON query_log USING brin (executed_at)" in ddl
+    for table_name, column_name in (
+        ("change_log", "diff"),
+        ("change_log", "extra"),
+        ("query_log", "extra"),
+        ("query_log", "parameters"),
+    ):
+        assert f"ON {table_name} USING gin ({column_name} jsonb_path_ops)" in ddl
+
+
+def test_gin_indexes_are_optional() -> None:
+    metadata = MetaData()
+    change_log.default_table(metadata)
+    assert "gin" not in postgresql_ddl(metadata)
+
+
+def test_indexed_diff_keys_can_be_searched_by_value() -> None:
+    # Arrange
+    engine = create_engine("sqlite://", future=True)
+    metadata = MetaData()
+    table = change_log.default_table(metadata, indexed_diff_keys=("name",))
+    metadata.create_all(engine)
+    logs = [
+        dict(diff=dict(name=dict(old=None, new="A")), record_id=1),
+        dict(diff=dict(name=dict(old="A", new="B")), record_id=1),
+        dict(diff=dict(age=dict(old=None, new=1)), record_id=2),
+    ]
+
+    # Act
+    with engine.begin() as conn:
+        for log in logs:
+            conn.execute(insert(table).values(**log, executed_at=now_in_utc(), table_name="person", type=OpType.UPDATE))
+        found = conn.execute(select(table.c.record_id).where(table.c.diff_name_new == "B")).all()
+
+    # Assert
+    assert found == [(1,)]
+    index_names = {index["name"] for index in inspect(engine).get_indexes("change_log")}
+    assert index_names == {
+        "ix_change_log_diff_name_new",
+        "ix_change_log_executed_at",
+        "ix_change_log_table_name_record_id",
+    }
@@ -0,0 +1,86 @@
+from sqlalchemy import select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_log import ChangeLog, OpType
+from resql.worker import BackgroundWorker
+from tests.models import Account, Document, PageView, Person
+
+
+def test_tables_and_columns_excluded_through_info(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine)
+
+    # Act
+    with production_mksession.begin() as session:
+        account = Account(name="Someone", login_count=1)
+        session.add_all([account, PageView(path="/")])
+    with production_mksession.begin() as session:
+        session.get(Account, account.id).login_count = 2
+    with production_mksession.begin() as session:
+        session.get(Account, account.id).name = "Someone Else"
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        assert [(log.table_name, log.type, log.diff) for log in change_logs] == [
+            ("account", OpType.INSERT, {"name": {"old": None, "new": "Someone"}}),
+            ("account", OpType.UPDATE, {"name": {"old": "Someone", "new": "Someone Else"}}),
+        ]
+
+
+def test_tables_and_columns_excluded_through_arguments(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    worker = BackgroundWorker()
+    log_changes(
+        of=production_mksession,
+        to=audit_engine,
+        worker=worker,
+        exclude_tables=["document"],
+        exclude_columns=["person.age", "name"],
+    )
+
+    # Act
+    with production_mksession.begin() as session:
+        person = Person(name="Someone", age=20)
+        session.add_all([person, Document(body="Text")])
+    with production_mksession.begin() as session:
+        session.get(Person, person.id).age = 21
+    with production_mksession.begin() as session:
+        session.delete(session.get(Person, person.id))
+    worker.close()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        assert [(log.table_name, log.type, log.diff) for log in change_logs] == [
+            ("person", OpType.INSERT, {}),
+            ("person", OpType.DELETE, {}),
+        ]
+
+
+def test_only_included_tables_are_audited(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, include_tables=["document"])
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add_all([Person(name="Someone"), Document(body="Text")])
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog)).scalars().all()
+        assert [(log.table_name, log.type) for log in change_logs] == [("document", OpType.INSERT)]
@@ -0,0 +1,290 @@
+import threading
+from pathlib import Path
+from typing import Any, Iterator
+
+import pytest
+from pytest import fixture
+from sqlalchemy import event, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes, log_queries
+from resql.change_log import ChangeLog, OpType
+from resql.daemon import AuditWriterClient, AuditWriterDaemon, write_spooled
+from resql.log_context import LogContextCache
+from resql.query_log import QueryLog
+from tests.models import Person
+from tests.utils import Registries
+
+
+@fixture(name="audit_daemon")
+def _audit_daemon(audit_engine: Engine, registries: Registries, tmp_path: Path) -> Iterator[AuditWriterDaemon]:
+    daemon = AuditWriterDaemon(audit_engine, registries.audit.metadata, str(tmp_path / "audit.sock"))
+    daemon.start()
+    yield daemon
+    daemon.close()
+
+
+@fixture(name="recovery_daemon")
+def _recovery_daemon(
+    recovery_engine: Engine,
+    registries: Registries,
+    tmp_path: Path,
+) -> Iterator[AuditWriterDaemon]:
+    daemon = AuditWriterDaemon(recovery_engine, registries.recovery.metadata, str(tmp_path / "recovery.sock"))
+    daemon.start()
+    yield daemon
+    daemon.close()
+
+
+def test_change_logs_are_written_by_the_daemon(
+    audit_daemon: AuditWriterDaemon,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    client = AuditWriterClient(audit_daemon.address)
+    extra = dict(user_agent="testing")
+
+    # Act
+    log_changes(of=production_mksession, to=client, extra=extra)
+    with production_mksession.begin() as session:
+        session.add_all([Person(name="A", age=1), Person(name="B", age=2)])
+    client.flush()
+    client.close()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        change_logs = audit_session.execute(select(ChangeLog).order_by(ChangeLog.record_id)).scalars().all()
+        assert len(change_logs) == 2
+        assert all(log.type == OpType.INSERT for log in change_logs)
+        assert all(log.extra == extra for log in change_logs)
+        assert [log.diff["name"]["new"] for log in change_logs] == ["A", "B"]
+
+
+def test_logs_of_many_clients_are_written_together(
+    recovery_daemon: AuditWriterDaemon,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    people_per_client = 20
+
+    def insert_people(client_no: int) -> None:
+        client = AuditWriterClient(recovery_daemon.address)
+        with production_engine.connect() as conn:
+            log_queries(of=conn, to=client, extra=dict(client_no=client_no))
+            for person_no in range(people_per_client):
+                conn.execute(insert(Person).values(name=f"{client_no}-{person_no}", age=person_no))
+            conn.commit()
+        client.flush()
+        client.close()
+
+    # Act
+    threads = [threading.Thread(target=insert_people, args=(client_no,)) for client_no in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_logs = recovery_session.execute(select(QueryLog)).scalars().all()
+        assert len(query_logs) == 3 * people_per_client
+        for client_no in range(3):
+            client_logs = [log for log in query_logs if log.extra == dict(client_no=client_no)]
+            assert len(client_logs) == people_per_client
+
+
+def test_context_cache_requires_an_engine(tmp_path: Path) -> None:
+    client = AuditWriterClient(str(tmp_path / "unused.sock"))
+    with pytest.raises(ValueError):
+        log_changes(of=sessionmaker(), to=client, context_cache=LogContextCache())
+
+
+def test_an_authkey_is_required_over_tcp(audit_engine: Engine, registries: Registries) -> None:
+    with pytest.raises(ValueError):
+        AuditWriterDaemon(audit_engine, registries.audit.metadata, ("localhost", 0))
+    with pytest.raises(ValueError):
+        AuditWriterClient(("localhost", 6000))
+
+
+def test_logs_are_written_over_tcp_with_an_authkey(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    registries: Registries,
+) -> None:
+    # Arrange
+    daemon = AuditWriterDaemon(audit_engine, registries.audit.metadata, ("localhost", 0), authkey=b"secret")
+    daemon.start()
+    client = AuditWriterClient(daemon.address, authkey=b"secret")
+
+    # Act
+    log_changes(of=production_mksession, to=client)
+    with production_mksession.begin() as session:
+        session.add(Person(name="A", age=1))
+    client.flush()
+    client.close()
+    daemon.close()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        assert len(audit_session.execute(select(ChangeLog)).scalars().all()) == 1
+
+
+class FailingInserts:
+    def __init__(self, engine: Engine, failures: int, containing: str = "") -> None:
+        self.engine = engine
+        self.failures = failures
+        # only statements with parameters that contain it fail
+        self.containing = containing
+
+    def __enter__(self) -> "FailingInserts":
+        event.listen(self.engine, "before_cursor_execute", self.fail)
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        event.remove(self.engine, "before_cursor_execute", self.fail)
+
+    def fail(self, _: Any, __: Any, ___: Any, parameters: Any, *____: Any) -> None:
+        if self.failures and self.containing in str(parameters):
+            self.failures -= 1
+            raise OperationalError("INSERT", {}, Exception("database is down"))
+
+
+def test_failed_batches_are_written_again(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    registries: Registries,
+    tmp_path: Path,
+) -> None:
+    # Arrange
+    daemon = AuditWriterDaemon(audit_engine, registries.audit.metadata, str(tmp_path / "audit.sock"), retry_delay=0)
+    daemon.start()
+    client = AuditWriterClient(daemon.address)
+    log_changes(of=production_mksession, to=client)
+
+    # Act
+    with FailingInserts(audit_engine, failures=2):
+        with production_mksession.begin() as session:
+            session.add(Person(name="A", age=1))
+        client.flush()
+    client.close()
+    daemon.close()
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        assert len(audit_session.execute(select(ChangeLog)).scalars().all()) == 1
+
+
+def test_batches_that_keep_failing_are_spooled(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    registries: Registries,
+    tmp_path: Path,
+) -> None:
+    # Arrange
+    spool_path = str(tmp_path / "audit.spool")
+    daemon = AuditWriterDaemon(
+        audit_engine,
+        registries.audit.metadata,
+        str(tmp_path / "audit.sock"),
+        spool_path=spool_path,
+        max_attempts=2,
+        retry_delay=0,
+    )
+    daemon.start()
+    client = AuditWriterClient(daemon.address)
+    log_changes(of=production_mksession, to=client)
+    # every attempt, and then the message and its row, fail
+    with FailingInserts(audit_engine, failures=4):
+        with production_mksession.begin() as session:
+            session.add(Person(name="A", age=1))
+        client.flush()
+    client.close()
+    daemon.close()
+
+    # Act
+    written = write_spooled(audit_engine, registries.audit.metadata, spool_path)
+
+    # Assert
+    assert written == 1
+    assert write_spooled(audit_engine, registries.audit.metadata, spool_path) == 0
+    with audit_mksession.begin() as audit_session:
+        change_log = audit_session.execute(select(ChangeLog)).scalar_one()
+        assert (change_log.type, change_log.diff["name"]) == (OpType.INSERT, {"old": None, "new": "A"})
+
+
+def test_batches_that_keep_failing_without_a_spool_are_dropped(
+    audit_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    registries: Registries,
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    # Arrange
+    daemon = AuditWriterDaemon(
+        audit_engine, registries.audit.metadata, str(tmp_path / "audit.sock"), max_attempts=2, retry_delay=0
+    )
+    daemon.start()
+    client = AuditWriterClient(daemon.address)
+    log_changes(of=production_mksession, to=client)
+
+    # Act
+    # every attempt, and then the message and its row, fail
+    with FailingInserts(audit_engine, failures=4):
+        with production_mksession.begin() as session:
+            session.add(Person(name="A", age=1))
+        client.flush()
+    with production_mksession.begin() as session:
+        session.add(Person(name="B", age=2))
+    client.flush()
+    client.close()
+    daemon.close()
+
+    # Assert
+    assert any("Dropped 1 rows of change_log" in record.getMessage() for record in caplog.records)
+    with audit_engine.connect() as conn:
+        diff = conn.execute(select(ChangeLog.diff)).scalar_one()
+        assert diff["name"]["new"] == "B"
+
+
+def test_only_rows_that_fail_on_their_own_are_set_aside(
+    audit_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    registries: Registries,
+    tmp_path: Path,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    # Arrange
+    daemon = AuditWriterDaemon(
+        audit_engine,
+        registries.audit.metadata,
+        str(tmp_path / "audit.sock"),
+        max_delay=5,
+        max_attempts=2,
+        retry_delay=0,
+    )
+    daemon.start()
+    client = AuditWriterClient(daemon.address)
+    log_changes(of=production_mksession, to=client)
+
+    # Act
+    with FailingInserts(audit_engine, failures=10, containing="Bad"):
+        with production_mksession.begin() as session:
+            session.add_all([Person(name="Good", age=1), Person(name="Bad", age=2)])
+        with production_mksession.begin() as session:
+            session.add(Person(name="Other", age=3))
+        client.flush()
+    client.close()
+    daemon.close()
+
+    # Assert
+    assert any("Dropped 1 rows of change_log" in record.getMessage() for record in caplog.records)
+    with audit_engine.connect() as conn:
+        diffs = conn.execute(select(ChangeLog.diff)).scalars().all()
+        assert sorted(diff["name"]["new"] for diff in diffs) == ["Good", "Other"]
@@ -5,8 +5,8 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy_utc import UtcDateTime
 
+from resql.encoding import dumps, loads
 from tests.settings import Environment
-from tests.utils import from_json, to_json
 
 AUDIT_ENGINE: Engine
 RECOVERY_ENGINE: Engine
@@ -19,24 +19,24 @@ def init_engines(env: Environment) -> None:
         env.audit_url,
         echo=True,
         future=True,
-        json_deserializer=from_json,
-        json_serializer=to_json,
+        json_deserializer=loads,
+        json_serializer=dumps,
         logging_name="AUDITING",
     )
     RECOVERY_ENGINE = create_engine(
         env.recovery_url,
         echo=True,
         future=True,
-        json_deserializer=from_json,
-        json_serializer=to_json,
+        json_deserializer=loads,
+        json_serializer=dumps,
         logging_name="RECOVERY",
     )
     PRODUCTION_ENGINE = create_engine(
         env.production_url,
         echo=True,
         future=True,
-        json_deserializer=from_json,
-        json_serializer=to_json,
+        json_deserializer=loads,
+        json_serializer=dumps,
         logging_name="PRODUCTN",
     )
 
@@ -0,0 +1,143 @@
+import datetime as dt
+import uuid
+from decimal import Decimal
+from pathlib import Path
+from typing import cast
+
+import pytest
+from sqlalchemy import Enum, create_engine, insert, select, update
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes, log_queries
+from resql.change_log import ChangeLog
+from resql.encoding import Converter, dumps, get_converter, get_decoder, loads
+from resql.query_log import QueryLog
+from resql.restore import restore
+from resql.util import enum_values
+from tests.models import Base, Document, Payment, PaymentKind
+from tests.utils import Registries
+
+PAID_AT = dt.datetime(2021, 1, 1, 12, 30, 15, 123456)
+
+
+@pytest.mark.filterwarnings("ignore:Dialect sqlite\\+pysqlite does \\*not\\* support Decimal objects natively")
+def test_values_are_encoded_by_column_type(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine)
+    payment = Payment(
+        id=1, amount=Decimal("12.50"), kind=PaymentKind.CARD, paid_at=PAID_AT, settlement=dt.timedelta(days=2)
+    )
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add(payment)
+    with production_engine.begin() as conn:
+        conn.execute(update(Payment).values(amount=None, kind=None, paid_at=None, settlement=None))
+    restore(source=audit_engine, target=production_engine, metadata=Base.metadata, tables=["payment"])
+
+    # Assert
+    with audit_mksession.begin() as session:
+        assert session.execute(select(ChangeLog)).scalar_one().diff == {
+            "id": {"old": None, "new": 1},
+            "amount": {"old": None, "new": "12.50"},
+            "kind": {"old": None, "new": "CARD"},
+            "paid_at": {"old": None, "new": "2021-01-01T12:30:15.123456"},
+            "settlement": {"old": None, "new": 172800.0},
+        }
+    with production_mksession.begin() as session:
+        restored = session.get(Payment, 1)
+        assert (restored.amount, restored.kind, restored.paid_at, restored.settlement) == (
+            Decimal("12.50"),
+            PaymentKind.CARD,
+            PAID_AT,
+            dt.timedelta(days=2),
+        )
+
+
+def test_parameters_are_encoded_by_bind_type(
+    recovery_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_engine: Engine,
+) -> None:
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Payment).values(id=1, amount=Decimal("0.10"), kind=PaymentKind.TRANSFER, paid_at=PAID_AT))
+        conn.commit()
+
+    # Assert
+    with recovery_mksession.begin() as session:
+        assert session.execute(select(QueryLog.parameters)).scalar_one() == [
+            {"id": 1, "amount": "0.10", "kind": "TRANSFER", "paid_at": "2021-01-01T12:30:15.123456"}
+        ]
+
+
+def test_enums_are_encoded_as_their_column_stores_them() -> None:
+    # Arrange
+    by_name, by_value = Enum(PaymentKind), Enum(PaymentKind, values_callable=enum_values)
+
+    # Act
+    encoded = [cast(Converter, get_converter(type_))(PaymentKind.TRANSFER) for type_ in (by_name, by_value)]
+    decoded = [cast(Converter, get_decoder(type_))(value) for type_, value in zip((by_name, by_value), encoded)]
+
+    # Assert
+    assert encoded == ["TRANSFER", "transfer"]
+    assert decoded == [PaymentKind.TRANSFER, PaymentKind.TRANSFER]
+
+
+def test_binary_values_are_logged_without_configuring_the_engine(
+    registries: Registries,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    tmp_path: Path,
+) -> None:
+    # Arrange
+    engine: Engine = create_engine(f"sqlite:///{tmp_path / 'logs.sqlite3'}", future=True)
+    registries.audit.metadata.create_all(engine)
+    registries.recovery.metadata.create_all(engine)
+    log_changes(of=production_mksession, to=engine)
+
+    # Act
+    with production_mksession.begin() as session:
+        session.add(Document(id=1, attachment=b"\x00\xff"))
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=engine)
+        conn.execute(update(Document).values(attachment=b"\xff"))
+        conn.commit()
+
+    # Assert
+    with engine.connect() as conn:
+        assert conn.execute(select(ChangeLog.diff)).scalar_one()["attachment"] == {"old": None, "new": "AP8="}
+        assert conn.execute(select(QueryLog.parameters)).scalar_one() == [{"attachment": "/w=="}]
+    engine.dispose()
+
+
+def test_dumps_and_loads() -> None:
+    # Arrange
+    value = {
+        "at": dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc),
+        "on": dt.date(2021, 1, 1),
+        "id": uuid.UUID(int=1),
+        "price": Decimal("1.10"),
+        "kind": PaymentKind.CARD,
+        "data": b"\x00\xff",
+    }
+
+    # Act
+    dumped = dumps(value)
+
+    # Assert
+    assert loads(dumped) == {
+        "at": "2021-01-01T00:00:00+00:00",
+        "on": "2021-01-01",
+        "id": "00000000-0000-0000-0000-000000000001",
+        "price": "1.10",
+        "kind": "card",
+        "data": "AP8=",
+    }
@@ -0,0 +1,120 @@
+import copy
+
+from sqlalchemy import insert, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes, log_queries
+from resql.change_log import ChangeLog
+from resql.log_context import LogContextCache, get_table, hash_extra
+from resql.query_log import QueryLog
+from tests.models import Person
+
+
+def test_extra_is_stored_once_per_unique_value_for_change_logs(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    extra = dict(user_agent="testing")
+    cache = LogContextCache()
+
+    # Act
+    with production_mksession() as session:
+        log_changes(of=session, to=audit_engine, extra=copy.deepcopy(extra), context_cache=cache)
+        session.add_all([Person(name="A", age=1), Person(name="B", age=2)])
+        session.commit()
+        session.add(Person(name="C", age=3))
+        session.commit()
+
+    # Assert
+    context_table = get_table(ChangeLog)
+    with audit_mksession.begin() as audit_session:
+        contexts = audit_session.execute(select(context_table)).all()
+        assert len(contexts) == 1
+        assert contexts[0].extra == extra
+        assert contexts[0].hash == hash_extra(extra)
+
+        change_logs = audit_session.execute(select(ChangeLog)).scalars().all()
+        assert len(change_logs) == 3
+        assert all(log.extra is None for log in change_logs)
+        assert all(log.context_id == contexts[0].id for log in change_logs)
+
+
+def test_different_extras_get_different_contexts(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    cache = LogContextCache()
+
+    # Act
+    with production_mksession.begin() as session_1:
+        log_changes(of=session_1, to=audit_engine, extra=dict(session_no=1), context_cache=cache)
+        session_1.add(Person(name="A", age=1))
+    with production_mksession.begin() as session_2:
+        log_changes(of=session_2, to=audit_engine, extra=dict(session_no=2), context_cache=cache)
+        session_2.add(Person(name="B", age=2))
+    with production_mksession.begin() as session_3:
+        log_changes(of=session_3, to=audit_engine, extra=dict(session_no=1), context_cache=cache)
+        session_3.add(Person(name="C", age=3))
+
+    # Assert
+    context_table = get_table(ChangeLog)
+    with audit_mksession.begin() as audit_session:
+        contexts = audit_session.execute(select(context_table).order_by(context_table.c.id)).all()
+        assert [context.extra for context in contexts] == [dict(session_no=1), dict(session_no=2)]
+
+        change_logs = audit_session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        assert [log.context_id for log in change_logs] == [contexts[0].id, contexts[1].id, contexts[0].id]
+
+
+def test_existing_context_is_reused_by_a_new_cache(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    extra = dict(user_agent="testing")
+
+    # Act
+    for name in ("A", "B"):
+        with production_mksession.begin() as session:
+            log_changes(of=session, to=audit_engine, extra=extra, context_cache=LogContextCache())
+            session.add(Person(name=name, age=1))
+
+    # Assert
+    with audit_mksession.begin() as audit_session:
+        contexts = audit_session.execute(select(get_table(ChangeLog))).all()
+        assert len(contexts) == 1
+        change_logs = audit_session.execute(select(ChangeLog)).scalars().all()
+        assert [log.context_id for log in change_logs] == [contexts[0].id, contexts[0].id]
+
+
+def test_extra_is_stored_once_per_unique_value_for_query_logs(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    extra = dict(user_agent="testing")
+
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, extra=copy.deepcopy(extra), context_cache=LogContextCache())
+        conn.execute(insert(Person).values(name="A", age=1))
+        conn.execute(insert(Person).values(name="B", age=2))
+        conn.commit()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        contexts = recovery_session.execute(select(get_table(QueryLog))).all()
+        assert len(contexts) == 1
+        assert contexts[0].extra == extra
+
+        query_logs = recovery_session.execute(select(QueryLog)).scalars().all()
+        assert len(query_logs) == 2
+        assert all(log.extra is None for log in query_logs)
+        assert all(log.context_id == contexts[0].id for log in query_logs)
@@ -1,9 +1,64 @@
-from sqlalchemy import Column, Computed, Integer, String, Table
+import enum
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    Computed,
+    DateTime,
+    Enum,
+    Integer,
+    Interval,
+    LargeBinary,
+    Numeric,
+    String,
+    Table,
+    Text,
+)
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
 
+class Account(Base):
+    __tablename__ = "account"
+
+    id = Column(Integer, primary_key=True)
+    login_count = Column(Integer, info={"resql_audit": False})
+    name = Column(String(64), nullable=False)
+
+
+class PageView(Base):
+    __tablename__ = "page_view"
+    __table_args__ = {"info": {"resql_audit": False}}
+
+    id = Column(Integer, primary_key=True)
+    path = Column(String(256), nullable=False)
+
+
+class Document(Base):
+    __tablename__ = "document"
+
+    id = Column(Integer, primary_key=True)
+    attachment = Column(LargeBinary)
+    body = Column(Text)
+    content = Column(JSON)
+
+
+class PaymentKind(enum.Enum):
+    CARD = "card"
+    TRANSFER = "transfer"
+
+
+class Payment(Base):
+    __tablename__ = "payment"
+
+    id = Column(Integer, primary_key=True)
+    amount = Column(Numeric(10, 2))
+    kind = Column(Enum(PaymentKind))
+    paid_at = Column(DateTime)
+    settlement = Column(Interval)
+
+
 class ImperativeModel:
     id: int
     value: str
@@ -0,0 +1,111 @@
+import threading
+
+from sqlalchemy import insert, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_queries
+from resql.query_log import QueryLog
+from resql.query_stats import MAX_CACHED_STATEMENTS, QueryStat, StatementAggregator, fingerprint, normalize
+from tests.models import Person
+
+
+def test_normalize_replaces_literals_and_collapses_lists() -> None:
+    assert normalize("SELECT *\n  FROM person WHERE name = 'O''Brien' AND age > 30") == (
+        "SELECT * FROM person WHERE name = ? AND age > ?"
+    )
+    assert normalize("SELECT * FROM person WHERE id IN (?, ?, ?)") == normalize("SELECT * FROM person WHERE id IN (?)")
+    assert normalize("SELECT * FROM person WHERE id IN (__[POSTCOMPILE_id_1])") == normalize(
+        "SELECT * FROM person WHERE id IN (%(id_1)s)"
+    )
+    assert normalize("INSERT INTO person (name) VALUES (?), (?), (?)") == "INSERT INTO person (name) VALUES (...)"
+    assert normalize("SELECT * FROM table1 WHERE x::int = $1") == "SELECT * FROM table1 WHERE x::int = ?"
+
+
+def test_statements_are_aggregated_by_fingerprint(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    aggregator = StatementAggregator(recovery_engine)
+
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, aggregator=aggregator)
+        conn.execute(insert(Person), [dict(name="A", age=1), dict(name="B", age=2)])
+        for age in range(5):
+            conn.execute(select(Person).where(Person.age == age)).all()
+        conn.commit()
+    aggregator.flush()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_stats = recovery_session.execute(select(QueryStat).order_by(QueryStat.calls)).scalars().all()
+        assert len(query_stats) == 2
+        assert query_stats[0].statement.startswith("INSERT INTO person")
+        assert query_stats[0].calls == 1
+        assert query_stats[0].row_count == 2
+        assert query_stats[1].statement.startswith("SELECT")
+        assert query_stats[1].calls == 5
+        for stat in query_stats:
+            assert stat.fingerprint == fingerprint(stat.statement)
+            assert stat.dialect_description == getattr(production_engine.dialect, "dialect_description")
+            assert 0 <= stat.min_duration <= stat.p50_duration <= stat.p99_duration <= stat.max_duration
+            assert stat.total_duration >= stat.max_duration
+            assert stat.period_start <= stat.period_end
+
+        # aggregating doesn't change regular logging
+        query_logs = recovery_session.execute(select(QueryLog)).scalars().all()
+        assert len(query_logs) == 1
+        assert query_logs[0].duration is None
+
+
+def test_aggregates_are_flushed_periodically(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    aggregator = StatementAggregator(recovery_engine, flush_interval=0)
+
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, aggregator=aggregator)
+        conn.execute(select(Person)).all()
+        conn.execute(select(Person)).all()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_stats = recovery_session.execute(select(QueryStat)).scalars().all()
+        assert [stat.calls for stat in query_stats] == [1, 1]
+        assert query_stats[0].period_end <= query_stats[1].period_start
+
+
+def test_statements_are_aggregated_from_several_threads(
+    recovery_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    aggregator = StatementAggregator(recovery_engine)
+
+    def record(thread: int) -> None:
+        for age in range(MAX_CACHED_STATEMENTS // 2):
+            aggregator.record("sqlite+pysqlite", f"SELECT * FROM person WHERE age = {thread * 10_000 + age}", 0.001, 1)
+
+    threads = [threading.Thread(target=record, args=(thread,)) for thread in range(4)]
+
+    # Act
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    aggregator.flush()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_stat = recovery_session.execute(select(QueryStat)).scalar_one()
+        assert query_stat.statement == "SELECT * FROM person WHERE age = ?"
+        assert query_stat.calls == query_stat.row_count == 2 * MAX_CACHED_STATEMENTS
+    # the literals filled the cache of normalized statements, which stays bounded
+    assert normalize.cache_info().currsize <= MAX_CACHED_STATEMENTS
@@ -0,0 +1,94 @@
+from sqlalchemy import insert, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_queries
+from resql.query_log import QueryLog
+from tests.models import Person
+
+
+def test_timed_statements_have_duration_and_row_count(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    people = [dict(name="A", age=1), dict(name="B", age=2), dict(name="C", age=3)]
+
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, timed=True)
+        conn.execute(insert(Person), people)
+        conn.execute(select(Person)).all()
+        conn.commit()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_logs = recovery_session.execute(select(QueryLog)).scalars().all()
+        assert len(query_logs) == 1
+        assert query_logs[0].type == "Insert"
+        assert query_logs[0].duration is not None
+        assert query_logs[0].duration >= 0
+        assert query_logs[0].row_count == len(people)
+
+
+def test_untimed_statements_have_no_duration(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Person).values(name="A", age=1))
+        conn.commit()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_logs = recovery_session.execute(select(QueryLog)).scalars().all()
+        assert len(query_logs) == 1
+        assert query_logs[0].duration is None
+        assert query_logs[0].row_count is None
+
+
+def test_slow_selects_should_be_logged(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, slow_threshold=0)
+        conn.execute(select(Person)).all()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_logs = recovery_session.execute(select(QueryLog)).scalars().all()
+        assert len(query_logs) == 1
+        assert query_logs[0].type == "Select"
+        assert Person.__tablename__ in query_logs[0].statement
+        assert query_logs[0].duration is not None
+
+
+def test_fast_selects_should_not_be_logged_but_other_statements_should(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, slow_threshold=60)
+        conn.execute(select(Person)).all()
+        conn.execute(insert(Person).values(name="A", age=1))
+        conn.commit()
+
+    # Assert
+    with recovery_mksession.begin() as recovery_session:
+        query_logs = recovery_session.execute(select(QueryLog)).scalars().all()
+        assert len(query_logs) == 1
+        assert query_logs[0].type == "Insert"
+        assert query_logs[0].duration is not None
+        assert query_logs[0].duration < 60
@@ -0,0 +1,167 @@
+from pathlib import Path
+from typing import Any, Iterator, Sequence
+
+import pytest
+from pytest import fixture
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table, create_engine, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from resql.auditing import log_queries
+from resql.query_log import QueryLog
+from tests.models import Person
+
+metadata = MetaData()
+Parent = Table("parent", metadata, Column("id", Integer, primary_key=True))
+Child = Table(
+    "child",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("parent_id", Integer, ForeignKey("parent.id", deferrable=True, initially="DEFERRED")),
+)
+
+
+@fixture(name="deferred_engine")
+def _deferred_engine(tmp_path: Path) -> Iterator[Engine]:
+    """An engine whose foreign keys are only checked at commit."""
+    engine: Engine = create_engine(f"sqlite:///{tmp_path / 'deferred.sqlite3'}", future=True)
+    metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+class FailingWriter:
+    @staticmethod
+    def write(logs: Sequence[Any]) -> None:
+        raise RuntimeError("The audit database is down")
+
+
+class ListWriter:
+    def __init__(self) -> None:
+        self.chunks: list[Sequence[Any]] = []
+
+    def write(self, logs: Sequence[Any]) -> None:
+        self.chunks.append(logs)
+
+
+def get_statements(mksession: sessionmaker) -> list[tuple[str, Any]]:  # type: ignore[type-arg]
+    with mksession.begin() as session:
+        query_logs = session.execute(select(QueryLog).order_by(QueryLog.id)).scalars().all()
+        return [(query_log.type, query_log.parameters) for query_log in query_logs]
+
+
+def test_rolled_back_statements_are_not_logged(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Person).values(name="Rolled back"))
+        conn.rollback()
+        conn.execute(insert(Person).values(name="Committed"))
+        conn.commit()
+        conn.execute(insert(Person).values(name="Never committed"))
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        with Session(conn, future=True) as session:
+            session.add(Person(name="Rolled back by the session"))
+            session.flush()
+            session.rollback()
+
+    # Assert
+    assert get_statements(recovery_mksession) == [("Insert", [{"name": "Committed"}])]
+
+
+def test_statements_of_rolled_back_savepoints_are_not_logged(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Person).values(id=1, name="Outer"))
+        with conn.begin_nested() as savepoint:
+            conn.execute(update(Person).values(name="Rolled back"))
+            with conn.begin_nested():
+                conn.execute(update(Person).values(name="Rolled back too"))
+            savepoint.rollback()
+        with conn.begin_nested():
+            conn.execute(update(Person).values(name="Released"))
+        conn.commit()
+
+    # Assert
+    assert get_statements(recovery_mksession) == [
+        ("Insert", [{"id": 1, "name": "Outer"}]),
+        ("Update", [{"name": "Released"}]),
+    ]
+
+
+def test_each_transaction_is_written_at_once(production_engine: Engine) -> None:
+    # Arrange
+    writer = ListWriter()
+
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=writer)
+        for person_no in range(3):
+            conn.execute(insert(Person).values(name=f"Person {person_no}"))
+        conn.commit()
+        conn.execute(insert(Person).values(name="Person 3"))
+        conn.commit()
+
+    # Assert
+    assert [len(chunk) for chunk in writer.chunks] == [3, 1]
+
+
+def test_statements_are_written_right_away_if_not_commit_scoped(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine, commit_scoped=False)
+        conn.execute(insert(Person).values(name="Rolled back"))
+        conn.rollback()
+
+    # Assert
+    assert get_statements(recovery_mksession) == [("Insert", [{"name": "Rolled back"}])]
+
+
+def test_statements_are_not_logged_if_their_commit_fails(
+    recovery_engine: Engine,
+    deferred_engine: Engine,
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Act
+    with deferred_engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys = ON")
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Child).values(id=1, parent_id=1))
+        with pytest.raises(IntegrityError):
+            conn.commit()
+    with deferred_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Parent).values(id=1))
+        conn.commit()
+
+    # Assert
+    with deferred_engine.connect() as conn:
+        assert conn.execute(select(Child)).all() == []
+    assert get_statements(recovery_mksession) == [("Insert", [{"id": 1}])]
+
+
+def test_failing_to_write_logs_does_not_fail_the_commit(production_engine: Engine) -> None:
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=FailingWriter())
+        conn.execute(insert(Person).values(id=1, name="Committed"))
+        conn.commit()
+
+    # Assert
+    with production_engine.connect() as conn:
+        assert conn.execute(select(Person.name)).scalars().all() == ["Committed"]
@@ -0,0 +1,149 @@
+import datetime as dt
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from pytest import fixture
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.future import Engine
+
+from resql.auditing import log_queries
+from resql.change_log import ChangeLog, OpType
+from resql.compaction import RecordOp, compact_change_logs, replay_query_logs
+from tests.models import Base, Document, Payment, Person
+from tests.utils import now_in_utc
+
+
+@fixture(name="standby_engine")
+def _standby_engine(tmp_path: Path) -> Iterator[Engine]:
+    engine: Engine = create_engine(f"sqlite:///{tmp_path / 'standby.sqlite3'}", future=True)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def get_people(engine: Engine) -> list[tuple[int, str, Optional[int]]]:
+    with engine.connect() as conn:
+        query = select(Person.id, Person.name, Person.age).order_by(Person.id)
+        return [(row.id, row.name, row.age) for row in conn.execute(query)]
+
+
+def get_payments_and_documents(engine: Engine) -> list[tuple[Any, ...]]:
+    with engine.connect() as conn:
+        payments = conn.execute(select(Payment.id, Payment.paid_at, Payment.settlement).order_by(Payment.id))
+        documents = conn.execute(select(Document.id, Document.attachment).order_by(Document.id))
+        return [tuple(row) for row in [*payments, *documents]]
+
+
+def new_change_log(record_id: int, op_type: OpType, **new: Any) -> ChangeLog:
+    return ChangeLog(
+        diff={key: {"old": None, "new": value} for key, value in new.items()},
+        executed_at=now_in_utc(),
+        extra=None,
+        record_id=record_id,
+        table_name="person",
+        type=op_type,
+    )
+
+
+def test_change_logs_are_compacted() -> None:
+    # Arrange
+    logs = [
+        new_change_log(1, OpType.INSERT, name="Inserted", age=1),
+        new_change_log(2, OpType.UPDATE, name="Updated"),
+        new_change_log(3, OpType.INSERT, name="Short-lived"),
+        new_change_log(1, OpType.UPDATE, age=2),
+        new_change_log(4, OpType.UPDATE, age=40),
+        new_change_log(3, OpType.DELETE),
+        new_change_log(2, OpType.UPDATE, age=20),
+        new_change_log(4, OpType.DELETE),
+        new_change_log(5, OpType.DELETE),
+        new_change_log(5, OpType.INSERT, name="Reinserted"),
+        new_change_log(1, OpType.UPDATE, age=3),
+    ]
+
+    # Act
+    compacted = compact_change_logs(logs)
+
+    # Assert
+    assert compacted == [
+        RecordOp("person", 1, OpType.INSERT, {"id": 1, "name": "Inserted", "age": 1}),
+        RecordOp("person", 2, OpType.UPDATE, {"name": "Updated", "age": 20}),
+        RecordOp("person", 4, OpType.DELETE, {}),
+        RecordOp("person", 5, OpType.DELETE, {}),
+        RecordOp("person", 5, OpType.INSERT, {"id": 5, "name": "Reinserted"}),
+        RecordOp("person", 1, OpType.UPDATE, {"age": 3}),
+    ]
+
+
+def test_compacted_updates_come_after_what_they_depend_on() -> None:
+    # Arrange
+    logs = [
+        new_change_log(1, OpType.INSERT, name="First"),
+        new_change_log(2, OpType.UPDATE, age=1),
+        new_change_log(3, OpType.UPDATE, name="Freed"),
+        new_change_log(4, OpType.DELETE),
+        new_change_log(2, OpType.UPDATE, name="Unique"),
+        new_change_log(1, OpType.UPDATE, name="Also unique"),
+    ]
+
+    # Act
+    compacted = compact_change_logs(logs)
+
+    # Assert
+    # e.g. "Unique" was person 3's name and "Also unique" person 4's, so they're only taken once freed
+    assert compacted == [
+        RecordOp("person", 1, OpType.INSERT, {"id": 1, "name": "First"}),
+        RecordOp("person", 3, OpType.UPDATE, {"name": "Freed"}),
+        RecordOp("person", 4, OpType.DELETE, {}),
+        RecordOp("person", 2, OpType.UPDATE, {"age": 1, "name": "Unique"}),
+        RecordOp("person", 1, OpType.UPDATE, {"name": "Also unique"}),
+    ]
+
+
+def test_query_logs_are_compacted_and_replayed(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    standby_engine: Engine,
+) -> None:
+    # Arrange
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Person), [{"id": 1, "name": "Hot", "age": 0}, {"id": 2, "name": "Gone", "age": 0}])
+        for age in range(1, 101):
+            conn.execute(update(Person).where(Person.id == 1).values(age=age))
+        conn.execute(delete(Person).where(Person.id == 2))
+        conn.execute(update(Person).values(age=Person.age + 1))
+        conn.execute(update(Person).where(Person.id == 1).values(name="Renamed"))
+        conn.commit()
+
+    # Act
+    stats = replay_query_logs(source=recovery_engine, target=standby_engine)
+
+    # Assert
+    assert get_people(standby_engine) == get_people(production_engine) == [(1, "Renamed", 101)]
+    assert (stats.logs, stats.statements) == (104, 4)
+
+
+def test_compacted_parameters_are_replayed_as_their_type(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    standby_engine: Engine,
+) -> None:
+    # Arrange
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Payment).values(id=1, paid_at=dt.datetime(2021, 1, 1), settlement=dt.timedelta(days=1)))
+        conn.execute(update(Payment).where(Payment.id == 1).values(paid_at=dt.datetime(2021, 1, 2, 12, 30, 15, 1)))
+        conn.execute(insert(Document).values(id=1, attachment=b"draft"))
+        conn.execute(update(Document).where(Document.id == 1).values(attachment=b"\x00\xff"))
+        conn.commit()
+
+    # Act
+    replay_query_logs(source=recovery_engine, target=standby_engine)
+
+    # Assert
+    assert get_payments_and_documents(standby_engine) == get_payments_and_documents(production_engine)
+    assert get_payments_and_documents(standby_engine) == [
+        (1, dt.datetime(2021, 1, 2, 12, 30, 15, 1), dt.timedelta(days=1)),
+        (1, b"\x00\xff"),
+    ]
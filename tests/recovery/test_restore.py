@@ -0,0 +1,105 @@
+from sqlalchemy import delete, select, update
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_blob import BlobStore
+from resql.restore import restore
+from tests.models import Base, Document, Person
+from tests.utils import now_in_utc
+
+
+def get_people(mksession: sessionmaker) -> dict[int, tuple[str, int]]:  # type: ignore[type-arg]
+    with mksession.begin() as session:
+        return {person.id: (person.name, person.age) for person in session.execute(select(Person)).scalars()}
+
+
+def make_changes(mksession: sessionmaker) -> None:  # type: ignore[type-arg]
+    with mksession.begin() as session:
+        session.add_all([Person(id=1, name="First", age=10), Person(id=2, name="Second", age=20)])
+        session.add_all([Person(id=3, name="Third", age=30), Person(id=4, name="Fourth", age=40)])
+    with mksession.begin() as session:
+        session.execute(select(Person).where(Person.id == 1)).scalar_one().age = 11
+        session.delete(session.execute(select(Person).where(Person.id == 2)).scalar_one())
+        session.add(Person(id=5, name="Fifth", age=50))
+
+
+def test_restore_corrupted_table(
+    audit_engine: Engine,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine)
+    make_changes(production_mksession)
+    expected = get_people(production_mksession)
+    with production_engine.begin() as conn:
+        conn.execute(update(Person).where(Person.id < 4).values(name="Corrupted", age=None))
+        conn.execute(delete(Person).where(Person.id == 5))
+        conn.execute(Person.__table__.insert().values(id=2, name="Resurrected"))
+
+    # Act
+    stats = restore(source=audit_engine, target=production_engine, metadata=Base.metadata, tables=["person"])
+
+    # Assert
+    assert get_people(production_mksession) == expected
+    assert (stats.upserted, stats.deleted, stats.spilled) == (4, 1, False)
+
+
+def test_restore_until_with_spilling(
+    audit_engine: Engine,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine)
+    make_changes(production_mksession)
+    expected = get_people(production_mksession)
+    until = now_in_utc()
+    with production_mksession.begin() as session:
+        session.execute(select(Person).where(Person.id == 3)).scalar_one().name = "Too late"
+
+    # Act
+    stats = restore(
+        source=audit_engine,
+        target=production_engine,
+        metadata=Base.metadata,
+        until=until,
+        max_in_memory=2,
+        chunk_size=2,
+        batch_size=2,
+    )
+
+    # Assert
+    assert get_people(production_mksession) == expected
+    assert (stats.upserted, stats.deleted, stats.spilled) == (4, 0, True)
+
+
+def test_restore_deltas_and_blobs(
+    audit_engine: Engine,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine, delta_threshold=10, blob_store=BlobStore(threshold=10))
+    content = {"items": list(range(20))}
+    with production_mksession.begin() as session:
+        session.add(Document(id=1, attachment=b"\x00" * 20, body="line\n" * 20, content=content))
+    with production_mksession.begin() as session:
+        document = session.execute(select(Document)).scalar_one()
+        document.body = "line\n" * 19 + "last line\n"
+        document.content = {"items": [*range(19), 100]}
+    with production_engine.begin() as conn:
+        conn.execute(delete(Document))
+
+    # Act
+    restore(source=audit_engine, target=production_engine, metadata=Base.metadata, tables=["document"])
+
+    # Assert
+    with production_mksession.begin() as session:
+        document = session.execute(select(Document)).scalar_one()
+        assert (document.attachment, document.body, document.content) == (
+            b"\x00" * 20,
+            "line\n" * 19 + "last line\n",
+            {"items": [*range(19), 100]},
+        )
@@ -0,0 +1,120 @@
+from typing import cast
+
+from sqlalchemy import event, select
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.change_log import OpType
+from resql.log_context import LogContextCache
+from resql.recovery import plan_undo, undo
+from tests.models import Base, Person
+from tests.utils import now_in_utc
+
+
+def get_people(mksession: sessionmaker) -> dict[int, tuple[str, int]]:  # type: ignore[type-arg]
+    with mksession.begin() as session:
+        return {person.id: (person.name, person.age) for person in session.execute(select(Person)).scalars()}
+
+
+def test_undo_time_window(
+    audit_engine: Engine,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine)
+    with production_mksession.begin() as session:
+        first, second = Person(name="First", age=10), Person(name="Second", age=20)
+        session.add_all([first, second])
+    with production_mksession.begin() as session:
+        session.get(Person, first.id).age = 11
+    before = get_people(production_mksession)
+    since = now_in_utc()
+    with production_mksession.begin() as session:
+        session.get(Person, first.id).age = 12
+        session.get(Person, first.id).name = "Renamed"
+    with production_mksession.begin() as session:
+        session.get(Person, first.id).age = 13
+        session.delete(session.get(Person, second.id))
+        third = Person(name="Third", age=30)
+        session.add(third)
+
+    # Act
+    inverse_ops = undo(source=audit_engine, target=production_engine, metadata=Base.metadata, since=since)
+
+    # Assert
+    assert sorted((op.type, op.record_id) for op in inverse_ops) == [
+        (OpType.DELETE, third.id),
+        (OpType.INSERT, second.id),
+        (OpType.UPDATE, first.id),
+    ]
+    assert get_people(production_mksession) == before
+
+
+def test_undo_by_extra_and_records(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    with production_mksession.begin() as session:
+        first, second = Person(name="First", age=10), Person(name="Second", age=20)
+        session.add_all([first, second])
+    bad_deploy: sessionmaker = sessionmaker(production_engine, future=True)  # type: ignore[type-arg]
+    log_changes(of=bad_deploy, to=audit_engine, extra={"deploy": "bad"}, context_cache=LogContextCache())
+    log_changes(of=production_mksession, to=audit_engine, extra={"deploy": "good"})
+    with bad_deploy.begin() as session:  # pylint: disable=no-member
+        session.get(Person, first.id).age = 0
+        session.get(Person, second.id).age = 0
+    with production_mksession.begin() as session:
+        session.add(Person(name="Third", age=30))
+
+    # Act
+    with audit_mksession.begin() as audit_session:
+        everything = plan_undo(audit_session, extra={"deploy": "bad"})
+    undo(
+        source=audit_engine,
+        target=production_engine,
+        metadata=Base.metadata,
+        extra={"deploy": "bad"},
+        records=[("person", cast(int, first.id))],
+    )
+
+    # Assert
+    assert [(op.type, op.record_id, op.values) for op in everything] == [
+        (OpType.UPDATE, first.id, {"age": 10}),
+        (OpType.UPDATE, second.id, {"age": 20}),
+    ]
+    assert sorted(get_people(production_mksession).values()) == [("First", 10), ("Second", 0), ("Third", 30)]
+
+
+def test_undo_records_in_several_chunks(
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    with production_mksession.begin() as session:
+        people = [Person(name=f"Person {index}", age=index) for index in range(600)]
+        session.add_all(people)
+    log_changes(of=production_mksession, to=audit_engine)
+    with production_mksession.begin() as session:
+        for person in people:
+            session.get(Person, person.id).age += 1000
+    records = [("person", cast(int, person.id)) for person in reversed(people[::2])]
+
+    statements: list[str] = []
+    event.listen(audit_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    # Act
+    with audit_mksession.begin() as audit_session:
+        inverse_ops = plan_undo(audit_session, records=[*records, ("person", 10_000), ("pet", cast(int, people[1].id))])
+
+    # Assert
+    assert [(op.record_id, op.values) for op in inverse_ops] == [
+        (person.id, {"age": person.age}) for person in people[::2]
+    ]
+    # 302 records, at most 250 per query
+    assert sum("(change_log.table_name, change_log.record_id) IN" in statement for statement in statements) == 2
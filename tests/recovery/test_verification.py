@@ -0,0 +1,46 @@
+from sqlalchemy import delete, insert, update
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes
+from resql.verification import verify
+from tests.models import Base, Person
+
+
+def test_only_mismatched_ranges_are_drilled_into(
+    audit_engine: Engine,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+) -> None:
+    # Arrange
+    log_changes(of=production_mksession, to=audit_engine)
+    with production_mksession.begin() as session:
+        session.add_all(
+            [Person(id=person_id, name=f"Person {person_id}", age=person_id) for person_id in range(1, 501)]
+        )
+    with production_mksession.begin() as session:
+        session.get(Person, 7).age = 70
+        session.delete(session.get(Person, 8))
+    consistent = verify(source=audit_engine, target=production_engine, metadata=Base.metadata, tables=["person"])
+    with production_engine.begin() as conn:
+        conn.execute(update(Person).where(Person.id == 42).values(name="Corrupted"))
+        conn.execute(delete(Person).where(Person.id == 314))
+        conn.execute(insert(Person).values(id=8, name="Resurrected"))
+
+    # Act
+    verification = verify(
+        source=audit_engine,
+        target=production_engine,
+        metadata=Base.metadata,
+        tables=["person"],
+        range_size=100,
+        fanout=4,
+        leaf_size=10,
+    )["person"]
+
+    # Assert
+    assert consistent["person"].matches
+    assert not verification.matches
+    assert verification.mismatched_ids == [8, 42, 314]
+    # 5 ranges of 100 ids, 2 of which differ and are split in 4, 3 of which differ and are compared in 4 parts
+    assert verification.ranges == 5 + 2 * 4 + 3 * 4
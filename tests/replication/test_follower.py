@@ -0,0 +1,194 @@
+import datetime as dt
+import time
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from pytest import fixture
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_queries
+from resql.query_log import QueryLog
+from resql.replication import QueryLogFollower
+from tests.models import Base, Document, Payment, Person
+from tests.utils import now_in_utc
+
+
+@fixture(name="standby_engine")
+def _standby_engine(tmp_path: Path) -> Iterator[Engine]:
+    engine: Engine = create_engine(f"sqlite:///{tmp_path / 'standby.sqlite3'}", future=True)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def get_people(engine: Engine) -> list[tuple[int, str, Optional[int]]]:
+    with engine.connect() as conn:
+        return [
+            (row.id, row.name, row.age)
+            for row in conn.execute(select(Person.id, Person.name, Person.age).order_by(Person.id))
+        ]
+
+
+def get_payments_and_documents(engine: Engine) -> list[tuple[Any, ...]]:
+    with engine.connect() as conn:
+        payments = conn.execute(select(Payment.id, Payment.paid_at, Payment.settlement).order_by(Payment.id))
+        documents = conn.execute(select(Document.id, Document.attachment).order_by(Document.id))
+        return [tuple(row) for row in [*payments, *documents]]
+
+
+def new_query_log(log_id: int, name: str) -> QueryLog:
+    log = QueryLog(
+        dialect_description="sqlite+pysqlite",
+        executed_at=now_in_utc(),
+        extra=None,
+        parameters=[{"id": log_id, "name": name}],
+        statement="INSERT INTO person (id, name) VALUES (?, ?)",
+        type="Insert",
+    )
+    log.id = log_id
+    return log
+
+
+def test_statements_are_applied_and_the_position_is_kept(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    standby_engine: Engine,
+) -> None:
+    # Arrange
+    follower = QueryLogFollower(source=recovery_engine, target=standby_engine, batch_size=2)
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Person), [{"id": 1, "name": "A", "age": 1}, {"id": 2, "name": "B", "age": 2}])
+        conn.execute(insert(Person).values(id=3, name="C", age=3))
+        conn.commit()
+        conn.execute(update(Person).where(Person.age > 1).values(age=Person.age + 10))
+        conn.execute(delete(Person).where(Person.id.in_([1, 3])))
+        conn.execute(select(Person))
+        conn.commit()
+
+    # Act
+    applied = [follower.poll() for _ in range(3)]
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(update(Person).values(name="Renamed"))
+        conn.commit()
+    restarted = QueryLogFollower(source=recovery_engine, target=standby_engine)
+    lagging = restarted.status()
+    restarted.poll()
+
+    # Assert
+    assert applied == [2, 2, 0]
+    assert get_people(standby_engine) == get_people(production_engine) == [(2, "Renamed", 12)]
+    assert lagging.last_id == 4
+    assert lagging.lag > dt.timedelta(0)
+    assert restarted.status().lag == dt.timedelta(0)
+
+
+def test_missing_ids_are_waited_for(
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+    standby_engine: Engine,
+) -> None:
+    # Arrange
+    with recovery_mksession.begin() as session:
+        session.add_all([new_query_log(1, "A"), new_query_log(3, "C")])
+    follower = QueryLogFollower(source=recovery_mksession.kw["bind"], target=standby_engine, gap_timeout=60)
+
+    # Act
+    waiting = follower.poll()
+    with recovery_mksession.begin() as session:
+        session.add(new_query_log(2, "B"))
+    filled = follower.poll()
+    with recovery_mksession.begin() as session:
+        session.add(new_query_log(5, "E"))
+    follower.gap_timeout = 0
+    skipped = follower.poll()
+
+    # Assert
+    assert (waiting, filled, skipped) == (1, 2, 1)
+    assert [name for _, name, _ in get_people(standby_engine)] == ["A", "B", "C", "E"]
+
+
+def test_logs_that_show_up_late_are_applied_once(
+    recovery_mksession: sessionmaker,  # type: ignore[type-arg]
+    standby_engine: Engine,
+) -> None:
+    # Arrange
+    with recovery_mksession.begin() as session:
+        session.add_all([new_query_log(10, "A"), new_query_log(30, "C")])
+    follower = QueryLogFollower(source=recovery_mksession.kw["bind"], target=standby_engine, gap_timeout=None)
+
+    # Act
+    first = follower.poll()
+    # e.g. the logs of a transaction that executed before the last one, but committed after it
+    with recovery_mksession.begin() as session:
+        session.add(new_query_log(20, "B"))
+    restarted = QueryLogFollower(source=recovery_mksession.kw["bind"], target=standby_engine, gap_timeout=None)
+    late = restarted.poll()
+    again = restarted.poll()
+    restarted.settle_time = 0
+    settled = restarted.poll()
+    with recovery_mksession.begin() as session:
+        session.add(new_query_log(15, "Too late"))
+    after_settling = restarted.poll()
+
+    # Assert
+    assert (first, late, again, settled, after_settling) == (2, 1, 0, 0, 0)
+    assert [name for _, name, _ in get_people(standby_engine)] == ["A", "B", "C"]
+    assert restarted.last_id == 30
+
+
+def test_following_in_the_background(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    standby_engine: Engine,
+) -> None:
+    # Arrange
+    follower = QueryLogFollower(source=recovery_engine, target=standby_engine, min_interval=0.01)
+    follower.start()
+
+    # Act
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(insert(Person).values(id=1, name="A"))
+        conn.commit()
+    deadline = time.monotonic() + 5
+    while follower.last_id < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    follower.close()
+
+    # Assert
+    assert get_people(standby_engine) == [(1, "A", None)]
+
+
+def test_parameters_converted_to_be_logged_are_applied_as_their_type(
+    recovery_engine: Engine,
+    production_engine: Engine,
+    standby_engine: Engine,
+) -> None:
+    # Arrange
+    follower = QueryLogFollower(source=recovery_engine, target=standby_engine)
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=recovery_engine)
+        conn.execute(
+            insert(Payment),
+            [
+                {"id": 1, "paid_at": dt.datetime(2021, 1, 1, 12, 30, 15, 123456), "settlement": dt.timedelta(days=1)},
+                {"id": 2, "paid_at": None, "settlement": None},
+            ],
+        )
+        conn.execute(update(Payment).where(Payment.id == 2).values(settlement=dt.timedelta(seconds=90)))
+        conn.execute(insert(Document).values(id=1, attachment=b"\x00\xff"))
+        conn.commit()
+
+    # Act
+    follower.poll()
+
+    # Assert
+    assert get_payments_and_documents(standby_engine) == get_payments_and_documents(production_engine)
+    assert get_payments_and_documents(standby_engine) == [
+        (1, dt.datetime(2021, 1, 1, 12, 30, 15, 123456), dt.timedelta(days=1)),
+        (2, None, dt.timedelta(seconds=90)),
+        (1, b"\x00\xff"),
+    ]
@@ -0,0 +1,127 @@
+import datetime as dt
+from pathlib import Path
+
+from sqlalchemy import select, update
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import sessionmaker
+
+from resql.auditing import log_changes, log_queries
+from resql.change_log import ChangeLog, OpType
+from resql.segments import SegmentReader, SegmentWriter, list_segments, replay
+from tests.models import Person
+from tests.utils import Registries
+
+START = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+
+
+def new_change_log(minutes: int) -> ChangeLog:
+    return ChangeLog(
+        diff={"age": {"old": None, "new": minutes}},
+        executed_at=START + dt.timedelta(minutes=minutes),
+        extra=None,
+        record_id=minutes,
+        table_name="person",
+        type=OpType.INSERT,
+    )
+
+
+def test_loggers_write_to_segments(
+    tmp_path: Path,
+    production_engine: Engine,
+    production_mksession: sessionmaker,  # type: ignore[type-arg]
+    registries: Registries,  # pylint: disable=unused-argument
+) -> None:
+    # Arrange
+    writer = SegmentWriter(tmp_path)
+    log_changes(of=production_mksession, to=writer, extra={"source": "segments"})
+
+    # Act
+    with production_mksession.begin() as session:
+        person = Person(name="Someone", age=20)
+        session.add(person)
+    with production_mksession.begin() as session:
+        session.get(Person, person.id).age = 21
+    with production_engine.connect() as conn:
+        log_queries(of=conn, to=writer)
+        conn.execute(update(Person).values(age=22))
+        conn.commit()
+    writer.close()
+
+    # Assert
+    records = list(SegmentReader(tmp_path).read())
+    assert [(record.id, record.table_name) for record in records] == [(1, "change_log"), (2, "change_log")] + [
+        (3, "query_log")
+    ]
+    assert records[1].values["diff"] == {"age": {"old": 20, "new": 21}}
+    assert records[1].values["extra"] == {"source": "segments"}
+    assert records[2].values["statement"].startswith("UPDATE person")
+    assert [record.id for record in SegmentReader(tmp_path).read(table_name="change_log")] == [1, 2]
+
+
+def test_segments_rotate_and_are_searched_through_the_index(
+    tmp_path: Path,
+    registries: Registries,  # pylint: disable=unused-argument
+) -> None:
+    # Arrange
+    writer = SegmentWriter(tmp_path, max_segment_bytes=1000, index_interval=2, fsync_interval=0)
+
+    # Act
+    for minutes in range(50):
+        writer.write([new_change_log(minutes)])
+    writer.close()
+
+    # Assert
+    reader = SegmentReader(tmp_path)
+    assert len(list_segments(tmp_path)) > 2
+    assert [record.id for record in reader.read()] == list(range(1, 51))
+    assert [record.id for record in reader.read(since_id=30)] == list(range(30, 51))
+    since, until = START + dt.timedelta(minutes=10), START + dt.timedelta(minutes=20)
+    assert [record.values["record_id"] for record in reader.read(since=since, until=until)] == list(range(10, 20))
+
+
+def test_torn_writes_are_ignored_and_ids_continue(
+    tmp_path: Path,
+    registries: Registries,  # pylint: disable=unused-argument
+) -> None:
+    # Arrange
+    writer = SegmentWriter(tmp_path)
+    writer.write([new_change_log(minutes) for minutes in range(3)])
+    writer.close()
+    with open(list_segments(tmp_path)[-1], "ab") as segment:
+        segment.write(b"\x10\x00\x00\x00torn")
+
+    # Act
+    writer = SegmentWriter(tmp_path)
+    writer.write([new_change_log(3)])
+    writer.close()
+
+    # Assert
+    assert [record.id for record in SegmentReader(tmp_path).read()] == [1, 2, 3, 4]
+
+
+def test_replay_into_a_database(
+    tmp_path: Path,
+    audit_engine: Engine,
+    audit_mksession: sessionmaker,  # type: ignore[type-arg]
+    registries: Registries,
+) -> None:
+    # Arrange
+    writer = SegmentWriter(tmp_path)
+    writer.write([new_change_log(minutes) for minutes in range(5)])
+    writer.close()
+
+    # Act
+    first = replay(SegmentReader(tmp_path), audit_engine, registries.audit.metadata, batch_size=2)
+    writer = SegmentWriter(tmp_path)
+    writer.write([new_change_log(5)])
+    writer.close()
+    resumed = replay(SegmentReader(tmp_path), audit_engine, registries.audit.metadata, since_id=6)
+
+    # Assert
+    assert (first, resumed) == (5, 1)
+    with audit_mksession.begin() as session:
+        change_logs = session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+        assert [(log.id, log.record_id, log.type, log.executed_at) for log in change_logs] == [
+            (minutes + 1, minutes, OpType.INSERT, START + dt.timedelta(minutes=minutes)) for minutes in range(6)
+        ]
+        assert change_logs[0].diff == {"age": {"old": None, "new": 0}}
@@ -0,0 +1,98 @@
+from pathlib import Path
+from typing import Iterator
+
+from pytest import fixture
+from sqlalchemy import create_engine, delete, insert, select, update
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.future import Engine
+from sqlalchemy.orm import Session
+
+from resql.change_log import ChangeLog, OpType
+from resql.encoding import dumps, loads
+from resql.triggers import drop_triggers, get_trigger_ddl, install_triggers
+from tests.models import Account, Base, Document, Person
+from tests.utils import Registries
+
+
+@fixture(name="engine")
+def _engine(tmp_path: Path, registries: Registries) -> Iterator[Engine]:
+    # triggers write to the change log of the database they're in
+    engine: Engine = create_engine(
+        f"sqlite+pysqlite:///{tmp_path}/triggers.sqlite3",
+        future=True,
+        json_deserializer=loads,
+        json_serializer=dumps,
+    )
+    Base.metadata.create_all(engine)
+    registries.audit.metadata.create_all(engine)
+    install_triggers(engine, Base.metadata.sorted_tables, extra={"source": "trigger"})
+    yield engine
+    engine.dispose()
+
+
+def get_change_logs(engine: Engine) -> list[ChangeLog]:
+    with Session(engine, future=True) as session:
+        return session.execute(select(ChangeLog).order_by(ChangeLog.id)).scalars().all()
+
+
+def test_core_and_raw_writes_are_logged(engine: Engine) -> None:
+    # Act
+    with engine.begin() as conn:
+        conn.execute(insert(Person).values(id=1, name="Someone", age=20))
+        conn.execute(update(Person).where(Person.id == 1).values(age=21))
+        conn.execute(update(Person).where(Person.id == 1).values(age=21))
+        conn.exec_driver_sql("UPDATE person SET name = 'Someone Else', age = NULL WHERE id = 1")
+        conn.execute(delete(Person).where(Person.id == 1))
+
+    # Assert
+    change_logs = get_change_logs(engine)
+    assert [(log.type, log.record_id, log.table_name, log.diff) for log in change_logs] == [
+        (OpType.INSERT, 1, "person", {"age": {"old": None, "new": 20}, "name": {"old": None, "new": "Someone"}}),
+        (OpType.UPDATE, 1, "person", {"age": {"old": 20, "new": 21}}),
+        (
+            OpType.UPDATE,
+            1,
+            "person",
+            {"age": {"old": 21, "new": None}, "name": {"old": "Someone", "new": "Someone Else"}},
+        ),
+        (OpType.DELETE, 1, "person", {}),
+    ]
+    assert all(log.extra == {"source": "trigger"} and log.executed_at is not None for log in change_logs)
+
+
+def test_json_excluded_and_binary_columns(engine: Engine) -> None:
+    # Act
+    with Session(engine, future=True) as session, session.begin():
+        session.add_all([Account(id=1, name="Someone", login_count=1), Document(id=1, attachment=b"\x00")])
+    with Session(engine, future=True) as session, session.begin():
+        account, document = session.get(Account, 1), session.get(Document, 1)
+        assert account and document
+        account.login_count = 2
+        document.content = {"title": "Report", "tags": ["a"]}
+
+    # Assert
+    assert [(log.table_name, log.type, log.diff) for log in get_change_logs(engine)] == [
+        ("account", OpType.INSERT, {"name": {"old": None, "new": "Someone"}}),
+        ("document", OpType.INSERT, {}),
+        ("document", OpType.UPDATE, {"content": {"old": None, "new": {"title": "Report", "tags": ["a"]}}}),
+    ]
+
+
+def test_dropped_triggers_stop_logging(engine: Engine) -> None:
+    # Act
+    drop_triggers(engine, Base.metadata.sorted_tables)
+    with engine.begin() as conn:
+        conn.execute(insert(Person).values(name="Someone"))
+
+    # Assert
+    assert not get_change_logs(engine)
+
+
+def test_postgresql_ddl() -> None:
+    # Act
+    statements = get_trigger_ddl(Person.__table__, PGDialect())
+
+    # Assert
+    assert len(statements) == 2
+    assert "WHERE after.key IN ('age', 'name')" in statements[0]
+    assert statements[1].startswith("CREATE TRIGGER resql_person AFTER INSERT OR UPDATE OR DELETE ON person")